@@ -0,0 +1,135 @@
+import io
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+import pandas as pd
+from PIL import Image
+
+# Scores below these limits mark a scan as hopeless for OCR or the vision model
+DEFAULT_THRESHOLDS = {
+    "blur": 60.0,          # Laplacian variance at the reduced scoring resolution
+    "contrast": 12.0,      # standard deviation of gray levels
+    "min_side": 150,       # pixels, original resolution
+    "min_text_density": 0.003,
+}
+
+
+def decode_reduced(image_bytes, max_side=1024):
+    """
+    Decode an image once, at reduced resolution where the codec supports it.
+
+    Returns:
+    numpy.ndarray: Grayscale image no larger than ``max_side``
+    tuple: Original (width, height)
+    tuple or None: DPI recorded in the file metadata
+    """
+    img = Image.open(io.BytesIO(image_bytes))
+    original_size = img.size
+    dpi = img.info.get("dpi")
+    # JPEG draft mode decodes directly at 1/2, 1/4 or 1/8 scale
+    img.draft("L", (max_side, max_side))
+    img = img.convert("L")
+    if max(img.size) > max_side:
+        img.thumbnail((max_side, max_side))
+    return np.asarray(img), original_size, dpi
+
+
+def estimate_skew(text_mask):
+    coords = np.column_stack(np.nonzero(text_mask))
+    if len(coords) < 50:
+        return 0.0
+    angle = cv2.minAreaRect(coords[:, ::-1].astype(np.float32))[-1]
+    # OpenCV versions disagree on the angle range; fold it into [-45, 45)
+    return float((angle + 45) % 90 - 45)
+
+
+def estimate_dpi(text_mask, scale, metadata_dpi):
+    if metadata_dpi and metadata_dpi[0] and metadata_dpi[0] > 1:
+        return float(metadata_dpi[0])
+    # Text lines are roughly 1/6 inch apart: find the dominant period of the row profile
+    profile = text_mask.mean(axis=1)
+    profile = profile - profile.mean()
+    if not profile.any():
+        return None
+    spectrum = np.abs(np.fft.rfft(profile))
+    frequencies = np.fft.rfftfreq(len(profile))
+    valid = frequencies > 1 / 200
+    if not valid.any():
+        return None
+    period = 1 / frequencies[valid][np.argmax(spectrum[valid])]
+    return float(period * scale * 6)
+
+
+def score_image_bytes(image_bytes, max_side=1024):
+    gray, (width, height), metadata_dpi = decode_reduced(image_bytes, max_side)
+    scale = width / gray.shape[1]
+
+    _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    text_mask = binary > 0
+    # Text is the minority class, also on light-on-dark scans
+    if text_mask.mean() > 0.5:
+        text_mask = ~text_mask
+
+    return {
+        "width": width,
+        "height": height,
+        "blur": float(cv2.Laplacian(gray, cv2.CV_64F).var()),
+        "contrast": float(gray.std()),
+        "skew_angle": estimate_skew(text_mask),
+        "text_density": float(text_mask.mean()),
+        "dpi_estimate": estimate_dpi(text_mask, scale, metadata_dpi),
+    }
+
+
+def score_image(image_path, max_side=1024):
+    try:
+        with open(image_path, "rb") as image_file:
+            scores = score_image_bytes(image_file.read(), max_side)
+        scores["error"] = None
+    except Exception as e:
+        scores = {"error": str(e)}
+    scores["path"] = image_path
+    return scores
+
+
+def rejection_reason(scores, thresholds=DEFAULT_THRESHOLDS):
+    """Return why a scan should be rejected, or None when it is worth processing."""
+    if scores.get("error"):
+        return f"unreadable image ({scores['error']})"
+    if min(scores["width"], scores["height"]) < thresholds["min_side"]:
+        return f"resolution too low ({scores['width']}x{scores['height']})"
+    if scores["blur"] < thresholds["blur"]:
+        return f"too blurry (sharpness {scores['blur']:.0f})"
+    if scores["contrast"] < thresholds["contrast"]:
+        return f"contrast too low ({scores['contrast']:.0f})"
+    if scores["text_density"] < thresholds["min_text_density"]:
+        return f"no readable text detected (text density {scores['text_density']:.3f})"
+    return None
+
+
+def score_batch(image_paths, workers=None, scores_path=None, thresholds=DEFAULT_THRESHOLDS):
+    """
+    Score many images across a process pool.
+
+    Returns:
+    pandas.DataFrame: One row per image with every metric, ``rejection_reason`` and ``passed``
+    """
+    workers = workers or os.cpu_count() or 1
+    if len(image_paths) > 1 and workers > 1:
+        # Spawned workers are safe to start from inside the Streamlit server process
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+            rows = list(executor.map(score_image, image_paths, chunksize=8))
+    else:
+        rows = [score_image(path) for path in image_paths]
+
+    scores = pd.DataFrame(rows)
+    if scores.empty:
+        return scores
+    scores["rejection_reason"] = [rejection_reason(row, thresholds) for row in rows]
+    scores["passed"] = scores["rejection_reason"].isna()
+    if scores_path:
+        scores.to_csv(scores_path, index=False)
+    return scores
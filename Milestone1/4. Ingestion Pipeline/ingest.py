@@ -0,0 +1,396 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from image_quality import score_batch
+from phash_index import PerceptualIndex, file_hash
+
+SEARCH_TERMS = {
+    "salary_slips": "salary slip document",
+    "bank_statements": "bank statement document",
+    "cheques": "cheques document",
+    "profit_loss_statements": "profit and loss statements",
+    "transaction_history": "transaction history document",
+}
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.gif')
+
+
+def create_requests_session(retries=3, backoff_factor=0.3, status_forcelist=(500, 502, 504), pool_size=16):
+    session = requests.Session()
+    retry = Retry(
+        total=retries,
+        read=retries,
+        connect=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=status_forcelist,
+    )
+    adapter = HTTPAdapter(max_retries=retry, pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def file_sha256(path):
+    with open(path, "rb") as image_file:
+        return hashlib.sha256(image_file.read()).hexdigest()
+
+
+# Image sources -----------------------------------------------------------------
+
+class BingImageSource:
+    """Downloads candidate images for each category with bing_image_downloader."""
+
+    def __init__(self, search_terms=SEARCH_TERMS, limit=150, timeout=60):
+        self.search_terms = search_terms
+        self.limit = limit
+        self.timeout = timeout
+
+    def categories(self):
+        return list(self.search_terms)
+
+    def fetch(self, category, work_dir):
+        from bing_image_downloader import downloader
+
+        term = self.search_terms[category]
+        downloader.download(term, limit=self.limit, output_dir=work_dir, adult_filter_off=True,
+                            force_replace=False, timeout=self.timeout, verbose=False)
+        term_dir = os.path.join(work_dir, term)
+        if not os.path.isdir(term_dir):
+            return []
+        return sorted(os.path.join(term_dir, name) for name in os.listdir(term_dir)
+                      if name.lower().endswith(IMAGE_EXTENSIONS))
+
+
+class LocalDirectorySource:
+    """Stand-in image source reading ``<root>/<category>/*`` (e.g. an existing financial_data folder)."""
+
+    def __init__(self, root):
+        self.root = root
+
+    def categories(self):
+        return sorted(name for name in os.listdir(self.root) if os.path.isdir(os.path.join(self.root, name)))
+
+    def fetch(self, category, work_dir):
+        category_dir = os.path.join(self.root, category)
+        return sorted(os.path.join(category_dir, name) for name in os.listdir(category_dir)
+                      if name.lower().endswith(IMAGE_EXTENSIONS))
+
+
+# Upload targets ------------------------------------------------------------------
+
+class CloudinaryStore:
+    """Uploads to and lists ``<folder>/<category>`` on Cloudinary."""
+
+    def __init__(self, folder="financial_data"):
+        import cloudinary
+
+        load_dotenv()
+        cloudinary.config(
+            cloud_name=os.getenv('CLOUDINARY_CLOUD_NAME'),
+            api_key=os.getenv('CLOUDINARY_API_KEY'),
+            api_secret=os.getenv('CLOUDINARY_API_SECRET')
+        )
+        self.folder = folder
+
+    def upload(self, image_path, category):
+        import cloudinary.uploader
+
+        public_id = os.path.splitext(os.path.basename(image_path))[0]
+        result = cloudinary.uploader.upload(image_path, folder=f"{self.folder}/{category}", public_id=public_id,
+                                            overwrite=False)
+        return result['secure_url']
+
+    def list(self):
+        import cloudinary.api
+
+        resources, cursor = [], None
+        while True:
+            page = cloudinary.api.resources(type="upload", prefix=self.folder, max_results=500, next_cursor=cursor)
+            resources.extend((resource['public_id'].replace(f"{self.folder}/", "", 1), resource['secure_url'])
+                             for resource in page.get('resources', []))
+            cursor = page.get('next_cursor')
+            if not cursor:
+                return resources
+
+
+class LocalDirectoryStore:
+    """Stand-in for Cloudinary that stores uploads under a local directory."""
+
+    def __init__(self, root):
+        self.root = root
+
+    def upload(self, image_path, category):
+        destination = os.path.join(self.root, category, os.path.basename(image_path))
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        shutil.copyfile(image_path, destination)
+        return destination
+
+    def list(self):
+        resources = []
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                public_id = os.path.splitext(os.path.relpath(path, self.root))[0].replace(os.sep, "/")
+                resources.append((public_id, path))
+        return resources
+
+
+# Manifest -------------------------------------------------------------------------
+
+class Manifest:
+    """
+    Append-only JSON Lines log of every item and the stages it has completed.
+
+    Replaying the log on start-up lets an interrupted run skip work that already finished.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.items = {}
+        self.lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as manifest_file:
+                for line in manifest_file:
+                    if line.strip():
+                        record = json.loads(line)
+                        self.items.setdefault(record.pop("key"), {}).update(record)
+
+    def get(self, key):
+        return self.items.get(key, {})
+
+    def update(self, key, **fields):
+        with self.lock:
+            self.items.setdefault(key, {}).update(fields)
+            with open(self.path, "a", encoding="utf-8") as manifest_file:
+                manifest_file.write(json.dumps({"key": key, **fields}) + "\n")
+
+    def where(self, **fields):
+        return {key: item for key, item in self.items.items()
+                if all(item.get(name) == value for name, value in fields.items())}
+
+
+class StageTimer:
+    """Collects item counts and wall-clock time per pipeline stage."""
+
+    def __init__(self):
+        self.stages = {}
+
+    def record(self, name, items, seconds):
+        self.stages[name] = {"items": items, "seconds": seconds, "items_per_second": items / seconds if seconds else 0.0}
+
+    def run(self, name, function, items, workers):
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(function, items))
+        self.record(name, len(items), time.perf_counter() - start)
+        return results
+
+    def report(self):
+        lines = ["Stage        Items   Seconds   Items/s"]
+        for name, stats in self.stages.items():
+            lines.append(f"{name:<12} {stats['items']:>5}   {stats['seconds']:>7.2f}   {stats['items_per_second']:>7.2f}")
+        return "\n".join(lines)
+
+
+# Pipeline ---------------------------------------------------------------------------
+
+class IngestionPipeline:
+    """
+    Download, quality-filter, dedupe and upload the financial_data corpus with bounded worker pools.
+
+    Every stage records its outcome in the manifest, so rerunning the same command
+    resumes where an interrupted run stopped.
+    """
+
+    def __init__(self, source, store, dest_dir, manifest_path, download_workers=5, quality_workers=os.cpu_count() or 4,
+                 upload_workers=8):
+        self.source = source
+        self.store = store
+        self.dest_dir = dest_dir
+        self.manifest = Manifest(manifest_path)
+        self.scores_path = os.path.splitext(manifest_path)[0] + "_quality_scores.csv"
+        self.download_workers = download_workers
+        self.quality_workers = quality_workers
+        self.upload_workers = upload_workers
+        self.timer = StageTimer()
+
+    def download(self, category):
+        if self.manifest.get(f"category:{category}").get("downloaded"):
+            return
+        work_dir = tempfile.mkdtemp(prefix=f"ingest_{category}_")
+        for index, path in enumerate(self.source.fetch(category, work_dir)):
+            key = f"{category}/{os.path.basename(path)}"
+            if not self.manifest.get(key):
+                staged = os.path.join(self.dest_dir, ".staging", category, f"{index}_{os.path.basename(path)}")
+                os.makedirs(os.path.dirname(staged), exist_ok=True)
+                shutil.copyfile(path, staged)
+                self.manifest.update(key, category=category, staged=staged, status="downloaded")
+        self.manifest.update(f"category:{category}", downloaded=True)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    def score(self, keys):
+        """Score every downloaded image in a process pool and append the results to the scores table."""
+        start = time.perf_counter()
+        staged = [self.manifest.get(key)["staged"] for key in keys]
+        scores = score_batch(staged, workers=self.quality_workers)
+        if not scores.empty:
+            scores.insert(0, "key", keys)
+            scores.to_csv(self.scores_path, mode="a", index=False, header=not os.path.exists(self.scores_path))
+            for key, path, reason in zip(keys, staged, scores["rejection_reason"]):
+                status = "passed" if reason is None else "rejected"
+                perceptual_hash = f"{file_hash(path):032x}" if reason is None else None
+                self.manifest.update(key, sha256=file_sha256(path), phash=perceptual_hash, status=status,
+                                     rejection_reason=reason)
+        self.timer.record("quality", len(keys), time.perf_counter() - start)
+
+    def dedupe(self, max_distance=None):
+        """Keep the first of every group of byte-identical or perceptually near-identical images."""
+        seen = {}
+        near = PerceptualIndex() if max_distance is None else PerceptualIndex(max_distance=max_distance)
+        for key, item in self.manifest.items.items():
+            if item.get("status") in ("kept", "uploaded"):
+                seen[item["sha256"]] = key
+                if item.get("phash"):
+                    near.add(int(item["phash"], 16), key)
+
+        counters = {}
+        for key, item in sorted(self.manifest.where(status="passed").items()):
+            twin = seen.get(item["sha256"]) or near.nearest(int(item["phash"], 16))
+            if twin is not None:
+                self.manifest.update(key, status="duplicate", duplicate_of=twin)
+                os.remove(item["staged"])
+                continue
+            seen[item["sha256"]] = key
+            near.add(int(item["phash"], 16), key)
+            category = item["category"]
+            category_dir = os.path.join(self.dest_dir, category)
+            os.makedirs(category_dir, exist_ok=True)
+            counter = counters.get(category, 0) + 1
+            while os.path.exists(os.path.join(category_dir, f"image{counter}.jpg")):
+                counter += 1
+            counters[category] = counter
+            destination = os.path.join(category_dir, f"image{counter}.jpg")
+            shutil.move(item["staged"], destination)
+            self.manifest.update(key, status="kept", path=destination)
+
+        for key, item in self.manifest.where(status="rejected").items():
+            if os.path.exists(item["staged"]):
+                os.remove(item["staged"])
+
+    def upload(self, key):
+        item = self.manifest.get(key)
+        try:
+            url = self.store.upload(item["path"], item["category"])
+            self.manifest.update(key, status="uploaded", url=url)
+        except Exception as e:
+            print(f"Failed to upload {item['path']}: {e}")
+
+    def run(self, categories=None):
+        categories = categories or self.source.categories()
+        self.timer.run("download", self.download, categories, self.download_workers)
+        self.score(list(self.manifest.where(status="downloaded")))
+        start = time.perf_counter()
+        passed = len(self.manifest.where(status="passed"))
+        self.dedupe()
+        self.timer.record("dedupe", passed, time.perf_counter() - start)
+        if self.store is not None:
+            self.timer.run("upload", self.upload, list(self.manifest.where(status="kept")), self.upload_workers)
+        return self.timer
+
+    def summary(self):
+        counts = {}
+        for item in self.manifest.items.values():
+            if "status" in item:
+                counts[item["status"]] = counts.get(item["status"], 0) + 1
+        return counts
+
+
+def pull(store, download_dir, workers=16):
+    """Download every stored image in parallel, skipping files that already exist locally."""
+    session = create_requests_session(pool_size=workers)
+    timer = StageTimer()
+    failed = []
+
+    def fetch(resource):
+        public_id, url = resource
+        download_path = os.path.join(download_dir, f"{public_id}.jpg")
+        if os.path.exists(download_path):
+            return
+        os.makedirs(os.path.dirname(download_path), exist_ok=True)
+        try:
+            if os.path.exists(url):
+                shutil.copyfile(url, download_path)
+                return
+            response = session.get(url, timeout=(10, 30))
+            response.raise_for_status()
+            with open(f"{download_path}.part", "wb") as image_file:
+                image_file.write(response.content)
+            os.replace(f"{download_path}.part", download_path)
+        except (requests.exceptions.RequestException, OSError) as e:
+            print(f"Error downloading {url}: {e}")
+            failed.append(url)
+
+    timer.run("pull", fetch, store.list(), workers)
+    if failed:
+        with open(os.path.join(download_dir, 'failed_downloads.txt'), 'w') as f:
+            f.write("\n".join(failed))
+    return timer
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Acquire, filter, dedupe and upload the financial_data corpus")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    acquire = subparsers.add_parser("acquire", help="download, quality-filter, dedupe and upload images")
+    acquire.add_argument("--source", choices=["bing", "local"], default="bing")
+    acquire.add_argument("--source-dir", help="category folders to read when --source local")
+    acquire.add_argument("--limit", type=int, default=150, help="images per category from Bing")
+    acquire.add_argument("--dest-dir", default="financial_data")
+    acquire.add_argument("--store", choices=["cloudinary", "local", "none"], default="cloudinary")
+    acquire.add_argument("--store-dir", help="upload directory when --store local")
+    acquire.add_argument("--manifest", default="ingest_manifest.jsonl")
+    acquire.add_argument("--categories", nargs="*")
+    acquire.add_argument("--download-workers", type=int, default=5)
+    acquire.add_argument("--quality-workers", type=int, default=os.cpu_count() or 4)
+    acquire.add_argument("--upload-workers", type=int, default=8)
+
+    pull_parser = subparsers.add_parser("pull", help="download the stored corpus back in parallel")
+    pull_parser.add_argument("--store", choices=["cloudinary", "local"], default="cloudinary")
+    pull_parser.add_argument("--store-dir")
+    pull_parser.add_argument("--download-dir", default="downloaded_financial_data")
+    pull_parser.add_argument("--workers", type=int, default=16)
+
+    args = parser.parse_args()
+    if args.store == "cloudinary":
+        store = CloudinaryStore()
+    elif args.store == "local":
+        store = LocalDirectoryStore(args.store_dir)
+    else:
+        store = None
+
+    if args.command == "pull":
+        timer = pull(store, args.download_dir, args.workers)
+    else:
+        source = LocalDirectorySource(args.source_dir) if args.source == "local" else BingImageSource(limit=args.limit)
+        pipeline = IngestionPipeline(source, store, args.dest_dir, args.manifest,
+                                     download_workers=args.download_workers,
+                                     quality_workers=args.quality_workers,
+                                     upload_workers=args.upload_workers)
+        timer = pipeline.run(args.categories)
+        print(f"Items by status: {pipeline.summary()}")
+    print(timer.report())
+
+
+if __name__ == "__main__":
+    main()
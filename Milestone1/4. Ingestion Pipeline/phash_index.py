@@ -0,0 +1,121 @@
+import io
+import json
+import os
+import threading
+
+import cv2
+import numpy as np
+from PIL import Image
+
+# Combined pHash + dHash distance (out of 128 bits) at or below which two images are the same scan
+DEFAULT_MAX_DISTANCE = 6
+
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+def bits_to_int(bits):
+    return int("".join("1" if bit else "0" for bit in bits.ravel()), 2)
+
+
+def image_hash(image_bytes):
+    """
+    128-bit perceptual hash: a 64-bit DCT pHash in the high bits and a 64-bit dHash in the low bits.
+    """
+    img = Image.open(io.BytesIO(image_bytes))
+    img.draft("L", (64, 64))
+    img = img.convert("L")
+    pixels = np.asarray(img.resize((32, 32), Image.Resampling.LANCZOS), dtype=np.float32)
+
+    dct = cv2.dct(pixels)[:8, :8]
+    phash = bits_to_int(dct > np.median(dct.ravel()[1:]))
+
+    small = np.asarray(img.resize((9, 8), Image.Resampling.LANCZOS), dtype=np.int16)
+    dhash = bits_to_int(small[:, 1:] > small[:, :-1])
+    return (phash << 64) | dhash
+
+
+def file_hash(image_path):
+    with open(image_path, "rb") as image_file:
+        return image_hash(image_file.read())
+
+
+class BKTree:
+    """Burkhard-Keller tree over Hamming distance for sub-linear near-neighbour lookups."""
+
+    def __init__(self):
+        self.root = None
+        self.size = 0
+
+    def add(self, key, value):
+        self.size += 1
+        if self.root is None:
+            self.root = [key, [value], {}]
+            return
+        node = self.root
+        while True:
+            distance = hamming(key, node[0])
+            if distance == 0:
+                node[1].append(value)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [key, [value], {}]
+                return
+            node = child
+
+    def search(self, key, max_distance):
+        """All (distance, value) pairs within ``max_distance`` of ``key``, nearest first."""
+        matches = []
+        stack = [self.root] if self.root is not None else []
+        while stack:
+            node = stack.pop()
+            distance = hamming(key, node[0])
+            if distance <= max_distance:
+                matches.extend((distance, value) for value in node[1])
+            # Triangle inequality: only children within the distance band can match
+            for child_distance, child in node[2].items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    stack.append(child)
+        return sorted(matches, key=lambda match: match[0])
+
+
+class PerceptualIndex:
+    """
+    Perceptual-hash index mapping images to a caller-defined value (e.g. their content hash).
+
+    Entries are appended to a JSON Lines file when ``path`` is given, so the index
+    survives restarts.
+    """
+
+    def __init__(self, path=None, max_distance=DEFAULT_MAX_DISTANCE):
+        self.path = path
+        self.max_distance = max_distance
+        self.tree = BKTree()
+        self.lock = threading.Lock()
+        if path and os.path.exists(path):
+            with open(path, encoding="utf-8") as index_file:
+                for line in index_file:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self.tree.add(int(entry["hash"], 16), entry["value"])
+
+    def add(self, perceptual_hash, value):
+        with self.lock:
+            if any(existing == value for _, existing in self.tree.search(perceptual_hash, 0)):
+                return
+            self.tree.add(perceptual_hash, value)
+            if self.path:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                with open(self.path, "a", encoding="utf-8") as index_file:
+                    index_file.write(json.dumps({"hash": f"{perceptual_hash:032x}", "value": value}) + "\n")
+
+    def nearest(self, perceptual_hash, exclude=None):
+        """Closest indexed value within ``max_distance``, ignoring ``exclude``; None when there is no twin."""
+        with self.lock:
+            matches = self.tree.search(perceptual_hash, self.max_distance)
+        for _, value in matches:
+            if value != exclude:
+                return value
+        return None
@@ -0,0 +1,76 @@
+import os
+import random
+import shutil
+
+from PIL import Image, ImageDraw
+
+from ingest import IngestionPipeline, LocalDirectorySource, LocalDirectoryStore
+
+
+def make_scan(path, seed):
+    """A sharp, high-contrast page of random text-like blocks that passes the quality gate."""
+    rng = random.Random(seed)
+    img = Image.new("L", (600, 800), 255)
+    draw = ImageDraw.Draw(img)
+    for y in range(40, 760, 24):
+        x = rng.randint(20, 80)
+        while x < 560:
+            width = rng.randint(10, 60)
+            draw.rectangle([x, y, min(x + width, 580), y + 12], fill=0)
+            x += width + rng.randint(6, 20)
+    img.save(path)
+
+
+class FailingStore(LocalDirectoryStore):
+    def upload(self, image_path, category):
+        raise ConnectionError("store unavailable")
+
+
+class CountingSource(LocalDirectorySource):
+    def __init__(self, root):
+        super().__init__(root)
+        self.fetched = []
+
+    def fetch(self, category, work_dir):
+        self.fetched.append(category)
+        return super().fetch(category, work_dir)
+
+
+def make_corpus(root):
+    category_dir = os.path.join(root, "cheques")
+    os.makedirs(category_dir)
+    make_scan(os.path.join(category_dir, "a.png"), 1)
+    make_scan(os.path.join(category_dir, "b.png"), 2)
+    shutil.copyfile(os.path.join(category_dir, "a.png"), os.path.join(category_dir, "c.png"))
+
+
+def test_duplicates_are_skipped(tmp_path):
+    make_corpus(tmp_path / "source")
+    pipeline = IngestionPipeline(LocalDirectorySource(str(tmp_path / "source")),
+                                 LocalDirectoryStore(str(tmp_path / "store")),
+                                 str(tmp_path / "dest"), str(tmp_path / "manifest.jsonl"), quality_workers=1)
+    pipeline.run()
+
+    assert pipeline.summary() == {"uploaded": 2, "duplicate": 1}
+    assert pipeline.manifest.get("cheques/c.png")["duplicate_of"] == "cheques/a.png"
+    assert sorted(os.listdir(tmp_path / "store" / "cheques")) == ["image1.jpg", "image2.jpg"]
+
+
+def test_rerun_resumes_from_manifest(tmp_path):
+    make_corpus(tmp_path / "source")
+    manifest_path = str(tmp_path / "manifest.jsonl")
+    source = CountingSource(str(tmp_path / "source"))
+
+    # The first run is interrupted at the upload stage
+    IngestionPipeline(source, FailingStore(str(tmp_path / "store")), str(tmp_path / "dest"), manifest_path,
+                      quality_workers=1).run()
+    assert source.fetched == ["cheques"]
+
+    resumed = IngestionPipeline(source, LocalDirectoryStore(str(tmp_path / "store")), str(tmp_path / "dest"),
+                                manifest_path, quality_workers=1)
+    resumed.run()
+
+    # Downloading, scoring and deduplication are not repeated; only the uploads are
+    assert source.fetched == ["cheques"]
+    assert resumed.summary() == {"uploaded": 2, "duplicate": 1}
+    assert len(os.listdir(tmp_path / "store" / "cheques")) == 2
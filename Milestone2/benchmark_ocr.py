@@ -0,0 +1,203 @@
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import re
+import time
+
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+try:
+    from rapidfuzz.distance import Levenshtein
+except ImportError:
+    Levenshtein = None
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Milestone1", "1.  Web Scraping",
+                              "financial_data")
+DEFAULT_LABELS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ocr_labels.jsonl")
+NUMBER = re.compile(r"-?\d[\d,]*(?:\.\d+)?")
+
+# Hyperparameter grid per engine; every combination is benchmarked
+GRIDS = {
+    "tesseract": {"psm": [3, 4, 6, 11], "oem": [1, 3]},
+    "easyocr": {"text_threshold": [0.4, 0.7], "canvas_size": [1280, 2560], "mag_ratio": [1.0, 1.5]},
+    "llama": {},
+}
+
+
+def edit_distance(reference, hypothesis):
+    """Levenshtein distance between two strings or two lists of words."""
+    if Levenshtein is not None:
+        return Levenshtein.distance(reference, hypothesis)
+    previous = list(range(len(hypothesis) + 1))
+    for i, ref_item in enumerate(reference, 1):
+        current = [i]
+        for j, hyp_item in enumerate(hypothesis, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ref_item != hyp_item)))
+        previous = current
+    return previous[-1]
+
+
+def normalize(text):
+    return " ".join(text.split())
+
+
+def numbers(text):
+    return {float(match.replace(",", "")) for match in NUMBER.findall(text) if match.replace(",", "").strip("-")}
+
+
+def score(reference, hypothesis, fields):
+    """
+    Accuracy of one OCR output against its label.
+
+    Returns:
+    dict: Character and word error rates, and the share of labeled numeric fields whose value appears in the output
+    """
+    reference, hypothesis = normalize(reference), normalize(hypothesis)
+    ref_words = reference.split()
+    found = numbers(hypothesis)
+    values = [float(value) for value in fields.values()]
+    return {
+        "cer": edit_distance(reference, hypothesis) / max(len(reference), 1),
+        "wer": edit_distance(ref_words, hypothesis.split()) / max(len(ref_words), 1),
+        "numeric_accuracy": sum(any(abs(value - number) < 0.005 for number in found) for value in values) / len(values)
+        if values else None,
+    }
+
+
+def make_processor(engine, parameters):
+    if engine == "tesseract":
+        import pytesseract
+        from tesseract_processor import TesseractProcessor
+        if os.getenv("TESSERACT_CMD"):
+            pytesseract.pytesseract.tesseract_cmd = os.getenv("TESSERACT_CMD")
+        return TesseractProcessor(**parameters)
+    if engine == "easyocr":
+        from easyocr_processor import EasyOCRProcessor
+        return EasyOCRProcessor(**parameters)
+    from llama_ocr_processor import LlamaOCRProcessor
+    return LlamaOCRProcessor()
+
+
+def ocr_text(processor, image_path):
+    result = processor.perform_ocr(image_path)
+    # Tesseract and EasyOCR return [text, confidence, x, y, w, h] per word, in reading order
+    return result if isinstance(result, str) else " ".join(str(item[0]) for item in result)
+
+
+def run_config(engine, parameters, labels, corpus):
+    """
+    Benchmark one engine configuration; runs in a fresh process so peak RSS belongs to this configuration alone.
+
+    Returns:
+    dict: Pages per second, peak RSS in MB and mean CER, WER and numeric-field accuracy
+    """
+    processor = make_processor(engine, parameters)
+    scores = []
+    start = time.perf_counter()
+    for label in labels:
+        text = ocr_text(processor, os.path.join(corpus, label["image"]))
+        scores.append(score(label["text"], text, label.get("fields", {})))
+    elapsed = time.perf_counter() - start
+    # ru_maxrss is in kilobytes on Linux
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 if resource is not None else None
+    scores = pd.DataFrame(scores)
+    return {
+        "engine": engine,
+        "parameters": json.dumps(parameters, sort_keys=True),
+        "pages_per_sec": len(labels) / elapsed,
+        "peak_rss_mb": peak_rss,
+        "cer": scores["cer"].mean(),
+        "wer": scores["wer"].mean(),
+        "numeric_accuracy": scores["numeric_accuracy"].mean(),
+    }
+
+
+def configurations(engines):
+    for engine in engines:
+        grid = GRIDS[engine]
+        for values in itertools.product(*grid.values()):
+            yield engine, dict(zip(grid.keys(), values))
+
+
+def pareto_front(results, maximize=("pages_per_sec", "numeric_accuracy"), minimize=("cer",)):
+    """Flag configurations no other configuration beats on every objective."""
+    values = results[list(maximize)].fillna(0).to_numpy()
+    costs = results[list(minimize)].fillna(float("inf")).to_numpy()
+    optimal = []
+    for i in range(len(results)):
+        dominated = ((values >= values[i]).all(axis=1) & (costs <= costs[i]).all(axis=1)
+                     & ((values > values[i]).any(axis=1) | (costs < costs[i]).any(axis=1)))
+        optimal.append(not dominated.any())
+    return results.assign(pareto=optimal)
+
+
+def run_benchmark(labels, corpus, engines):
+    context = multiprocessing.get_context("spawn")
+    rows = []
+    for engine, parameters in configurations(engines):
+        with context.Pool(1) as pool:
+            try:
+                rows.append(pool.apply(run_config, (engine, parameters, labels, corpus)))
+            except Exception as e:
+                print(f"{engine} {parameters} failed: {e}")
+                continue
+        print(f"{engine} {parameters}: {rows[-1]['pages_per_sec']:.2f} pages/s, CER {rows[-1]['cer']:.3f}")
+    return pareto_front(pd.DataFrame(rows)) if rows else pd.DataFrame()
+
+
+def bootstrap_labels(corpus, labels_path, limit):
+    """
+    Draft labels from LlamaOCR output for an evenly spread sample of the corpus.
+
+    The drafts must be reviewed and corrected by hand, and numeric ``fields`` filled in, before benchmarking.
+    """
+    from llama_ocr_processor import LlamaOCRProcessor
+    processor = LlamaOCRProcessor()
+    folders = sorted(entry for entry in os.listdir(corpus) if os.path.isdir(os.path.join(corpus, entry)))
+    per_folder = max(limit // max(len(folders), 1), 1)
+    with open(labels_path, "w", encoding="utf-8") as labels_file:
+        for folder in folders:
+            images = sorted(os.listdir(os.path.join(corpus, folder)))
+            for image in images[::max(len(images) // per_folder, 1)][:per_folder]:
+                image_path = os.path.join(folder, image)
+                text = processor.perform_ocr(os.path.join(corpus, image_path))
+                labels_file.write(json.dumps({"image": image_path, "text": text, "fields": {}}) + "\n")
+    print(f"Wrote draft labels to {labels_path}; correct them before benchmarking")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark OCR engine accuracy and speed on labeled corpus pages")
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS)
+    parser.add_argument("--labels", default=DEFAULT_LABELS,
+                        help='JSONL lines of {"image": path relative to corpus, "text": ..., "fields": {name: value}}')
+    parser.add_argument("--engines", default="tesseract,easyocr", help="Comma-separated: tesseract, easyocr, llama")
+    parser.add_argument("--limit", type=int, default=None, help="Labeled pages to use")
+    parser.add_argument("--bootstrap-labels", type=int, default=None, metavar="N",
+                        help="Draft labels for N pages with LlamaOCR instead of benchmarking")
+    parser.add_argument("--output", default=None, help="Optional CSV with every configuration")
+    args = parser.parse_args()
+
+    if args.bootstrap_labels:
+        bootstrap_labels(args.corpus, args.labels, args.bootstrap_labels)
+        return
+
+    with open(args.labels, encoding="utf-8") as labels_file:
+        labels = [json.loads(line) for line in labels_file if line.strip()][:args.limit]
+    results = run_benchmark(labels, args.corpus, [engine.strip() for engine in args.engines.split(",")])
+    if results.empty:
+        print("No configuration completed")
+        return
+    if args.output:
+        results.to_csv(args.output, index=False)
+    print(results.sort_values(["pareto", "pages_per_sec"], ascending=False).round(3).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
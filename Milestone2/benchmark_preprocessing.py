@@ -0,0 +1,92 @@
+import argparse
+import base64
+import glob
+import os
+import time
+
+import pandas as pd
+
+from preprocessing import ImagePreprocessor
+
+try:
+    from tesseract_processor import TesseractProcessor
+except ImportError:
+    TesseractProcessor = None
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Milestone1", "1.  Web Scraping",
+                              "financial_data")
+
+
+def payload_size(image_path):
+    # The vision model receives the image base64-encoded inside the request body
+    with open(image_path, "rb") as image_file:
+        return len(base64.b64encode(image_file.read()))
+
+
+def time_ocr(processor, image_path):
+    start = time.perf_counter()
+    words = processor.perform_ocr(image_path)
+    return time.perf_counter() - start, len(words), sum(word[1] for word in words) / max(len(words), 1)
+
+
+def run_benchmark(image_paths, workers=None, ocr=True):
+    """
+    Compare original and preprocessed images.
+
+    Returns:
+    pandas.DataFrame: One row per image with payload sizes and, when Tesseract is installed, OCR time,
+    word count and mean confidence before and after preprocessing
+    """
+    vision = ImagePreprocessor(binarize=False, max_side=1600, output_format="jpg")
+    ocr_preprocessor = ImagePreprocessor()
+
+    start = time.perf_counter()
+    vision_paths = vision.process_batch(image_paths, workers)
+    ocr_paths = ocr_preprocessor.process_batch(image_paths, workers)
+    print(f"Preprocessed {len(image_paths)} images twice in {time.perf_counter() - start:.1f}s")
+
+    tesseract = TesseractProcessor() if ocr and TesseractProcessor is not None else None
+    rows = []
+    for original, vision_path, ocr_path in zip(image_paths, vision_paths, ocr_paths):
+        row = {
+            "image": os.path.relpath(original, DEFAULT_CORPUS),
+            "payload_original": payload_size(original),
+            "payload_preprocessed": payload_size(vision_path),
+        }
+        if tesseract is not None:
+            row["ocr_seconds_original"], row["words_original"], row["confidence_original"] = \
+                time_ocr(tesseract, original)
+            row["ocr_seconds_preprocessed"], row["words_preprocessed"], row["confidence_preprocessed"] = \
+                time_ocr(tesseract, ocr_path)
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark image preprocessing on the financial_data corpus")
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS)
+    parser.add_argument("--limit", type=int, default=50, help="Images sampled evenly across the corpus")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--no-ocr", action="store_true", help="Only measure payload sizes")
+    parser.add_argument("--output", default=None, help="Optional CSV with per-image results")
+    args = parser.parse_args()
+
+    image_paths = sorted(glob.glob(os.path.join(args.corpus, "*", "*.jpg")))
+    step = max(len(image_paths) // args.limit, 1)
+    image_paths = image_paths[::step][:args.limit]
+
+    results = run_benchmark(image_paths, args.workers, ocr=not args.no_ocr)
+    if args.output:
+        results.to_csv(args.output, index=False)
+
+    original, preprocessed = results["payload_original"].sum(), results["payload_preprocessed"].sum()
+    print(f"Vision payload: {original / 1e6:.1f} MB -> {preprocessed / 1e6:.1f} MB "
+          f"({100 * (1 - preprocessed / original):.0f}% smaller)")
+    if "ocr_seconds_original" in results:
+        for column in ("ocr_seconds", "words", "confidence"):
+            print(f"{column}: {results[f'{column}_original'].mean():.2f} -> "
+                  f"{results[f'{column}_preprocessed'].mean():.2f} (mean per image)")
+
+
+if __name__ == "__main__":
+    main()
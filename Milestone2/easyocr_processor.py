@@ -8,8 +8,10 @@ class EasyOCRProcessor:
                  low_text=0.4, 
                  link_threshold=0.4,
                  canvas_size=2560,
-                 mag_ratio=1.5):
-        self.reader = easyocr.Reader(
+                 mag_ratio=1.5,
+                 preprocessor=None,
+                 reader=None):  # Optional already-loaded easyocr.Reader to share between processors
+        self.reader = reader or easyocr.Reader(
             languages, 
             gpu=gpu,  # Enable/disable GPU
         )
@@ -18,8 +20,11 @@ class EasyOCRProcessor:
         self.link_threshold = link_threshold  # Threshold for linking text
         self.canvas_size = canvas_size  # Maximum image size for processing
         self.mag_ratio = mag_ratio  # Magnification ratio
+        self.preprocessor = preprocessor  # Optional ImagePreprocessor run before OCR
 
     def perform_ocr(self, image_path):
+        if self.preprocessor is not None:
+            image_path = self.preprocessor.process(image_path)
         results = self.reader.readtext(
             image_path, 
             text_threshold=self.text_threshold,
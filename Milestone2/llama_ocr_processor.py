@@ -1,10 +1,11 @@
-from together import Together
+from transport import get_client
 import base64
 
 class LlamaOCRProcessor:
     def __init__(self):
         try:
-            self.client = Together()
+            # Shared pooled client: the comparator is rebuilt on every rerun
+            self.client = get_client()
             self.model = "meta-llama/Llama-3.2-11B-Vision-Instruct-Turbo"
             self.prompt = """Extract text from the image. Return the text exactly as it appears in the image but with proper formatting. If no text is found, return "No text found."""
         except ImportError:
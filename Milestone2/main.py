@@ -1,13 +1,17 @@
 import streamlit as st
 import os
+import hashlib
+from contextlib import contextmanager
 import cv2
 import numpy as np
 import pandas as pd
 import pytesseract
+import easyocr
 from PIL import Image
 from easyocr_processor import EasyOCRProcessor
 from tesseract_processor import TesseractProcessor
 from llama_ocr_processor import LlamaOCRProcessor
+from preprocessing import ImagePreprocessor
 import tempfile
 import fitz 
 
@@ -20,9 +24,15 @@ except ImportError:
 pytesseract.pytesseract.tesseract_cmd = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
 
 
+@st.cache_resource
+def get_easyocr_reader(languages=("en",), gpu=True):
+    # Loading the detection and recognition models takes seconds; do it once per process
+    return easyocr.Reader(list(languages), gpu=gpu)
+
+
 class OCRComparator:
     def __init__(self):
-        self.easyocr_processor = EasyOCRProcessor()
+        self.easyocr_processor = EasyOCRProcessor(reader=get_easyocr_reader())
         self.tesseract_processor = TesseractProcessor()
         self.llama_ocr_processor = LlamaOCRProcessor() if Together is not None else None
         
@@ -46,32 +56,131 @@ class OCRComparator:
         return img
 
 
-def process_pdf(file):
+# Every result below is memoized on (page image hash, engine, engine parameters); arguments starting
+# with an underscore are not part of the key. Moving one engine's slider only reruns that engine.
+
+def image_hash(image_cv2):
+    sha = hashlib.sha256(repr(image_cv2.shape).encode("utf-8"))
+    sha.update(np.ascontiguousarray(image_cv2).data)
+    return sha.hexdigest()
+
+
+@contextmanager
+def temporary_png(image_cv2):
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".png") as temp_file:
+        temp_path = temp_file.name
+    cv2.imwrite(temp_path, image_cv2)
+    try:
+        yield temp_path
+    finally:
+        os.remove(temp_path)
+
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def process_pdf(pdf_hash, _pdf_bytes):
     images = []
-    with fitz.open(stream=file.read(), filetype="pdf") as doc:
+    with fitz.open(stream=_pdf_bytes, filetype="pdf") as doc:
         for page in doc:
             pix = page.get_pixmap()
             img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
             images.append(img)
     return images
+
+
+@st.cache_data(show_spinner=False, max_entries=256)
+def preprocess(page_hash, settings_key, _preprocessor, _image_cv2):
+    """Preprocessed page as a BGR array, or None when preprocessing left it unchanged."""
+    with temporary_png(_image_cv2) as temp_path:
+        preprocessed_path = _preprocessor.process(temp_path)
+        if preprocessed_path == temp_path:
+            return None
+        return cv2.cvtColor(cv2.imread(preprocessed_path, cv2.IMREAD_GRAYSCALE), cv2.COLOR_GRAY2BGR)
+
+
+@st.cache_data(show_spinner="Running LlamaOCR...", max_entries=256)
+def llama_ocr(page_hash, _processor, _image_cv2):
+    with temporary_png(_image_cv2) as temp_path:
+        result = _processor.perform_ocr(temp_path)
+    if result.startswith("Error"):
+        # Raising keeps failed calls out of the cache so they are retried on the next rerun
+        raise RuntimeError(result)
+    return result
+
+
+@st.cache_data(show_spinner="Running EasyOCR...", max_entries=256)
+def easyocr_ocr(page_hash, text_threshold, low_text, link_threshold, canvas_size, mag_ratio, _image_cv2):
+    processor = EasyOCRProcessor(
+        text_threshold=text_threshold,
+        low_text=low_text,
+        link_threshold=link_threshold,
+        canvas_size=canvas_size,
+        mag_ratio=mag_ratio,
+        reader=get_easyocr_reader()
+    )
+    with temporary_png(_image_cv2) as temp_path:
+        return processor.perform_ocr(temp_path)
+
+
+@st.cache_data(show_spinner="Running Tesseract OCR...", max_entries=256)
+def tesseract_ocr(page_hash, psm, oem, min_conf, _image_cv2):
+    processor = TesseractProcessor(psm=psm, oem=oem, min_conf=min_conf)
+    with temporary_png(_image_cv2) as temp_path:
+        return processor.perform_ocr(temp_path)
+
+
+@st.cache_data(show_spinner=False, max_entries=256)
+def box_overlay(page_hash, engine, parameters, _comparator, _image_cv2, _ocr_data):
+    """Page with an engine's bounding boxes, converted to RGB for correct color display."""
+    return cv2.cvtColor(_comparator.draw_boxes(_image_cv2.copy(), _ocr_data), cv2.COLOR_BGR2RGB)
+
+
+def engine_parameters():
+    """Read the engines' hyperparameters from the sidebar."""
+    # EasyOCR Hyperparameters
+    st.sidebar.header("EasyOCR Parameters")
+    easyocr_parameters = (
+        st.sidebar.slider("Text Threshold", 0.0, 1.0, 0.4, 0.01),
+        st.sidebar.slider("Low Text Threshold", 0.0, 1.0, 0.4, 0.01),
+        st.sidebar.slider("Link Threshold", 0.0, 1.0, 0.4, 0.01),
+        st.sidebar.number_input("Canvas Size", 1000, 5000, 2560),
+        st.sidebar.slider("Magnification Ratio", 1.0, 3.0, 1.5, 0.1),
+    )
+
+    # Tesseract OCR Hyperparameters
+    st.sidebar.header("Tesseract OCR Parameters")
+    tesseract_parameters = (
+        st.sidebar.selectbox("Page Segmentation Mode (PSM)", [0, 1, 3, 4, 6, 7, 8, 9, 10, 11, 12, 13], 2),
+        st.sidebar.selectbox("OCR Engine Mode (OEM)", [0, 1, 2, 3], 3),
+        st.sidebar.slider("Minimum Confidence", 0.0, 1.0, 0.0, 0.01),
+    )
+    return easyocr_parameters, tesseract_parameters
     
     
-def process_image(image, comparator, uploaded_file):
+def process_image(image, comparator, uploaded_file, easyocr_parameters, tesseract_parameters, preprocessor=None,
+                  key=""):
     # Convert image to OpenCV format (BGR)
     image_cv2 = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
+    page_hash = image_hash(image_cv2)
     
     # Display uploaded image in color
     st.image(image, caption="Uploaded Image", use_column_width=True)
 
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".png") as temp_file:
-        temp_path = temp_file.name
-        cv2.imwrite(temp_path, image_cv2)
+    if preprocessor is not None:
+        # Every engine reads the same cleaned image, so bounding boxes are drawn on it too
+        preprocessed = preprocess(page_hash, preprocessor.settings_key(), preprocessor, image_cv2)
+        if preprocessed is not None:
+            image_cv2 = preprocessed
+            page_hash = image_hash(image_cv2)
+            st.image(image_cv2, caption="Preprocessed Image", use_column_width=True)
 
     filename_without_ext = os.path.splitext(uploaded_file.name)[0]
     
     # LlamaOCR
     if comparator.llama_ocr_processor:
-        llama_ocr_result = comparator.llama_ocr_processor.perform_ocr(temp_path)
+        try:
+            llama_ocr_result = llama_ocr(page_hash, comparator.llama_ocr_processor, image_cv2)
+        except RuntimeError as e:
+            llama_ocr_result = str(e)
         st.header("LlamaOCR Results")
         st.write(llama_ocr_result)
         if llama_ocr_result and llama_ocr_result not in [
@@ -79,34 +188,14 @@ def process_image(image, comparator, uploaded_file):
             "Error performing Llama OCR: Could not find image at the provided URL."
         ]:
             st.download_button("Download LlamaOCR Text", llama_ocr_result,
-                               file_name=f"{filename_without_ext}_llama.txt")
-
-    # EasyOCR Hyperparameters
-    st.sidebar.header("EasyOCR Parameters")
-    easy_text_threshold = st.sidebar.slider("Text Threshold", 0.0, 1.0, 0.4, 0.01)
-    easy_low_text = st.sidebar.slider("Low Text Threshold", 0.0, 1.0, 0.4, 0.01)
-    easy_link_threshold = st.sidebar.slider("Link Threshold", 0.0, 1.0, 0.4, 0.01)
-    easy_canvas_size = st.sidebar.number_input("Canvas Size", 1000, 5000, 2560)
-    easy_mag_ratio = st.sidebar.slider("Magnification Ratio", 1.0, 3.0, 1.5, 0.1)
-    
-    # Update EasyOCR Processor with new parameters
-    comparator.easyocr_processor = EasyOCRProcessor(
-        text_threshold=easy_text_threshold,
-        low_text=easy_low_text,
-        link_threshold=easy_link_threshold,
-        canvas_size=easy_canvas_size,
-        mag_ratio=easy_mag_ratio
-    )
+                               file_name=f"{filename_without_ext}_llama.txt", key=f"llama_download{key}")
 
     # EasyOCR Processing
-    easyocr_result = comparator.easyocr_processor.perform_ocr(temp_path)
+    easyocr_result = easyocr_ocr(page_hash, *easyocr_parameters, image_cv2)
     st.header("EasyOCR Results")
     
-    # Convert bounding box image to RGB for correct color display
-    image_with_easyocr_boxes = cv2.cvtColor(
-        comparator.draw_boxes(image_cv2.copy(), easyocr_result), 
-        cv2.COLOR_BGR2RGB
-    )
+    image_with_easyocr_boxes = box_overlay(page_hash, "easyocr", easyocr_parameters, comparator, image_cv2,
+                                           easyocr_result)
     st.image(image_with_easyocr_boxes, caption="EasyOCR Bounding Boxes")
     
     df_easyocr = pd.DataFrame(easyocr_result, columns=['Text', 'Confidence', 'x', 'y', 'w', 'h'])
@@ -118,32 +207,16 @@ def process_image(image, comparator, uploaded_file):
             "Download EasyOCR Table", 
             csv_easyocr, 
             file_name=f"{filename_without_ext}_easyocr.csv", 
-            mime='text/csv'
+            mime='text/csv',
+            key=f"easyocr_download{key}"
         )
 
-    # Tesseract OCR Hyperparameters
-    st.sidebar.header("Tesseract OCR Parameters")
-    tesseract_psm = st.sidebar.selectbox("Page Segmentation Mode (PSM)", 
-        [0, 1, 3, 4, 6, 7, 8, 9, 10, 11, 12, 13], 2)
-    tesseract_oem = st.sidebar.selectbox("OCR Engine Mode (OEM)", [0, 1, 2, 3], 3)
-    tesseract_min_conf = st.sidebar.slider("Minimum Confidence", 0.0, 1.0, 0.0, 0.01)
-    
-    # Update Tesseract Processor with new parameters
-    comparator.tesseract_processor = TesseractProcessor(
-        psm=tesseract_psm,
-        oem=tesseract_oem,
-        min_conf=tesseract_min_conf
-    )
-
     # Tesseract OCR Processing
-    tesseract_result = comparator.tesseract_processor.perform_ocr(temp_path)
+    tesseract_result = tesseract_ocr(page_hash, *tesseract_parameters, image_cv2)
     st.header("Tesseract OCR Results")
     
-    # Convert bounding box image to RGB for correct color display
-    image_with_tesseract_boxes = cv2.cvtColor(
-        comparator.draw_boxes(image_cv2.copy(), tesseract_result), 
-        cv2.COLOR_BGR2RGB
-    )
+    image_with_tesseract_boxes = box_overlay(page_hash, "tesseract", tesseract_parameters, comparator, image_cv2,
+                                             tesseract_result)
     st.image(image_with_tesseract_boxes, caption="TesseractOCR Bounding Boxes")
     
     df_tesseract = pd.DataFrame(tesseract_result, columns=['Text', 'Confidence', 'left', 'top', 'width', 'height'])
@@ -155,30 +228,45 @@ def process_image(image, comparator, uploaded_file):
             "Download Tesseract Table", 
             csv_tesseract, 
             file_name=f"{filename_without_ext}_tesseract.csv", 
-            mime='text/csv'
+            mime='text/csv',
+            key=f"tesseract_download{key}"
         )
 
-    os.remove(temp_path) 
-
 
 def main():
     st.set_page_config(page_title="OCR Comparator")
     st.title("OCR Comparator")
 
     comparator = OCRComparator()
+
+    st.sidebar.header("Preprocessing")
+    preprocessor = None
+    if st.sidebar.checkbox("Preprocess images", value=False):
+        preprocessor = ImagePreprocessor(
+            perspective=st.sidebar.checkbox("Perspective correction", value=True),
+            deskew=st.sidebar.checkbox("Deskew", value=True),
+            crop=st.sidebar.checkbox("Crop to content", value=True),
+            binarize=st.sidebar.checkbox("Binarize", value=True),
+            denoise=st.sidebar.checkbox("Denoise", value=False)
+        )
+
+    easyocr_parameters, tesseract_parameters = engine_parameters()
+
     uploaded_file = st.file_uploader("Upload an image or PDF", type=["png", "jpg", "jpeg", "pdf"])
 
     if uploaded_file is not None:
         file_ext = os.path.splitext(uploaded_file.name)[1].lower()
 
         if file_ext == ".pdf":
-            images = process_pdf(uploaded_file)
+            pdf_bytes = uploaded_file.getvalue()
+            images = process_pdf(hashlib.sha256(pdf_bytes).hexdigest(), pdf_bytes)
             for i, image in enumerate(images):
                 st.subheader(f"Page {i+1}")
-                process_image(image, comparator, uploaded_file)
+                process_image(image, comparator, uploaded_file, easyocr_parameters, tesseract_parameters,
+                              preprocessor, key=f"_page_{i}")
         else:
             image = Image.open(uploaded_file)
-            process_image(image, comparator, uploaded_file)
+            process_image(image, comparator, uploaded_file, easyocr_parameters, tesseract_parameters, preprocessor)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,184 @@
+import hashlib
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "preprocessed")
+
+
+def order_corners(points):
+    """Order four points as top-left, top-right, bottom-right, bottom-left."""
+    points = points.reshape(4, 2).astype(np.float32)
+    sums = points.sum(axis=1)
+    diffs = np.diff(points, axis=1).ravel()
+    return np.array([points[np.argmin(sums)], points[np.argmin(diffs)],
+                     points[np.argmax(sums)], points[np.argmax(diffs)]], dtype=np.float32)
+
+
+def correct_perspective(gray, min_area=0.5):
+    """
+    Flatten a photographed page onto a rectangle.
+
+    Only applied when a four-cornered outline covering at least ``min_area`` of the
+    frame is found, so flat scans pass through untouched.
+    """
+    scale = 800 / max(gray.shape)
+    small = cv2.resize(gray, None, fx=scale, fy=scale) if scale < 1 else gray
+    scale = min(scale, 1.0)
+    edges = cv2.Canny(cv2.GaussianBlur(small, (5, 5), 0), 50, 150)
+    edges = cv2.dilate(edges, np.ones((3, 3), np.uint8))
+    contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if not contours:
+        return gray
+    outline = max(contours, key=cv2.contourArea)
+    if cv2.contourArea(outline) < min_area * small.shape[0] * small.shape[1]:
+        return gray
+    corners = cv2.approxPolyDP(outline, 0.02 * cv2.arcLength(outline, True), True)
+    if len(corners) != 4:
+        return gray
+
+    corners = order_corners(corners) / scale
+    top_left, top_right, bottom_right, bottom_left = corners
+    width = int(max(np.linalg.norm(top_right - top_left), np.linalg.norm(bottom_right - bottom_left)))
+    height = int(max(np.linalg.norm(bottom_left - top_left), np.linalg.norm(bottom_right - top_right)))
+    target = np.array([[0, 0], [width - 1, 0], [width - 1, height - 1], [0, height - 1]], dtype=np.float32)
+    matrix = cv2.getPerspectiveTransform(corners, target)
+    return cv2.warpPerspective(gray, matrix, (width, height), borderMode=cv2.BORDER_REPLICATE)
+
+
+def text_mask(gray):
+    _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    # Text is the minority class, also on light-on-dark scans
+    if np.count_nonzero(binary) > binary.size / 2:
+        binary = cv2.bitwise_not(binary)
+    return binary
+
+
+def deskew(gray, max_angle=15.0):
+    coords = cv2.findNonZero(text_mask(gray))
+    if coords is None or len(coords) < 50:
+        return gray
+    angle = cv2.minAreaRect(coords)[-1]
+    # OpenCV versions disagree on the angle range; fold it into [-45, 45)
+    angle = (angle + 45) % 90 - 45
+    if abs(angle) < 0.3 or abs(angle) > max_angle:
+        return gray
+    height, width = gray.shape
+    matrix = cv2.getRotationMatrix2D((width / 2, height / 2), angle, 1.0)
+    return cv2.warpAffine(gray, matrix, (width, height), flags=cv2.INTER_CUBIC, borderMode=cv2.BORDER_REPLICATE)
+
+
+def crop_to_content(gray, margin=0.02):
+    """Crop to the bounding box of the text, dropping borders, shadows and blank margins."""
+    mask = text_mask(gray)
+    # Open the mask to remove isolated specks, so noise outside the text block does not widen the box
+    mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, np.ones((2, 2), np.uint8))
+    coords = cv2.findNonZero(mask)
+    if coords is None:
+        return gray
+    x, y, w, h = cv2.boundingRect(coords)
+    pad = int(margin * max(gray.shape))
+    height, width = gray.shape
+    return gray[max(0, y - pad):min(height, y + h + pad), max(0, x - pad):min(width, x + w + pad)]
+
+
+def binarize(gray, block_size=31, offset=15):
+    # Adaptive thresholding evens out shadows and uneven lighting from phone photos
+    return cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, block_size, offset)
+
+
+class ImagePreprocessor:
+    """
+    Clean up a document image before OCR or a vision model call.
+
+    Each step can be switched off. Outputs are cached on disk under the content
+    hash of the input and the step settings, so the same scan is only processed once.
+    """
+
+    def __init__(self,
+                 perspective=True,
+                 deskew=True,
+                 crop=True,
+                 binarize=True,
+                 denoise=False,
+                 max_side=2000,
+                 output_format="png",
+                 jpeg_quality=85,
+                 cache_dir=DEFAULT_CACHE_DIR):
+        self.perspective = perspective
+        self.deskew = deskew
+        self.crop = crop
+        self.binarize = binarize
+        self.denoise = denoise
+        self.max_side = max_side  # Longest side of the output; larger images are downscaled
+        self.output_format = output_format
+        self.jpeg_quality = jpeg_quality
+        self.cache_dir = cache_dir
+
+    def settings_key(self):
+        settings = (self.perspective, self.deskew, self.crop, self.binarize, self.denoise, self.max_side,
+                    self.output_format, self.jpeg_quality)
+        return hashlib.sha1(repr(settings).encode("utf-8")).hexdigest()[:10]
+
+    def cache_path(self, image_path):
+        sha = hashlib.sha256()
+        with open(image_path, "rb") as image_file:
+            for chunk in iter(lambda: image_file.read(1 << 20), b""):
+                sha.update(chunk)
+        return os.path.join(self.cache_dir, f"{sha.hexdigest()}_{self.settings_key()}.{self.output_format}")
+
+    def apply(self, gray):
+        """Run the enabled steps on a grayscale array."""
+        if self.perspective:
+            gray = correct_perspective(gray)
+        if self.deskew:
+            gray = deskew(gray)
+        if self.crop:
+            gray = crop_to_content(gray)
+        if self.max_side and max(gray.shape) > self.max_side:
+            scale = self.max_side / max(gray.shape)
+            gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        if self.denoise:
+            gray = cv2.fastNlMeansDenoising(gray, None, h=10)
+        if self.binarize:
+            gray = binarize(gray)
+        return gray
+
+    def process(self, image_path):
+        """
+        Preprocess one image.
+
+        Args:
+        image_path (str): Path of the original image
+
+        Returns:
+        str: Path of the preprocessed image, or the original path if it could not be processed
+        """
+        try:
+            output_path = self.cache_path(image_path)
+            if os.path.exists(output_path):
+                return output_path
+            gray = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
+            if gray is None:
+                return image_path
+            params = [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality] if self.output_format == "jpg" else []
+            os.makedirs(self.cache_dir, exist_ok=True)
+            temp_path = f"{output_path}.{os.getpid()}.{self.output_format}"
+            cv2.imwrite(temp_path, self.apply(gray), params)
+            os.replace(temp_path, output_path)
+            return output_path
+        except Exception as e:
+            print(f"Error preprocessing {image_path}: {e}")
+            return image_path
+
+    def process_batch(self, image_paths, workers=None):
+        """Preprocess many images across a process pool; returns output paths in input order."""
+        workers = workers or os.cpu_count() or 1
+        if len(image_paths) > 1 and workers > 1:
+            # Spawned workers are safe to start from inside the Streamlit server process
+            with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+                return list(executor.map(self.process, image_paths, chunksize=4))
+        return [self.process(path) for path in image_paths]
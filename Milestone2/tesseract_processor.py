@@ -7,14 +7,18 @@ class TesseractProcessor:
                  oem=3,  # OCR Engine Mode
                  lang='eng',
                  config='',
-                 min_conf=0):
+                 min_conf=0,
+                 preprocessor=None):  # Optional ImagePreprocessor run before OCR
         self.psm = psm
         self.oem = oem
         self.lang = lang
         self.config = config
         self.min_conf = min_conf
+        self.preprocessor = preprocessor
 
     def perform_ocr(self, image_path):
+        if self.preprocessor is not None:
+            image_path = self.preprocessor.process(image_path)
         img = cv2.imread(image_path)
         
         # Construct custom configuration
@@ -0,0 +1,120 @@
+import os
+import threading
+
+import requests
+import together
+from requests.adapters import HTTPAdapter
+from together import Together
+from urllib3.util.retry import Retry
+
+TOGETHER_BASE_URL = "https://api.together.xyz/v1"
+
+# Connecting should fail fast; reading waits for the model to finish generating
+CONNECT_TIMEOUT = float(os.getenv("BFSI_CONNECT_TIMEOUT", "3.05"))
+READ_TIMEOUT = float(os.getenv("BFSI_READ_TIMEOUT", "120"))
+POOL_SIZE = int(os.getenv("BFSI_POOL_SIZE", "16"))
+
+_lock = threading.Lock()
+_session = None
+_clients = {}
+
+
+class SharedSession(requests.Session):
+    """
+    Process-wide keep-alive session handed to the Together SDK.
+
+    The SDK closes its per-thread session every few minutes; with one session shared
+    by every thread that would drop connections other threads are using, so ``close``
+    is a no-op and ``shutdown`` really closes the pool.
+    """
+
+    def close(self):
+        pass
+
+    def shutdown(self):
+        super().close()
+
+
+def get_session(pool_size=POOL_SIZE):
+    """The shared session, created on first use and installed as the Together SDK's transport."""
+    global _session
+    with _lock:
+        if _session is None:
+            session = SharedSession()
+            # Only connection errors are retried here; the SDK retries failed API responses itself
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size,
+                                  max_retries=Retry(total=2, connect=2, read=0, status=0, backoff_factor=0.2))
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            together.requestssession = session
+            _session = session
+        return _session
+
+
+def get_client(api_key=None, connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT, warm=True):
+    """
+    Shared Together client for this process.
+
+    Every client routes through the pooled session, so constructing processors on each
+    Streamlit rerun no longer repeats TCP and TLS handshakes.
+    """
+    get_session()
+    key = (api_key, connect_timeout, read_timeout)
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            # requests accepts a (connect, read) tuple; the SDK passes the timeout through unchanged
+            client = Together(api_key=api_key, timeout=(connect_timeout, read_timeout))
+            _clients[key] = client
+            created = True
+        else:
+            created = False
+    if created and warm:
+        warm_up(block=False)
+    return client
+
+
+def warm_up(connections=2, base_url=TOGETHER_BASE_URL, block=True):
+    """
+    Open ``connections`` keep-alive connections to the API ahead of the first model call.
+
+    An unauthenticated request is enough to complete DNS, TCP and TLS setup; its
+    status code is irrelevant.
+    """
+    session = get_session()
+
+    def ping():
+        try:
+            session.get(f"{base_url}/models", timeout=(CONNECT_TIMEOUT, 10)).close()
+        except requests.exceptions.RequestException as e:
+            print(f"Connection warm-up failed: {e}")
+
+    threads = [threading.Thread(target=ping, daemon=True) for _ in range(connections)]
+    for thread in threads:
+        thread.start()
+    if block:
+        for thread in threads:
+            thread.join()
+
+
+def transport_stats():
+    """
+    Connection reuse of the shared session.
+
+    Returns:
+    dict: requests sent, connections opened, reuse rate and idle pooled connections
+    """
+    session = get_session()
+    stats = {"requests": 0, "connections_opened": 0, "idle_connections": 0}
+    for adapter in set(session.adapters.values()):
+        pools = adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            stats["requests"] += pool.num_requests
+            stats["connections_opened"] += pool.num_connections
+            if pool.pool is not None:
+                stats["idle_connections"] += sum(conn is not None for conn in list(pool.pool.queue))
+    stats["reuse_rate"] = 1 - stats["connections_opened"] / stats["requests"] if stats["requests"] else 0.0
+    return stats
@@ -0,0 +1,188 @@
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+
+import pandas as pd
+
+DEFAULT_DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "usage.db")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS calls (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    batch_id TEXT,
+    session_id TEXT,
+    doc_type TEXT,
+    purpose TEXT,
+    model TEXT,
+    prompt_tokens INTEGER,
+    completion_tokens INTEGER,
+    image_bytes INTEGER,
+    latency_ms REAL,
+    cost REAL,
+    estimated INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS budgets (
+    batch_id TEXT PRIMARY KEY,
+    soft REAL,
+    hard REAL
+);
+CREATE INDEX IF NOT EXISTS idx_calls_batch ON calls (batch_id);
+CREATE INDEX IF NOT EXISTS idx_calls_session ON calls (session_id, created_at);
+"""
+
+# Llama 3.2 Vision reads an image as at most four 560x560 tiles of 1601 tokens each
+IMAGE_TOKENS_UPPER_BOUND = 4 * 1601
+CHARS_PER_TOKEN = 4
+
+
+def image_payload_bytes(messages):
+    """Size of the images sent in a request: base64 data URIs, or just the URL for remote images."""
+    return sum(len(part["image_url"]["url"]) for message in messages if isinstance(message.get("content"), list)
+               for part in message["content"] if part.get("type") == "image_url")
+
+
+def estimate_tokens(text):
+    return -(-len(text or "") // CHARS_PER_TOKEN)
+
+
+def estimate_prompt_tokens(messages):
+    """Rough prompt size: text at four characters per token, images at the most tokens the model spends on one."""
+    tokens = 0
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, str):
+            tokens += estimate_tokens(content)
+            continue
+        for part in content or []:
+            if part.get("type") == "image_url":
+                tokens += IMAGE_TOKENS_UPPER_BOUND
+            else:
+                tokens += estimate_tokens(part.get("text"))
+    return tokens
+
+
+def call_cost(model, prompt_tokens, completion_tokens):
+    # Imported here: model_cascade imports document_processor, which imports this module
+    from model_cascade import MODEL_PRICES
+    return ((prompt_tokens or 0) + (completion_tokens or 0)) * MODEL_PRICES.get(model, 0.0) / 1e6
+
+
+class UsageLedger:
+    """
+    Token, payload and cost record of every model call, with per-batch budgets.
+
+    Calls are tagged with the batch, session and document type they were made for, so
+    spend can be aggregated at any of those levels. Worker processes and the app share
+    the database, which is how a worker sees the budget set for the batch it is running.
+    """
+
+    def __init__(self, db_path=DEFAULT_DB_PATH):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+            if "estimated" not in {row["name"] for row in conn.execute("PRAGMA table_info(calls)")}:
+                conn.execute("ALTER TABLE calls ADD COLUMN estimated INTEGER NOT NULL DEFAULT 0")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.row_factory = sqlite3.Row
+            yield conn
+        finally:
+            conn.close()
+
+    def record(self, model, prompt_tokens, completion_tokens, image_bytes, latency_ms, context=None, estimated=False):
+        """
+        Store one model call.
+
+        Args:
+        context (dict): Optional batch_id, session_id, doc_type and purpose of the call
+        estimated (bool): The token counts are estimates, for calls whose usage was never reported
+        """
+        context = context or {}
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO calls (batch_id, session_id, doc_type, purpose, model, prompt_tokens, completion_tokens, "
+                "image_bytes, latency_ms, cost, estimated, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (context.get("batch_id"), context.get("session_id"), context.get("doc_type"), context.get("purpose"),
+                 model, prompt_tokens, completion_tokens, image_bytes, latency_ms,
+                 call_cost(model, prompt_tokens, completion_tokens), int(estimated), time.time())
+            )
+
+    def typical_prompt_tokens(self, model, messages):
+        """
+        Prompt tokens to charge a call whose usage was never reported, such as a cancelled stream.
+
+        Uses the mean reported prompt size of earlier calls to the same model with a similar image
+        payload, or ``estimate_prompt_tokens`` before any such call has been recorded.
+        """
+        image_bytes = image_payload_bytes(messages)
+        try:
+            with self._connect() as conn:
+                observed = conn.execute(
+                    "SELECT AVG(prompt_tokens) FROM calls WHERE model = ? AND estimated = 0 "
+                    "AND prompt_tokens IS NOT NULL AND image_bytes BETWEEN ? AND ?",
+                    (model, image_bytes // 2, image_bytes * 2)
+                ).fetchone()[0]
+        except sqlite3.Error as e:
+            print(f"Could not look up prompt sizes: {e}")
+            observed = None
+        return round(observed) if observed else estimate_prompt_tokens(messages)
+
+    def set_budget(self, batch_id, soft=None, hard=None):
+        """USD budgets for a batch: past ``soft`` it is downgraded, past ``hard`` it is paused; None for no limit."""
+        with self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO budgets (batch_id, soft, hard) VALUES (?, ?, ?)",
+                         (batch_id, soft or None, hard or None))
+
+    def batch_cost(self, batch_id):
+        with self._connect() as conn:
+            return conn.execute("SELECT COALESCE(SUM(cost), 0) FROM calls WHERE batch_id = ?",
+                                (batch_id,)).fetchone()[0]
+
+    def budget_state(self, batch_id):
+        """
+        Where a batch stands against its budgets.
+
+        Returns:
+        dict: cost so far, soft and hard budgets, and state "ok", "soft" or "hard"
+        """
+        with self._connect() as conn:
+            budget = conn.execute("SELECT soft, hard FROM budgets WHERE batch_id = ?", (batch_id,)).fetchone()
+        cost = self.batch_cost(batch_id)
+        soft, hard = (budget["soft"], budget["hard"]) if budget else (None, None)
+        state = "hard" if hard and cost >= hard else "soft" if soft and cost >= soft else "ok"
+        return {"cost": cost, "soft": soft, "hard": hard, "state": state}
+
+    def summary(self, session_id=None, batch_id=None, since=None):
+        """
+        Usage per document type and purpose.
+
+        Returns:
+        pandas.DataFrame: Calls, prompt and completion tokens, image megabytes, mean latency, cost and
+            the number of calls whose tokens were estimated
+        """
+        where, args = [], []
+        for column, value in (("session_id", session_id), ("batch_id", batch_id)):
+            if value is not None:
+                where.append(f"{column} = ?")
+                args.append(value)
+        if since is not None:
+            where.append("created_at >= ?")
+            args.append(since)
+        with self._connect() as conn:
+            return pd.read_sql_query(
+                "SELECT COALESCE(doc_type, '-') AS \"Document Type\", COALESCE(purpose, '-') AS Purpose, "
+                "COUNT(*) AS Calls, SUM(prompt_tokens) AS \"Prompt Tokens\", "
+                "SUM(completion_tokens) AS \"Completion Tokens\", ROUND(SUM(image_bytes) / 1e6, 2) AS \"Image MB\", "
+                "ROUND(AVG(latency_ms)) AS \"Mean Latency (ms)\", SUM(cost) AS \"Cost ($)\", "
+                "SUM(estimated) AS \"Estimated Calls\" FROM calls"
+                + (f" WHERE {' AND '.join(where)}" if where else "")
+                + " GROUP BY doc_type, purpose ORDER BY \"Cost ($)\" DESC",
+                conn, params=args
+            )
@@ -0,0 +1,151 @@
+import re
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objs as go
+
+UNKNOWN_ENTITY = "Unknown"
+
+ENTITY_PATTERNS = [
+    ("Account", re.compile(r"(?:account|a/c|acct)\.?\s*(?:no|number|#)?\.?\s*[:\-]?\s*([x*\d][\dx* -]{3,}\d)")),
+    ("Employee", re.compile(r"(?:employee|emp)\.?\s*(?:id|code|no|number)\.?\s*[:\-]?\s*([a-z0-9][a-z0-9-]{1,})")),
+]
+
+MONTHS = r"(?:jan|feb|mar|apr|may|jun|jul|aug|sep|sept|oct|nov|dec)[a-z]*\.?"
+DATE_PATTERNS = [
+    (re.compile(r"\b\d{4}-\d{2}-\d{2}\b"), {}),
+    (re.compile(r"\b\d{1,2}[/.-]\d{1,2}[/.-]\d{4}\b"), {"dayfirst": True}),
+    (re.compile(rf"\b\d{{1,2}}\s+{MONTHS},?\s+\d{{4}}\b"), {}),
+    (re.compile(rf"\b{MONTHS}\s+\d{{1,2}},?\s+\d{{4}}\b"), {}),
+    (re.compile(rf"\b{MONTHS}\s*[,'-]?\s*\d{{4}}\b"), {}),
+]
+
+
+def extract_entity(text):
+    """Account number or employee id a document belongs to, normalised, or None."""
+    lowered = (text or "").lower()
+    for kind, pattern in ENTITY_PATTERNS:
+        match = pattern.search(lowered)
+        if match:
+            return f"{kind} {re.sub(r'[^a-z0-9*x]', '', match.group(1)).upper()}"
+    return None
+
+
+def extract_period(text):
+    """
+    Month a statement or slip covers: the latest plausible date in its text.
+
+    Returns:
+    str or None: First day of that month as YYYY-MM-DD
+    """
+    lowered = (text or "").lower()
+    dates = []
+    for pattern, options in DATE_PATTERNS:
+        for match in pattern.findall(lowered):
+            date = pd.to_datetime(match, errors="coerce", **options)
+            if not pd.isna(date) and 1990 <= date.year <= pd.Timestamp.now().year + 1:
+                dates.append(date)
+    if not dates:
+        return None
+    return max(dates).to_period("M").start_time.strftime("%Y-%m-%d")
+
+
+def build_series(history):
+    """
+    Time-indexed numeric series per entity.
+
+    Documents without a detected account or employee are left out: they are unrelated to one
+    another, and their period is only the extraction date.
+
+    Args:
+    history (pandas.DataFrame): Parameter, Value, Entity and Period columns, as loaded from the results store
+
+    Returns:
+    pandas.DataFrame: (Entity, Period) index, one column per parameter
+    """
+    history = history[history["Entity"] != UNKNOWN_ENTITY]
+    numeric = history.assign(Value=pd.to_numeric(history["Value"], errors="coerce"),
+                             Period=pd.to_datetime(history["Period"], errors="coerce"),
+                             Parameter=history["Parameter"].astype(str).str.strip().str.title())
+    numeric = numeric.dropna(subset=["Value", "Period"])
+    if numeric.empty:
+        return pd.DataFrame()
+    return numeric.pivot_table(index=["Entity", "Period"], columns="Parameter", values="Value",
+                               aggfunc="last").sort_index()
+
+
+def rolling_metrics(series, window=3):
+    """
+    Rolling mean and month-over-month changes, computed per entity.
+
+    Returns:
+    pandas.DataFrame: Rolling mean over ``window`` periods
+    pandas.DataFrame: Change from the previous period
+    pandas.DataFrame: Percentage change from the previous period
+    """
+    grouped = series.groupby(level="Entity", group_keys=False)
+    rolling = grouped.rolling(window, min_periods=1).mean()
+    if rolling.index.nlevels > series.index.nlevels:
+        rolling = rolling.droplevel(0)
+    delta = grouped.diff()
+    pct_change = grouped.pct_change(fill_method=None) * 100
+    return rolling, delta, pct_change
+
+
+def downsample(x, y, max_points):
+    """
+    Largest-Triangle-Three-Buckets downsampling: keeps the visual shape of a line with ``max_points`` points.
+
+    Returns:
+    numpy.ndarray: Indices of the points to keep
+    """
+    n = len(x)
+    if max_points >= n or max_points < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    bucket_size = (n - 2) / (max_points - 2)
+    edges = (np.arange(max_points - 1) * bucket_size).astype(int) + 1
+    edges[-1] = n - 1
+    keep = [0]
+    for i in range(max_points - 2):
+        start, end = edges[i], edges[i + 1]
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        next_x = x[end:next_end].mean() if next_end > end else x[-1]
+        next_y = y[end:next_end].mean() if next_end > end else y[-1]
+        previous = keep[-1]
+        # Keep the point forming the largest triangle with the last kept point and the next bucket's mean
+        areas = np.abs((x[previous] - next_x) * (y[start:end] - y[previous])
+                       - (x[previous] - x[start:end]) * (next_y - y[previous]))
+        keep.append(start + int(np.argmax(areas)))
+    keep.append(n - 1)
+    return np.array(keep)
+
+
+def create_trend_chart(series, rolling, parameter, entities, max_points=1000):
+    """
+    Line chart of one parameter over time for several entities, with its rolling mean.
+
+    Args:
+    series (pandas.DataFrame): Output of build_series
+    rolling (pandas.DataFrame): Rolling means from rolling_metrics
+    parameter (str): Column to plot
+    entities (list): Entities to draw, one line each
+    max_points (int): Points per line after downsampling
+
+    Returns:
+    plotly.graph_objs.Figure: WebGL line chart
+    """
+    fig = go.Figure()
+    for entity in entities:
+        for frame, name, dash in ((series, entity, "solid"), (rolling, f"{entity} (rolling mean)", "dot")):
+            line = frame.loc[entity, parameter].dropna()
+            if line.empty:
+                continue
+            keep = downsample(line.index.asi8, line.values, max_points)
+            # Scattergl renders on the GPU and stays responsive with many lines
+            fig.add_trace(go.Scattergl(x=line.index[keep], y=line.values[keep], mode="lines", name=name,
+                                       line={"dash": dash}))
+    fig.update_layout(title=f"{parameter} over time", xaxis_title="Period", yaxis_title=parameter,
+                      hovermode="x unified")
+    return fig
@@ -0,0 +1,186 @@
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from query_index import tokenize
+
+COMPARISONS = [
+    (r"(?:>=|at least|no less than)", "ge"),
+    (r"(?:<=|at most|no more than)", "le"),
+    (r"(?:>|above|greater than|more than|over|exceeds?|higher than)", "gt"),
+    (r"(?:<|below|less than|under|lower than)", "lt"),
+    (r"(?:==|=|equal to|equals)", "eq"),
+]
+AGGREGATES = {
+    "mean": {"average", "mean", "avg"},
+    "sum": {"total", "sum", "combined"},
+    "max": {"highest", "maximum", "max", "largest", "most"},
+    "min": {"lowest", "minimum", "min", "smallest", "least"},
+    "count": {"count", "number"},
+}
+# The unit must end a word, so the "m" of "30000 monthly" is not read as millions
+NUMBER_PATTERN = r"(-?\d[\d,]*(?:\.\d+)?)(?:\s*(k|m|lakh|lakhs)\b)?"
+MULTIPLIERS = {"k": 1e3, "m": 1e6, "lakh": 1e5, "lakhs": 1e5}
+
+
+def to_columnar(processed_dfs):
+    """Pivot the per-document long dataframes into one row per document, one column per parameter."""
+    if not processed_dfs:
+        return pd.DataFrame()
+    combined = pd.concat(processed_dfs, ignore_index=True)
+    combined["Value"] = pd.to_numeric(combined["Value"], errors="coerce")
+    return combined.pivot_table(index="Document", columns="Parameter", values="Value", aggfunc="first", dropna=False)
+
+
+class BatchQueryEngine:
+    """
+    Answer filter and aggregate questions over every processed document at once.
+
+    Questions are resolved against the columnar table; documents whose value for the
+    queried parameter is missing are sent to the vision model in parallel.
+    """
+
+    def __init__(self, processed_dfs, document_images=None, processor=None, max_workers=4):
+        self.table = to_columnar(processed_dfs)
+        self.document_images = document_images or {}
+        self.processor = processor
+        self.max_workers = max_workers
+
+    def match_parameter(self, question):
+        question_terms = set(tokenize(question))
+        best, best_score = None, 0.0
+        for column in self.table.columns:
+            column_terms = set(tokenize(column))
+            if not column_terms:
+                continue
+            score = len(column_terms & question_terms) / len(column_terms)
+            # Prefer the most specific label when several are fully covered
+            if score > best_score or (score == best_score and best is not None and len(column_terms) > len(set(tokenize(best)))):
+                best, best_score = column, score
+        return best if best_score >= 0.5 else None
+
+    def parse(self, question):
+        text = question.lower()
+        parameter = self.match_parameter(question)
+        if parameter is None:
+            return None
+
+        condition = None
+        for pattern, operator in COMPARISONS:
+            match = re.search(pattern + r"\s*(?:rs\.?|inr|\$|₹)?\s*" + NUMBER_PATTERN, text)
+            if match:
+                threshold = float(match.group(1).replace(",", "")) * MULTIPLIERS.get(match.group(2), 1)
+                condition = (operator, threshold)
+                # "at least" and "at most" are comparisons, not min/max aggregates
+                text = text[:match.start()] + " " + text[match.end():]
+                break
+
+        # Aggregate keywords are looked up outside the parameter label ("Total Credits" is not a sum)
+        remaining = set(tokenize(text)) - set(tokenize(parameter))
+        aggregate = next((name for name, words in AGGREGATES.items() if remaining & words), None)
+        if re.search(r"\bhow many\b", text):
+            aggregate = "count"
+        if condition is None and aggregate is None:
+            aggregate = "list"
+        return {"parameter": parameter, "condition": condition, "aggregate": aggregate}
+
+    def resolve_missing(self, parameter, documents):
+        """
+        Ask the model for a single parameter of each unresolved document, in parallel.
+
+        Returns:
+        dict: Value per resolved document
+        list: Documents whose model call failed
+        """
+        if self.processor is None:
+            return {}, []
+
+        def ask(document):
+            image_path = self.document_images.get(document)
+            if image_path is None:
+                return document, None, False
+            try:
+                image_url = self.processor.image_url(image_path)
+                if not image_url:
+                    return document, None, False
+                response = self.processor.create_completion(
+                    model=self.processor.model,
+                    messages=[
+                        {
+                            "role": "user",
+                            "content": [
+                                {"type": "text", "text": f"Return ONLY the numeric value of '{parameter}' in this "
+                                                         "document. Do not include any statements or additional text."},
+                                {"type": "image_url", "image_url": {"url": image_url}}
+                            ]
+                        }
+                    ],
+                    max_tokens=20,
+                    temperature=0.0
+                )
+            except Exception as e:
+                # One failed call (rate limit, timeout) leaves only that document unresolved
+                print(f"Error resolving {parameter} for {document}: {e}")
+                return document, None, True
+            cleaned = re.sub(r"[^\d.-]", "", response.choices[0].message.content.replace(",", ""))
+            try:
+                return document, float(cleaned), False
+            except ValueError:
+                return document, None, False
+
+        resolved, failed = {}, []
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for document, value, error in executor.map(ask, documents):
+                if value is not None:
+                    resolved[document] = value
+                elif error:
+                    failed.append(document)
+        return resolved, failed
+
+    def run(self, question):
+        """
+        Execute a batch question.
+
+        Returns:
+        dict: ``spec`` (parsed query), ``result`` (DataFrame or scalar), ``model_calls``
+        (documents sent to the model), ``unresolved`` (documents still missing a value) and
+        ``failed`` (documents whose model call raised an error)
+        """
+        if self.table.empty:
+            return None
+        spec = self.parse(question)
+        if spec is None:
+            return None
+
+        values = self.table[spec["parameter"]].copy()
+        missing = list(values[values.isna()].index)
+        failed = []
+        if missing:
+            resolved, failed = self.resolve_missing(spec["parameter"], missing)
+            for document, value in resolved.items():
+                values[document] = value
+                self.table.loc[document, spec["parameter"]] = value
+        known = values.dropna()
+
+        if spec["condition"] is not None:
+            operator, threshold = spec["condition"]
+            known = known[getattr(known, operator)(threshold)]
+
+        aggregate = spec["aggregate"]
+        if aggregate in ("mean", "sum"):
+            result = getattr(known, aggregate)()
+        elif aggregate == "count":
+            result = int(known.count())
+        elif aggregate in ("max", "min") and not known.empty:
+            result = known.loc[[getattr(known, f"idx{aggregate}")()]].to_frame()
+        else:
+            result = known.sort_values(ascending=False).to_frame()
+
+        return {
+            "spec": spec,
+            "result": result,
+            "model_calls": len(missing),
+            "unresolved": [document for document in missing if pd.isna(values[document])],
+            "failed": failed,
+        }
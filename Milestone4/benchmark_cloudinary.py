@@ -0,0 +1,113 @@
+import argparse
+import base64
+import os
+import tempfile
+import time
+
+# Compare delivery modes on a single model call each
+os.environ.setdefault("BFSI_CASCADE", "off")
+os.environ.setdefault("BFSI_STREAM", "0")
+
+import cloudinary
+import cloudinary.api
+import pandas as pd
+import requests
+import streamlit as st
+
+from cloudinary_assets import derived_url
+
+DOCUMENT_FOLDERS = {
+    "Bank Statement": "bank_statements",
+    "Cheques": "cheques",
+    "Profit and Loss Statement": "profit_loss_statements",
+    "Salary Slip": "salary_slips",
+}
+
+
+def prepare(url, session):
+    """
+    The app's download path: fetch the image, write it to a temp file, read it back and base64-encode it.
+
+    Returns:
+    str: Temp file path
+    int: Bytes downloaded
+    int: Bytes of base64 image data in the request body
+    float: Seconds spent
+    """
+    start = time.perf_counter()
+    content = session.get(url, timeout=(10, 30)).content
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".jpg") as temp_file:
+        temp_file.write(content)
+    with open(temp_file.name, "rb") as image_file:
+        encoded = base64.b64encode(image_file.read())
+    return temp_file.name, len(content), len(encoded), time.perf_counter() - start
+
+
+def run_benchmark(resources, document_type, processor=None):
+    """
+    Measure each delivery mode for every resource.
+
+    Returns:
+    pandas.DataFrame: One row per resource and mode with bytes downloaded, request body image bytes,
+    preparation seconds and, when a processor is given, model call seconds
+    """
+    session = requests.Session()
+    rows = []
+    for resource in resources:
+        derived = derived_url(resource["public_id"])
+        for mode in ("download", "derived", "url"):
+            if mode == "url":
+                image_path, downloaded, body, prepare_seconds = derived, 0, len(derived), 0.0
+            else:
+                url = resource["secure_url"] if mode == "download" else derived
+                image_path, downloaded, body, prepare_seconds = prepare(url, session)
+            row = {"public_id": resource["public_id"], "mode": mode, "downloaded_bytes": downloaded,
+                   "request_image_bytes": body, "prepare_seconds": prepare_seconds}
+            if processor is not None:
+                start = time.perf_counter()
+                df, _ = processor.extract_with_model(image_path, document_type)
+                row["model_seconds"] = time.perf_counter() - start
+                row["extracted"] = df is not None
+            rows.append(row)
+    return pd.DataFrame(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare Cloudinary delivery modes against downloading originals")
+    parser.add_argument("--doc-type", default="Bank Statement", choices=list(DOCUMENT_FOLDERS))
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--extract", action="store_true", help="Also time one model call per image and mode")
+    parser.add_argument("--output", default=None, help="Optional CSV with per-image results")
+    args = parser.parse_args()
+
+    cloudinary.config(
+        cloud_name=st.secrets["cloudinary"]["CLOUDINARY_CLOUD_NAME"],
+        api_key=st.secrets["cloudinary"]["CLOUDINARY_API_KEY"],
+        api_secret=st.secrets["cloudinary"]["CLOUDINARY_API_SECRET"]
+    )
+    resources = cloudinary.api.resources(
+        type="upload", prefix=f"financial_data/{DOCUMENT_FOLDERS[args.doc_type]}", max_results=args.limit
+    )["resources"]
+
+    processor = None
+    if args.extract:
+        from document_processor import DocumentProcessor
+        processor = DocumentProcessor()
+
+    results = run_benchmark(resources, args.doc_type, processor)
+    if args.output:
+        results.to_csv(args.output, index=False)
+    summary = results.groupby("mode", sort=False).mean(numeric_only=True)
+    print(summary.round(3).to_string())
+    baseline = summary.loc["download"]
+    for mode in ("derived", "url"):
+        line = (f"{mode}: {1 - summary.loc[mode, 'downloaded_bytes'] / baseline['downloaded_bytes']:.0%} less downloaded, "
+                f"{1 - summary.loc[mode, 'request_image_bytes'] / baseline['request_image_bytes']:.0%} smaller requests")
+        if "model_seconds" in summary:
+            total = summary.loc[mode, ["prepare_seconds", "model_seconds"]].sum()
+            line += f", {baseline[['prepare_seconds', 'model_seconds']].sum() - total:+.2f}s faster per document"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
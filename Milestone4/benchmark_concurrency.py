@@ -0,0 +1,158 @@
+import argparse
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pandas as pd
+from together import Together
+
+from concurrency import AdaptiveLimiter
+
+
+class FakeEndpoint:
+    """
+    Local stand-in for the chat completions API with a scripted latency curve.
+
+    Calls beyond ``capacity(progress)`` (progress runs 0 to 1 over ``duration``) queue up, so latency grows with the excess;
+    beyond ``throttle_at`` concurrent calls the endpoint answers 429.
+    """
+
+    def __init__(self, duration, base_latency=0.5, capacity=lambda progress: 8, throttle_at=None):
+        self.duration = duration
+        self.base_latency = base_latency
+        self.capacity = capacity
+        self.throttle_at = throttle_at
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.started = time.perf_counter()
+
+    def handle(self):
+        """Simulate one call; returns the HTTP status."""
+        with self.lock:
+            self.in_flight += 1
+            in_flight = self.in_flight
+        try:
+            if self.throttle_at is not None and in_flight > self.throttle_at:
+                return 429
+            capacity = self.capacity((time.perf_counter() - self.started) / self.duration)
+            time.sleep(self.base_latency * max(1.0, in_flight / capacity))
+            return 200
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+
+def make_handler(endpoint):
+    class FakeHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            status = endpoint.handle()
+            if status == 200:
+                body = {"id": "fake", "object": "chat.completion", "created": int(time.time()), "model": "fake",
+                        "choices": [{"index": 0, "finish_reason": "stop",
+                                     "message": {"role": "assistant", "content": "Balance: 1"}}],
+                        "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2}}
+            else:
+                body = {"error": {"message": "rate limited", "type": "rate_limit"}}
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    return FakeHandler
+
+
+SCENARIOS = {
+    # Steady endpoint that serves 8 calls at once: the limit should climb to about 8 and stay there
+    "flat": {"capacity": lambda progress: 8},
+    # Capacity drops from 8 to 3 halfway through: the limit should follow it down
+    "slowdown": {"capacity": lambda progress: 8 if progress < 0.5 else 3},
+    # Hard rate limit above 6 concurrent calls: the limit should settle at or below 6
+    "throttle": {"capacity": lambda progress: 16, "throttle_at": 6},
+}
+
+
+def run_scenario(name, duration=60.0, clients=24):
+    """
+    Drive an AdaptiveLimiter against the fake endpoint through the Together SDK.
+
+    Returns:
+    pandas.DataFrame: Limit, in-flight calls and completed calls sampled every 100 ms
+    dict: The limiter's final stats
+    """
+    endpoint = FakeEndpoint(duration, **SCENARIOS[name])
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(endpoint))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    client = Together(api_key="fake", base_url=f"http://127.0.0.1:{server.server_port}/v1", max_retries=0)
+    # Short windows keep the run brief; the calls are slow enough that client overhead does not hide queueing
+    limiter = AdaptiveLimiter(initial=2, max_limit=16, window=10)
+    stop = threading.Event()
+
+    def call_repeatedly():
+        while not stop.is_set():
+            try:
+                with limiter.slot():
+                    client.chat.completions.create(model="fake", messages=[{"role": "user", "content": "hi"}])
+            except Exception:
+                time.sleep(0.01)
+
+    threads = [threading.Thread(target=call_repeatedly, daemon=True) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    endpoint.started = start = time.perf_counter()
+    samples = []
+    while time.perf_counter() - start < duration:
+        time.sleep(0.1)
+        stats = limiter.stats()
+        samples.append({"elapsed": time.perf_counter() - start, "limit": stats["limit"],
+                        "in_flight": stats["in_flight"], "calls": stats["calls"]})
+    stop.set()
+    for thread in threads:
+        thread.join(timeout=5)
+    server.shutdown()
+    return pd.DataFrame(samples), limiter.stats()
+
+
+def check(name, samples, stats, duration):
+    """Whether the limiter behaved as the scenario expects."""
+    first = samples[(samples["elapsed"] >= 0.25 * duration) & (samples["elapsed"] < 0.5 * duration)]
+    second = samples[samples["elapsed"] >= 0.75 * duration]
+    if name == "flat":
+        return 6 <= second["limit"].median() <= 12
+    if name == "slowdown":
+        return second["limit"].median() < first["limit"].median() and second["limit"].median() <= 5
+    if name == "throttle":
+        return stats["throttled"] > 0 and second["limit"].median() <= 6
+    return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exercise the adaptive concurrency limiter against a fake endpoint")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--duration", type=float, default=60.0, help="Seconds per scenario")
+    args = parser.parse_args()
+
+    failed = False
+    for name in args.scenarios.split(","):
+        samples, stats = run_scenario(name, args.duration)
+        passed = check(name, samples, stats, args.duration)
+        failed |= not passed
+        throughput = stats["calls"] / args.duration
+        timeline = samples.iloc[::len(samples) // 10]["limit"].tolist()
+        print(f"{name}: {'PASS' if passed else 'FAIL'} - {throughput:.0f} calls/s, limit over time {timeline}, "
+              f"{stats['increases']} increases, {stats['decreases']} decreases, {stats['throttled']} throttled")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+import argparse
+import glob
+import os
+import time
+
+# Single requests are measured without the cascade or streaming so both modes use one model
+os.environ.setdefault("BFSI_CASCADE", "off")
+os.environ.setdefault("BFSI_STREAM", "0")
+
+from document_processor import DocumentProcessor
+from model_cascade import MODEL_PRICES
+from packing import PackedExtractor
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Milestone1", "1.  Web Scraping",
+                              "financial_data")
+CORPUS_FOLDERS = {"Cheques": "cheques", "Salary Slip": "salary_slips"}
+
+
+def run_single(processor, image_paths, document_type):
+    tokens, extracted = 0, 0
+    start = time.perf_counter()
+    for path in image_paths:
+        df, _ = processor.extract_with_model(path, document_type)
+        tokens += getattr(processor.last_usage(), "total_tokens", 0) or 0
+        extracted += df is not None
+    return time.perf_counter() - start, tokens, extracted
+
+
+def run_packed(processor, image_paths, document_type, pack_size):
+    packer = PackedExtractor(processor, pack_size=pack_size)
+    start = time.perf_counter()
+    results = packer.extract_many(image_paths, document_type)
+    elapsed = time.perf_counter() - start
+    return elapsed, packer.stats["tokens"], sum(df is not None for df, _, _ in results), packer.stats["fallbacks"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare packed and one-per-request extraction of small documents")
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS)
+    parser.add_argument("--limit", type=int, default=16, help="Documents per type")
+    parser.add_argument("--pack-size", type=int, default=4)
+    args = parser.parse_args()
+
+    processor = DocumentProcessor()
+    price = MODEL_PRICES.get(processor.model, 0.0)
+    for document_type, folder in CORPUS_FOLDERS.items():
+        image_paths = sorted(glob.glob(os.path.join(args.corpus, folder, "*.jpg")))[:args.limit]
+        if not image_paths:
+            print(f"No images found for {document_type}")
+            continue
+        count = len(image_paths)
+        single_seconds, single_tokens, single_ok = run_single(processor, image_paths, document_type)
+        packed_seconds, packed_tokens, packed_ok, fallbacks = run_packed(processor, image_paths, document_type,
+                                                                        args.pack_size)
+        print(f"{document_type} ({count} documents, packs of {args.pack_size}):")
+        print(f"  single: {count / single_seconds:.2f} docs/s, {single_tokens / count:.0f} tokens/doc, "
+              f"${single_tokens * price / 1e6 / count:.6f}/doc, {single_ok} extracted")
+        print(f"  packed: {count / packed_seconds:.2f} docs/s, {packed_tokens / count:.0f} tokens/doc, "
+              f"${packed_tokens * price / 1e6 / count:.6f}/doc, {packed_ok} extracted, {fallbacks} fell back")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+import os
+
+import cloudinary
+
+# How fetched Cloudinary images reach the model
+DELIVERY_MODES = {
+    "download": "Download originals",
+    "derived": "Download resized derived images",
+    "url": "Send signed URLs to the model",
+}
+DEFAULT_DELIVERY = os.getenv("BFSI_CLOUDINARY_DELIVERY", "download")
+DERIVED_MAX_WIDTH = int(os.getenv("BFSI_CLOUDINARY_WIDTH", "1600"))
+
+
+def derived_transformation(max_width=DERIVED_MAX_WIDTH, grayscale=True):
+    """Width-capped, automatically compressed transformation; grayscale drops colour the model does not need."""
+    transformation = {"width": max_width, "crop": "limit", "quality": "auto"}
+    if grayscale:
+        transformation["effect"] = "grayscale"
+    return transformation
+
+
+def derived_url(public_id, max_width=DERIVED_MAX_WIDTH, grayscale=True):
+    """
+    Signed delivery URL of a derived JPEG, generated and cached by Cloudinary on first request.
+
+    The signature stops anyone from requesting other transformations of the asset and keeps
+    working when strict transformations are enabled on the account.
+    """
+    return cloudinary.CloudinaryImage(public_id).build_url(
+        transformation=[derived_transformation(max_width, grayscale)], format="jpg", secure=True, sign_url=True
+    )
+
+
+def resource_hash(resource):
+    """Cache key for a stored asset without downloading it; a new version of the asset gets a new key."""
+    return f"cloudinary:{resource.get('asset_id') or resource['public_id']}:{resource.get('version', '')}"
+
+
+def thumbnail_url(public_id, width=320):
+    """Signed URL of a small WebP preview, so gallery thumbnails never pass through the app."""
+    return cloudinary.CloudinaryImage(public_id).build_url(
+        transformation=[{"width": width, "crop": "limit", "quality": "auto"}], format="webp", secure=True,
+        sign_url=True
+    )
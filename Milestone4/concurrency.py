@@ -0,0 +1,166 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+import requests
+
+try:
+    from together import error as together_error
+except ImportError:
+    together_error = None
+
+DEFAULT_LOG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "concurrency.jsonl")
+THROTTLE_STATUSES = (429, 503)
+
+
+def is_throttle(exception):
+    """True for errors that mean the endpoint is overloaded: rate limits, unavailability and timeouts."""
+    if isinstance(exception, (requests.exceptions.Timeout, TimeoutError)):
+        return True
+    if together_error is not None and isinstance(exception, (together_error.RateLimitError, together_error.Timeout,
+                                                              together_error.ServiceUnavailableError)):
+        return True
+    status = getattr(exception, "http_status", None) or getattr(getattr(exception, "response", None),
+                                                                 "status_code", None)
+    return status in THROTTLE_STATUSES
+
+
+class AdaptiveLimiter:
+    """
+    AIMD concurrency limit for model calls.
+
+    Every ``window`` completed calls, the limit grows by ``increase`` if the window used
+    the full limit, succeeded and kept its p95 latency within ``latency_tolerance`` of the
+    best recent p95. It is multiplied by ``decrease`` on a 429, a timeout, a failing
+    window or p95 growth. Calls admitted before a decrease are not counted afterwards, so one
+    overload cuts the limit once rather than once per call still in flight.
+    """
+
+    def __init__(self, initial=2, min_limit=1, max_limit=16, increase=1, decrease=0.5, window=20,
+                 latency_tolerance=1.5, min_success=0.95, log_path=None):
+        self.limit = initial
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.increase = increase
+        self.decrease = decrease
+        self.window = window
+        self.latency_tolerance = latency_tolerance
+        self.min_success = min_success
+        self.log_path = log_path
+        self.condition = threading.Condition()
+        self.in_flight = 0
+        self.saturated = False
+        self.latencies = []
+        self.failures = 0
+        self.generation = 0
+        self.recent_p95 = deque(maxlen=100)
+        self.decisions = deque(maxlen=500)
+        self.totals = {"calls": 0, "throttled": 0, "errors": 0, "increases": 0, "decreases": 0}
+
+    @classmethod
+    def from_env(cls, log_path=DEFAULT_LOG_PATH):
+        return cls(initial=int(os.getenv("BFSI_CONCURRENCY_INITIAL", "2")),
+                   min_limit=int(os.getenv("BFSI_CONCURRENCY_MIN", "1")),
+                   max_limit=int(os.getenv("BFSI_CONCURRENCY_MAX", "16")),
+                   log_path=log_path)
+
+    def acquire(self):
+        """Wait for a free slot; returns the generation the call was admitted in."""
+        with self.condition:
+            while self.in_flight >= self.limit:
+                self.condition.wait()
+            self.in_flight += 1
+            if self.in_flight >= self.limit:
+                self.saturated = True
+            return self.generation
+
+    def release(self, generation, latency, error=None):
+        """Return a slot and feed the call's outcome into the limit."""
+        with self.condition:
+            self.in_flight -= 1
+            self.totals["calls"] += 1
+            if error is not None:
+                self.totals["errors"] += 1
+                self.totals["throttled"] += is_throttle(error)
+            if generation == self.generation:
+                self.latencies.append(latency)
+                self.failures += error is not None
+                if error is not None and is_throttle(error):
+                    self.adjust(max(self.min_limit, int(self.limit * self.decrease)), type(error).__name__)
+                elif len(self.latencies) >= self.window:
+                    self.evaluate()
+            self.condition.notify_all()
+
+    def evaluate(self):
+        p95 = float(np.percentile(self.latencies, 95))
+        success = 1 - self.failures / len(self.latencies)
+        baseline = min(self.recent_p95) if self.recent_p95 else p95
+        if success < self.min_success:
+            self.adjust(max(self.min_limit, int(self.limit * self.decrease)), "errors", p95, baseline, success)
+        elif p95 > baseline * self.latency_tolerance:
+            self.adjust(max(self.min_limit, int(self.limit * self.decrease)), "latency", p95, baseline, success)
+        elif self.saturated and self.limit < self.max_limit:
+            self.adjust(min(self.max_limit, self.limit + self.increase), "increase", p95, baseline, success)
+        self.recent_p95.append(p95)
+        self.latencies, self.failures, self.saturated = [], 0, False
+
+    def adjust(self, limit, reason, p95=None, baseline=None, success=None):
+        if limit == self.limit:
+            return
+        self.totals["increases" if limit > self.limit else "decreases"] += 1
+        if limit < self.limit:
+            # Start a new generation: measurements of calls admitted under the old limit are stale
+            self.generation += 1
+            self.latencies, self.failures, self.saturated = [], 0, False
+        decision = {"time": time.time(), "pid": os.getpid(), "previous": self.limit, "limit": limit,
+                    "reason": reason, "p95_ms": p95 * 1000 if p95 is not None else None,
+                    "baseline_ms": baseline * 1000 if baseline is not None else None, "success_rate": success}
+        self.limit = limit
+        self.decisions.append(decision)
+        if self.log_path:
+            try:
+                os.makedirs(os.path.dirname(self.log_path), exist_ok=True)
+                with open(self.log_path, "a", encoding="utf-8") as log_file:
+                    log_file.write(json.dumps(decision) + "\n")
+            except OSError as e:
+                print(f"Could not record concurrency decision: {e}")
+
+    @contextmanager
+    def slot(self):
+        """Hold one unit of concurrency around a model call, timing it and classifying its failure."""
+        generation = self.acquire()
+        start = time.perf_counter()
+        error = None
+        try:
+            yield
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self.release(generation, time.perf_counter() - start, error)
+
+    def stats(self):
+        with self.condition:
+            return dict(self.totals, limit=self.limit, in_flight=self.in_flight,
+                        best_p95_ms=min(self.recent_p95) * 1000 if self.recent_p95 else None)
+
+
+def concurrency_summary(log_path=DEFAULT_LOG_PATH, since=None):
+    """
+    Limit decisions recorded by every process.
+
+    Returns:
+    pandas.DataFrame: One row per decision, oldest first
+    """
+    if not os.path.exists(log_path):
+        return pd.DataFrame()
+    with open(log_path, encoding="utf-8") as log_file:
+        decisions = pd.DataFrame([json.loads(line) for line in log_file if line.strip()])
+    if since is not None and not decisions.empty:
+        decisions = decisions[decisions["time"] >= since]
+    return decisions
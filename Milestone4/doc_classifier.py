@@ -0,0 +1,280 @@
+import json
+import os
+import re
+
+import numpy as np
+from PIL import Image
+
+try:
+    import pytesseract
+except ImportError:
+    pytesseract = None
+
+DOCUMENT_TYPES = {
+    "Bank Statement": "bank_statements",
+    "Cheques": "cheques",
+    "Profit and Loss Statement": "profit_loss_statements",
+    "Salary Slip": "salary_slips",
+    "Transaction History": "transaction_history",
+}
+
+KEYWORDS = {
+    "Bank Statement": ["statement period", "opening balance", "closing balance", "account summary",
+                       "account number", "beginning balance", "ending balance", "statement date"],
+    "Cheques": ["pay", "or bearer", "order of", "rupees", "dollars", "cheque", "check", "memo", "a/c payee",
+                "signature", "ifsc", "micr"],
+    "Profit and Loss Statement": ["revenue", "net income", "gross profit", "net profit", "cost of goods",
+                                  "operating expenses", "income statement", "profit and loss", "ebitda", "sales"],
+    "Salary Slip": ["payslip", "pay slip", "salary slip", "basic salary", "net pay", "gross salary", "deductions",
+                    "allowance", "employee", "hra", "provident fund", "earnings"],
+    "Transaction History": ["transaction history", "transaction id", "withdrawal", "deposit", "debit", "credit",
+                            "reference", "value date", "narration", "txn"],
+}
+
+# Document type of jobs submitted for auto-detection; the worker replaces it with the detected type
+AUTO_DETECT = "Auto-detect"
+
+# Confidence below which the vision model decides, when no calibrated threshold has been saved
+DEFAULT_MIN_CONFIDENCE = 0.6
+# Share of held-out images above the calibrated threshold that must be classified correctly
+TARGET_PRECISION = 0.95
+
+DEFAULT_MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "doc_classifier_centroids.json")
+DEFAULT_CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Milestone1", "1.  Web Scraping",
+                              "financial_data")
+
+
+def layout_features(image_path, size=16):
+    """Aspect ratio, ink density and a coarse ink map: enough to tell a cheque from a payslip."""
+    img = Image.open(image_path)
+    img.draft("L", (size * 8, size * 8))
+    img = img.convert("L")
+    aspect = np.log(img.width / img.height)
+    pixels = np.asarray(img.resize((size, size), Image.Resampling.BOX), dtype=np.float32) / 255.0
+    ink = 1.0 - pixels
+    return np.concatenate([[aspect * 4, ink.mean() * 4], ink.ravel()])
+
+
+def softmax(scores):
+    scores = np.asarray(scores, dtype=np.float64)
+    exp = np.exp(scores - scores.max(axis=-1, keepdims=True))
+    return exp / exp.sum(axis=-1, keepdims=True)
+
+
+def calibrate(features, labels, folds=4, target_precision=TARGET_PRECISION):
+    """
+    Fit the softmax temperature and confidence threshold on held-out images.
+
+    Each image is scored against centroids fitted without its fold. The temperature minimises
+    the held-out negative log-likelihood; the threshold is the lowest confidence above which
+    ``target_precision`` of the held-out predictions are correct.
+
+    Args:
+    features (numpy.ndarray): Layout features, one row per training image
+    labels (numpy.ndarray): Type index of each row
+
+    Returns:
+    float: Temperature
+    float: Minimum confidence; 1.0 when no threshold reaches the target, so the model decides every time
+    """
+    # Folds are assigned within each type so every fold holds out some images of every type
+    fold = np.zeros(len(labels), dtype=int)
+    for label in np.unique(labels):
+        fold[labels == label] = np.arange((labels == label).sum()) % folds
+    types = np.unique(labels)
+    distances = np.full((len(labels), len(types)), np.inf)
+    for k in range(folds):
+        held_out, rest = fold == k, fold != k
+        for column, label in enumerate(types):
+            if (rest & (labels == label)).any():
+                centroid = features[rest & (labels == label)].mean(axis=0)
+                distances[held_out, column] = np.linalg.norm(features[held_out] - centroid, axis=1)
+    truth = np.searchsorted(types, labels)
+    # Images whose type has no other training image cannot be held out
+    scored = np.isfinite(distances[np.arange(len(labels)), truth])
+    distances, truth = distances[scored], truth[scored]
+    if len(types) < 2 or len(truth) == 0:
+        return 1.0, DEFAULT_MIN_CONFIDENCE
+
+    scale = float(np.median(distances[np.isfinite(distances)]))
+    candidates = scale * np.geomspace(1e-3, 10, 200)
+    losses = [-np.log(softmax(-distances / t)[np.arange(len(truth)), truth] + 1e-12).mean() for t in candidates]
+    temperature = float(candidates[int(np.argmin(losses))])
+
+    probabilities = softmax(-distances / temperature)
+    confidence = probabilities.max(axis=1)
+    order = np.argsort(-confidence)
+    correct = probabilities.argmax(axis=1)[order] == truth[order]
+    precision = np.cumsum(correct) / np.arange(1, len(order) + 1)
+    reached = np.nonzero(precision >= target_precision)[0]
+    return temperature, float(confidence[order][reached[-1]]) if len(reached) else 1.0
+
+
+class DocumentClassifier:
+    """
+    Route documents to an extraction prompt from local keyword and layout features.
+
+    Keyword evidence comes from the PDF text layer, or from local OCR when pytesseract
+    and the Tesseract binary are installed; without them image uploads are classified
+    from layout alone. Layout evidence comes from a nearest-centroid model trained on
+    the financial_data folders. Documents below the confidence threshold calibrated at
+    training time are sent to the vision model.
+    """
+
+    def __init__(self, model_path=DEFAULT_MODEL_PATH, min_confidence=None, processor=None):
+        self.types = list(DOCUMENT_TYPES)
+        self.min_confidence = DEFAULT_MIN_CONFIDENCE if min_confidence is None else min_confidence
+        self.processor = processor
+        self.calibrated = False
+        self.centroids = None
+        if model_path and os.path.exists(model_path):
+            with open(model_path, encoding="utf-8") as model_file:
+                model = json.load(model_file)
+            # Types without training images get no centroid and no layout evidence
+            self.layout_types = [doc_type for doc_type in self.types if doc_type in model["centroids"]]
+            self.centroids = np.array([model["centroids"][doc_type] for doc_type in self.layout_types])
+            self.temperature = model["temperature"]
+            self.calibrated = "min_confidence" in model
+            if min_confidence is None and self.calibrated:
+                self.min_confidence = model["min_confidence"]
+
+    @classmethod
+    def train(cls, corpus_root, model_path=DEFAULT_MODEL_PATH):
+        """Fit per-type layout centroids from ``<corpus_root>/<folder>/*.jpg`` and calibrate them on held-out images."""
+        centroids, all_features, labels = {}, [], []
+        for label, (doc_type, folder) in enumerate(DOCUMENT_TYPES.items()):
+            folder_path = os.path.join(corpus_root, folder)
+            if not os.path.isdir(folder_path):
+                print(f"No training images for {doc_type}: {folder_path} does not exist")
+                continue
+            features = []
+            for name in sorted(os.listdir(folder_path)):
+                try:
+                    features.append(layout_features(os.path.join(folder_path, name)))
+                except Exception as e:
+                    print(f"Skipping {name}: {e}")
+            if not features:
+                continue
+            centroids[doc_type] = np.mean(features, axis=0).tolist()
+            all_features.extend(features)
+            labels.extend([label] * len(features))
+        if not centroids:
+            print(f"No training images found under {corpus_root}; classifying from keywords only")
+            return cls(None)
+
+        temperature, min_confidence = calibrate(np.array(all_features), np.array(labels))
+        print(f"Calibrated temperature {temperature:.3f}; documents below {min_confidence:.2f} confidence go to the model")
+        os.makedirs(os.path.dirname(model_path), exist_ok=True)
+        with open(model_path, "w", encoding="utf-8") as model_file:
+            json.dump({"centroids": centroids, "temperature": temperature, "min_confidence": min_confidence},
+                      model_file)
+        return cls(model_path)
+
+    def keyword_probabilities(self, text):
+        text = re.sub(r"\s+", " ", text.lower())
+        hits = [sum(1 for keyword in KEYWORDS[doc_type] if keyword in text) for doc_type in self.types]
+        if not any(hits):
+            return None
+        return softmax(np.array(hits, dtype=np.float64) * 1.5)
+
+    def layout_probabilities(self, image_path):
+        # A single trained type would win every comparison; remote images are never downloaded here
+        if self.centroids is None or len(self.layout_types) < 2 or str(image_path).startswith(("https://", "http://")):
+            return None
+        try:
+            features = layout_features(image_path)
+        except Exception as e:
+            # Remote URLs and unreadable files have no layout evidence
+            print(f"No layout features for {image_path}: {e}")
+            return None
+        distances = np.linalg.norm(self.centroids - features, axis=1)
+        probabilities = dict(zip(self.layout_types, softmax(-distances / self.temperature)))
+        return np.array([probabilities.get(doc_type, 0.0) for doc_type in self.types])
+
+    def local_text(self, image_path):
+        if pytesseract is None or str(image_path).startswith(("https://", "http://")):
+            return ""
+        try:
+            img = Image.open(image_path).convert("L")
+            img.thumbnail((1600, 1600))
+            return pytesseract.image_to_string(img)
+        except Exception as e:
+            print(f"Local OCR unavailable for classification: {e}")
+            return ""
+
+    def ask_model(self, image_path):
+        image_url = self.processor.image_url(image_path)
+        if not image_url:
+            return None
+        response = self.processor.create_completion(
+            model=self.processor.model,
+            messages=[
+                {
+                    "role": "user",
+                    "content": [
+                        {"type": "text", "text": "Which of these document types is this image? "
+                                                 f"{', '.join(self.types)}. Answer with the type name only."},
+                        {"type": "image_url", "image_url": {"url": image_url}}
+                    ]
+                }
+            ],
+            max_tokens=10,
+            temperature=0.0
+        )
+        answer = response.choices[0].message.content.lower()
+        return next((doc_type for doc_type in self.types if doc_type.lower() in answer
+                     or DOCUMENT_TYPES[doc_type].rstrip("s").replace("_", " ") in answer), None)
+
+    def classify(self, image_path, text=None):
+        """
+        Classify one document.
+
+        Args:
+        image_path (str): Image (or first PDF page) of the document
+        text (str): Text layer of the document if already known; local OCR is used otherwise
+
+        Returns:
+        str: Document type
+        float: Confidence of the local classifier
+        str: "local" or "model", depending on what decided the type
+        """
+        if text is None:
+            text = self.local_text(image_path)
+        evidence = [p for p in (self.keyword_probabilities(text or ""), self.layout_probabilities(image_path))
+                    if p is not None]
+        if evidence:
+            probabilities = np.mean(evidence, axis=0)
+            best = int(np.argmax(probabilities))
+            doc_type, confidence = self.types[best], float(probabilities[best])
+        else:
+            doc_type, confidence = self.types[0], 0.0
+
+        if confidence < self.min_confidence and self.processor is not None:
+            try:
+                model_type = self.ask_model(image_path)
+            except Exception as e:
+                print(f"Model classification failed: {e}")
+                model_type = None
+            if model_type is not None:
+                return model_type, confidence, "model"
+        return doc_type, confidence, "local"
+
+
+def load_classifier(processor=None, corpus_root=DEFAULT_CORPUS, model_path=DEFAULT_MODEL_PATH):
+    """The saved classifier, trained from the corpus first if no calibrated model has been saved yet."""
+    classifier = DocumentClassifier(model_path)
+    if not classifier.calibrated and os.path.isdir(corpus_root):
+        classifier = DocumentClassifier.train(corpus_root, model_path)
+    classifier.processor = processor
+    return classifier
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Train the layout centroids of the document classifier")
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS)
+    parser.add_argument("--output", default=DEFAULT_MODEL_PATH)
+    args = parser.parse_args()
+    DocumentClassifier.train(args.corpus, args.output)
+    print(f"Saved layout centroids to {args.output}")
@@ -1,16 +1,171 @@
 import streamlit as st
 import os
 import base64
+import hashlib
 import re
+import threading
+import time
 import pandas as pd
 import fitz
 from PIL import Image
-from together import Together
+from transport import get_client, cancel_stream
+from validators import EXPECTED_COUNT
+from single_flight import SingleFlight
+from concurrency import AdaptiveLimiter
+from types import SimpleNamespace
+from accounting import estimate_tokens, image_payload_bytes
+from preprocessing import ImagePreprocessor
+
+# Shared by every DocumentProcessor in the process, since main() builds a new one on each rerun
+extraction_flights = SingleFlight()
+# Every model call of the process shares one adaptive concurrency limit
+model_limiter = AdaptiveLimiter.from_env()
+
+def content_hash(image_path):
+    sha = hashlib.sha256()
+    with open(image_path, "rb") as image_file:
+        for chunk in iter(lambda: image_file.read(1 << 20), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+def is_remote(image_path):
+    """True for images the model fetches itself by URL, such as signed Cloudinary delivery URLs."""
+    return str(image_path).startswith(("https://", "http://"))
+
+PROMPTS = {
+    "Bank Statement": """Analyze this financial document carefully. Extract the most significant numeric financial parameters:
+    - Look for balance, credits, debits, and other key monetary values.
+    - Be flexible in parameter identification.
+    - Return ONLY 5 numeric values with clear labels, one per line.   
+
+    The output format should be:
+    Total Balance: 4900.50
+    Monthly Credits: 3200.75
+    Monthly Debits: 2800.25
+    Opening Balance: 4500.00
+    Closing Balance: 4900.50
+    Do not include any statements or additional text.""",
+
+    "Cheques": """Extract key details from the cheque:
+    - Focus on numeric values.
+    - Include cheque number, amount, date, and account details.
+    - Provide ONLY 5 clear, labeled values, one per line.
+
+    The output format should be:
+    Cheque Number: 123456
+    Amount: 5000.00
+    Date Timestamp: 1701907200
+    Bank Account: 9876
+    Transaction Value: 5000.00
+    Do not include any statements or additional text.""",
+
+    "Profit and Loss Statement": """Extract critical financial metrics from the Profit and Loss statement:
+    - Total Revenue
+    - Total Expenses
+    - Gross Profit
+    - Net Profit
+    - Operating Expenses
+    Return ONLY 5 clear, labeled numeric values, one per line.
+
+    The output format should be:
+    Total Revenue: 100000.00
+    Total Expenses: 75000.00
+    Gross Profit: 40000.00
+    Net Profit: 25000.00
+    Operating Expenses: 15000.00
+    Do not include any statements or additional text.""",
+
+    "Salary Slip": """Extract key salary details from the salary slip:
+    - Basic Salary
+    - Total Allowances
+    - Total Deductions
+    - Net Salary
+    - Gross Salary
+    Return ONLY 5 clear, labeled numeric values, one per line.
+
+    The output format should be:
+    Basic Salary: 27000.00
+    Total Allowances: 5000.00
+    Total Deductions: 5000.00
+    Net Salary: 27000.00
+    Gross Salary: 32000.00
+    Do not include any statements or additional text.""",
+
+    "Transaction History": """Extract summary transaction metrics from the transaction history:
+    - Total Number of Transactions
+    - Total Credits
+    - Total Debits
+    - Highest Single Transaction Amount
+    - Average Transaction Amount
+    Return ONLY 5 clear, labeled numeric values, one per line.
+
+    The output format should be:
+    Total Number of Transactions: 150
+    Total Credits: 50000.00
+    Total Debits: 30000.00
+    Highest Single Transaction Amount: 10000.00
+    Average Transaction Amount: 400.00
+    Do not include any statements or additional text."""
+
+}
+
+def parse_parameters(extracted_text):
+    """Parse "Label: value" lines from a model response into [parameter, value] pairs."""
+    parameters = []
+    for line in extracted_text.split('\n'):
+        parts = line.split(":", 1)
+        if len(parts) == 2:
+            try:
+                parameter = parts[0].strip().strip('*')
+                value_str = parts[1].strip()
+                
+                # More robust number cleaning
+                cleaned_value_str = re.sub(r"[^\d,-.]", "", value_str)
+                cleaned_value_str = cleaned_value_str.replace(',', '')  # Remove commas
+                
+                # Handle potential scientific notation or large numbers
+                try:
+                    value = float(cleaned_value_str)
+                except ValueError:
+                    value = cleaned_value_str
+                
+                parameters.append([parameter, value])
+                
+            except Exception as parse_error:
+                print(f"Error parsing parameter: {parse_error}")
+    return parameters
+
+def vision_preprocessor():
+    # Grayscale JPEG keeps the shading the vision model reads; binarizing only helps classic OCR
+    return ImagePreprocessor(binarize=False, max_side=1600, output_format="jpg")
 
 class DocumentProcessor:
-    def __init__(self):
+    def __init__(self, preprocessor=None, tiler=None, cascade=None, ledger=None):
         self.model = "meta-llama/Llama-3.2-11B-Vision-Instruct-Turbo"
-        self.client = Together(api_key=st.secrets["together"]["TOGETHER_API_KEY"])
+        # Shared per process: reruns reuse the pooled, pre-warmed connections
+        self.client = get_client(st.secrets["together"]["TOGETHER_API_KEY"])
+        if preprocessor is None and os.getenv("BFSI_PREPROCESS") == "1":
+            preprocessor = vision_preprocessor()
+        self.preprocessor = preprocessor
+        if tiler is None and os.getenv("BFSI_TILING") == "1":
+            from roi_tiling import RoiExtractor
+            tiler = RoiExtractor(self)
+        self.tiler = tiler
+        if cascade is None:
+            # Opt-in: escalating to larger models changes what a batch costs
+            from model_cascade import ModelCascade, configured_stages
+            if configured_stages():
+                cascade = ModelCascade(self)
+        self.cascade = cascade
+        # Stream completions and stop once every expected parameter has arrived
+        self.stream = os.getenv("BFSI_STREAM", "1") != "0"
+        self.calls = threading.local()  # Model, token usage and stream stats of the last call on each thread
+        if ledger is None:
+            from accounting import UsageLedger
+            ledger = UsageLedger()
+        self.ledger = ledger
+        # Batch, session and document type calls are charged to; a thread can override it via calls.context
+        self.usage_context = {}
 
     def encode_image(self, image_path):
         try:
@@ -25,137 +180,189 @@ class DocumentProcessor:
             st.error(f"Error encoding image: {e}")
             return None
 
-    def extract_parameters(self, image_path, document_type):
-        
+    def image_url(self, image_path):
+        """Value for a message's ``image_url``: remote URLs are passed through, local files are inlined."""
+        if is_remote(image_path):
+            return image_path
+        encoded_image = self.encode_image(image_path)
+        return f"data:image/jpeg;base64,{encoded_image}" if encoded_image else None
+
+    def extract_parameters(self, image_path, document_type, on_progress=None):
+        """
+        Extract the key parameters of a document.
+
+        Args:
+        image_path (str): Document image
+        document_type (str): Picks the extraction prompt
+        on_progress (callable): Called with the [parameter, value] pairs parsed so far while streaming
+        """
+
         # Validate image path
-        if not os.path.exists(image_path):
+        if not is_remote(image_path) and not os.path.exists(image_path):
             st.error(f"Image path does not exist: {image_path}")
             return None, "Image file not found"
 
-        encoded_image = self.encode_image(image_path)
+        # Concurrent requests for the same image and document type share one model call
+        key = (image_path if is_remote(image_path) else content_hash(image_path), document_type)
+        (df, extracted_text), shared = extraction_flights.do(
+            key, self._extract_parameters, image_path, document_type, on_progress
+        )
+        # Workers run in their own processes; the app reads their counts from disk
+        extraction_flights.publish()
+        if shared and df is not None:
+            df = df.copy()
+        return df, extracted_text
+
+    def _extract_parameters(self, image_path, document_type, on_progress=None):
+        if self.cascade is not None:
+            return self.cascade.extract(image_path, document_type, on_progress)
+        return self.extract_with_model(image_path, document_type, on_progress=on_progress)
+
+    def last_usage(self):
+        """Token usage reported for the last model call made on this thread, or None."""
+        return getattr(self.calls, "usage", None)
+
+    def last_model(self):
+        """Model (or cascade stage) that produced the last extraction on this thread, or None."""
+        return getattr(self.calls, "model", None)
+
+    def last_stream(self):
+        """Time to first parameter, completion tokens and early stop of the last streamed call on this thread, or None."""
+        return getattr(self.calls, "stream", None)
+
+    def usage_for(self):
+        """Accounting context of calls made on this thread."""
+        return getattr(self.calls, "context", None) or self.usage_context
+
+    def downgraded(self):
+        """True when the batch this thread works for is past its soft budget."""
+        return getattr(self.calls, "downgrade", False)
+
+    def record_usage(self, model, messages, usage, latency, estimated=False):
+        try:
+            self.ledger.record(
+                model, getattr(usage, "prompt_tokens", None), getattr(usage, "completion_tokens", None),
+                image_payload_bytes(messages), latency * 1000, self.usage_for(), estimated=estimated
+            )
+        except Exception as e:
+            print(f"Could not record model usage: {e}")
+
+    def create_completion(self, **kwargs):
+        """Model call admitted by the process-wide adaptive concurrency limit and charged to the usage ledger."""
+        start = time.perf_counter()
+        with model_limiter.slot():
+            response = self.client.chat.completions.create(**kwargs)
+        self.record_usage(kwargs["model"], kwargs["messages"], getattr(response, "usage", None),
+                          time.perf_counter() - start)
+        return response
+
+    def stream_completion(self, model, messages, on_progress=None, max_tokens=300):
+        """
+        Stream a completion, parsing "Label: value" lines as they arrive.
+
+        The stream is cancelled as soon as EXPECTED_COUNT numeric parameters have been read, so
+        trailing chatter is never generated. Lines without a number, such as a preamble ending in
+        a colon, neither count towards that nor reach ``on_progress``.
+        """
+        # The slot is held until the stream ends, so its latency covers the whole generation
+        with model_limiter.slot():
+            start = time.perf_counter()
+            stream = self.client.chat.completions.create(
+                model=model, messages=messages, max_tokens=max_tokens, temperature=0.3, stream=True
+            )
+            text, parameters, first_parameter_ms, stopped = "", [], None, False
+            self.calls.usage = None
+            try:
+                for chunk in stream:
+                    if chunk.usage:
+                        self.calls.usage = chunk.usage
+                    if not chunk.choices:
+                        continue
+                    text += chunk.choices[0].delta.content or ""
+                    # Only complete lines are parsed; the last one may still be growing
+                    parsed = [pair for pair in parse_parameters(text[:text.rfind("\n") + 1])
+                              if isinstance(pair[1], float)]
+                    if len(parsed) > len(parameters):
+                        parameters = parsed
+                        if first_parameter_ms is None:
+                            first_parameter_ms = (time.perf_counter() - start) * 1000
+                        if on_progress is not None:
+                            on_progress(parameters)
+                        if len(parameters) >= EXPECTED_COUNT:
+                            stopped = True
+                            text = text[:text.rfind("\n") + 1]
+                            break
+            finally:
+                if stopped:
+                    cancel_stream()
+                stream.close()
+                usage = getattr(self.calls, "usage", None)
+                estimated = getattr(usage, "prompt_tokens", None) is None
+                if estimated:
+                    # A stream cancelled early never receives its usage chunk. Charge the prompt size reported
+                    # for similar calls and the completion text that did arrive, and mark both as estimates
+                    prompt_tokens = self.ledger.typical_prompt_tokens(model, messages)
+                    usage = self.calls.usage = SimpleNamespace(
+                        prompt_tokens=prompt_tokens, completion_tokens=estimate_tokens(text),
+                        total_tokens=prompt_tokens + estimate_tokens(text), estimated=True
+                    )
+                self.record_usage(model, messages, usage, time.perf_counter() - start, estimated=estimated)
+
+        self.calls.stream = {
+            "first_parameter_ms": first_parameter_ms,
+            # Reported by the API, or estimated from the text received when the stream was cancelled
+            "completion_tokens": usage.completion_tokens,
+            "estimated": estimated,
+            "stopped_early": stopped,
+        }
+        return text.strip()
+
+    def extract_with_model(self, image_path, document_type, model=None, on_progress=None):
+        model = model or self.model
+        self.calls.usage = None
+        self.calls.stream = None
+        self.calls.model = model
+        tiler = None if self.downgraded() else self.tiler
+        if is_remote(image_path):
+            # Already a right-sized derived asset; the model endpoint downloads it directly
+            image_url = image_path
+        else:
+            if tiler is not None and tiler.should_tile(image_path):
+                # Dense pages are read region by region instead of being downsized by the model
+                return tiler.extract(image_path, document_type, model)
+            if self.preprocessor is not None:
+                # Deskewed, cropped pages cost fewer image tokens and lose fewer digits to downscaling
+                image_path = self.preprocessor.process(image_path)
+            image_url = self.image_url(image_path)
         
-        if not encoded_image:
+        if not image_url:
             st.error("Image could not be encoded")
             return None, "Image encoding failed"
         
-        prompts = {
-            "Bank Statement": """Analyze this financial document carefully. Extract the most significant numeric financial parameters:
-            - Look for balance, credits, debits, and other key monetary values.
-            - Be flexible in parameter identification.
-            - Return ONLY 5 numeric values with clear labels, one per line.   
-            
-            The output format should be:
-            Total Balance: 5000.50
-            Monthly Credits: 3200.75
-            Monthly Debits: 2800.25
-            Opening Balance: 4500.00
-            Closing Balance: 5200.75
-            Do not include any statements or additional text.""",
-            
-            "Cheques": """Extract key details from the cheque:
-            - Focus on numeric values.
-            - Include cheque number, amount, date, and account details.
-            - Provide ONLY 5 clear, labeled values, one per line.
-            
-            The output format should be:
-            Cheque Number: 123456
-            Amount: 5000.00
-            Date Timestamp: 1701907200
-            Bank Account: 9876
-            Transaction Value: 5000.00
-            Do not include any statements or additional text.""",
-            
-            "Profit and Loss Statement": """Extract critical financial metrics from the Profit and Loss statement:
-            - Total Revenue
-            - Total Expenses
-            - Gross Profit
-            - Net Profit
-            - Operating Expenses
-            Return ONLY 5 clear, labeled numeric values, one per line.
-            
-            The output format should be:
-            Total Revenue: 100000.00
-            Total Expenses: 75000.00
-            Gross Profit: 25000.00
-            Net Profit: 20000.00
-            Operating Expenses: 5000.00
-            Do not include any statements or additional text.""",
-            
-            "Salary Slip": """Extract key salary details from the salary slip:
-            - Basic Salary
-            - Total Allowances
-            - Total Deductions
-            - Net Salary
-            - Gross Salary
-            Return ONLY 5 clear, labeled numeric values, one per line.
-            
-            The output format should be:
-            Basic Salary: 30000.00
-            Total Allowances: 5000.00
-            Total Deductions: 2000.00
-            Net Salary: 27000.00
-            Gross Salary: 32000.00
-            Do not include any statements or additional text.""",
-
-            "Transaction History": """Extract summary transaction metrics from the transaction history:
-            - Total Number of Transactions
-            - Total Credits
-            - Total Debits
-            - Highest Single Transaction Amount
-            - Average Transaction Amount
-            Return ONLY 5 clear, labeled numeric values, one per line.
-            
-            The output format should be:
-            Total Number of Transactions: 150
-            Total Credits: 50000.00
-            Total Debits: 30000.00
-            Highest Single Transaction Amount: 10000.00
-            Average Transaction Amount: 400.00
-            Do not include any statements or additional text."""
 
-        }
+        messages = [
+            {
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": PROMPTS.get(document_type, "")},
+                    {"type": "image_url", "image_url": {"url": image_url}}
+                ]
+            }
+        ]
 
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {
-                        "role": "user",
-                        "content": [
-                            {"type": "text", "text": prompts.get(document_type, "")},
-                            {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{encoded_image}"}}
-                        ]
-                    }
-                ],
-                max_tokens=300,
-                temperature=0.3
-            )
-            
-            extracted_text = response.choices[0].message.content.strip()
-            
-            # Robust parameter extraction
-            parameters = []
-            for line in extracted_text.split('\n'):
-                parts = line.split(":", 1)
-                if len(parts) == 2:
-                    try:
-                        parameter = parts[0].strip().strip('*')
-                        value_str = parts[1].strip()
-                        
-                        # More robust number cleaning
-                        cleaned_value_str = re.sub(r"[^\d,-.]", "", value_str)
-                        cleaned_value_str = cleaned_value_str.replace(',', '')  # Remove commas
-                        
-                        # Handle potential scientific notation or large numbers
-                        try:
-                            value = float(cleaned_value_str)
-                        except ValueError:
-                            value = cleaned_value_str
-                        
-                        parameters.append([parameter, value])
-                        
-                    except Exception as parse_error:
-                        print(f"Error parsing parameter: {parse_error}")
+            if self.stream:
+                extracted_text = self.stream_completion(model, messages, on_progress)
+            else:
+                response = self.create_completion(
+                    model=model,
+                    messages=messages,
+                    max_tokens=300,
+                    temperature=0.3
+                )
+                self.calls.usage = getattr(response, "usage", None)
+                extracted_text = response.choices[0].message.content.strip()
+            parameters = parse_parameters(extracted_text)
             
             if not parameters:
                 st.warning(f"No parameters found in text: {extracted_text}")
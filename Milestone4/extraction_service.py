@@ -0,0 +1,305 @@
+import argparse
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import OrderedDict, defaultdict
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+
+from document_processor import content_hash
+from single_flight import SingleFlight
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "service")
+HASH_PATTERN = re.compile(r"[0-9a-f]{64}")
+
+
+class BlobCache:
+    """
+    Content-addressed image cache on disk, shared by every user of the service.
+
+    Each blob is charged to the user who first stored it. A user going over their quota
+    has their own least recently used blobs deleted, except those a running extraction is
+    reading; a client that needs a deleted blob again simply uploads it again.
+    """
+
+    def __init__(self, cache_dir, user_quota_bytes=64 << 20):
+        self.cache_dir = os.path.join(cache_dir, "blobs")
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.user_quota_bytes = user_quota_bytes
+        self.owners = {}  # content hash -> owner
+        self.owned = defaultdict(OrderedDict)  # owner -> content hash -> size, least recently used first
+        self.usage = defaultdict(int)
+        self.readers = defaultdict(int)
+        self.lock = threading.Lock()
+
+    def path(self, content_hash):
+        return os.path.join(self.cache_dir, content_hash)
+
+    def __contains__(self, content_hash):
+        return os.path.exists(self.path(content_hash))
+
+    def put(self, content_hash, data, owner):
+        # Blobs are shared across users, so one stored under another image's hash would poison its extractions
+        if hashlib.sha256(data).hexdigest() != content_hash:
+            raise ValueError("body does not match its content hash")
+        if content_hash not in self:
+            temp_path = f"{self.path(content_hash)}.{threading.get_ident()}.tmp"
+            with open(temp_path, "wb") as blob_file:
+                blob_file.write(data)
+            os.replace(temp_path, self.path(content_hash))
+
+        with self.lock:
+            if content_hash in self.owners:
+                self._touch(content_hash)
+                return
+            self.owners[content_hash] = owner
+            self.owned[owner][content_hash] = len(data)
+            self.usage[owner] += len(data)
+            self._enforce_quota(owner, keep=content_hash)
+
+    def _touch(self, content_hash):
+        owner = self.owners.get(content_hash)
+        if owner is not None:
+            self.owned[owner].move_to_end(content_hash)
+
+    @contextmanager
+    def reading(self, content_hash):
+        """Keep a blob on disk while an extraction reads it."""
+        with self.lock:
+            self.readers[content_hash] += 1
+            self._touch(content_hash)
+        try:
+            yield self.path(content_hash)
+        finally:
+            with self.lock:
+                self.readers[content_hash] -= 1
+                if not self.readers[content_hash]:
+                    del self.readers[content_hash]
+
+    def _enforce_quota(self, owner, keep=None):
+        for content_hash, size in list(self.owned[owner].items()):
+            if self.usage[owner] <= self.user_quota_bytes:
+                break
+            if content_hash == keep or self.readers.get(content_hash):
+                continue
+            try:
+                os.remove(self.path(content_hash))
+            except FileNotFoundError:
+                pass
+            del self.owned[owner][content_hash]
+            del self.owners[content_hash]
+            self.usage[owner] -= size
+
+    def disk_usage(self):
+        with self.lock:
+            return dict(self.usage)
+
+
+class ExtractionService:
+    """
+    Shared extraction core: one model client, one result cache and one blob cache for all users.
+
+    Identical (content hash, document type) requests that arrive while the first one is
+    still being extracted wait for that extraction instead of calling the model again.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, user_quota_bytes=64 << 20, max_results=5000, processor=None):
+        if processor is None:
+            from document_processor import DocumentProcessor
+            processor = DocumentProcessor()
+        self.processor = processor
+        self.blobs = BlobCache(cache_dir, user_quota_bytes)
+        self.user_quota_bytes = user_quota_bytes
+        self.results = OrderedDict()
+        self.max_results = max_results
+        self.flights = SingleFlight()
+        self.inflight_bytes = defaultdict(int)
+        self.lock = threading.Lock()
+        self.stats = defaultdict(int)
+
+    def reserve(self, user, size):
+        """Refuse a request body that would push a user's in-flight bytes past their quota."""
+        with self.lock:
+            if self.inflight_bytes[user] + size > self.user_quota_bytes:
+                self.stats["quota_rejections"] += 1
+                return False
+            self.inflight_bytes[user] += size
+            return True
+
+    def release(self, user, size):
+        with self.lock:
+            self.inflight_bytes[user] -= size
+
+    def extract(self, content_hash, doc_type):
+        key = (content_hash, doc_type)
+        with self.lock:
+            self.stats["requests"] += 1
+            if key in self.results:
+                self.results.move_to_end(key)
+                self.stats["result_cache_hits"] += 1
+                return self.results[key]
+        result, _ = self.flights.do(key, self._extract_uncached, key)
+        return result
+
+    def _extract_uncached(self, key):
+        content_hash, doc_type = key
+        try:
+            with self.blobs.reading(content_hash) as blob_path:
+                df, extracted_text = self.processor.extract_parameters(blob_path, doc_type)
+        except Exception as e:
+            return {"parameters": None, "extracted_text": str(e)}
+
+        result = {
+            "parameters": df[["Parameter", "Value"]].values.tolist() if df is not None else None,
+            "extracted_text": extracted_text,
+        }
+        if df is not None:
+            with self.lock:
+                self.results[key] = result
+                if len(self.results) > self.max_results:
+                    self.results.popitem(last=False)
+        return result
+
+    def snapshot(self):
+        with self.lock:
+            stats = dict(self.stats)
+            stats["cached_results"] = len(self.results)
+        flights = self.flights.stats()
+        stats["model_calls"] = flights["executions"]
+        stats["coalesced"] = flights["saved"]
+        stats["inflight"] = flights["inflight"]
+        stats["blob_bytes_by_user"] = self.blobs.disk_usage()
+        return stats
+
+
+def make_handler(service):
+    class ServiceHandler(BaseHTTPRequestHandler):
+        # HTTP/1.1 keeps client connections alive between requests
+        protocol_version = "HTTP/1.1"
+
+        def send_json(self, status, payload):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def read_body(self, user):
+            size = int(self.headers.get("Content-Length", 0))
+            if not service.reserve(user, size):
+                self.rfile.read(size)
+                self.send_json(429, {"error": "per-user memory quota exceeded"})
+                return None, size
+            return self.rfile.read(size), size
+
+        def do_GET(self):
+            if self.path == "/stats":
+                self.send_json(200, service.snapshot())
+            else:
+                self.send_json(404, {"error": "not found"})
+
+        def do_PUT(self):
+            user = self.headers.get("X-User", "anonymous")
+            if not self.path.startswith("/blobs/"):
+                self.send_json(404, {"error": "not found"})
+                return
+            blob_hash = self.path.rsplit("/", 1)[-1]
+            if not HASH_PATTERN.fullmatch(blob_hash):
+                self.send_json(400, {"error": "invalid content hash"})
+                return
+            data, size = self.read_body(user)
+            if data is None:
+                return
+            try:
+                service.blobs.put(blob_hash, data, user)
+                self.send_json(201, {"stored": True})
+            except ValueError as e:
+                self.send_json(400, {"error": str(e)})
+            finally:
+                service.release(user, size)
+
+        def do_POST(self):
+            user = self.headers.get("X-User", "anonymous")
+            if self.path != "/extract":
+                self.send_json(404, {"error": "not found"})
+                return
+            data, size = self.read_body(user)
+            if data is None:
+                return
+            try:
+                request = json.loads(data)
+                if not HASH_PATTERN.fullmatch(str(request.get("content_hash"))) or "doc_type" not in request:
+                    self.send_json(400, {"error": "content_hash and doc_type are required"})
+                    return
+                if request["content_hash"] not in service.blobs:
+                    self.send_json(404, {"error": "blob not found"})
+                    return
+                self.send_json(200, service.extract(request["content_hash"], request["doc_type"]))
+            finally:
+                service.release(user, size)
+
+        def log_message(self, format, *args):
+            pass
+
+    return ServiceHandler
+
+
+class ExtractionServiceClient:
+    """Drop-in replacement for ``DocumentProcessor.extract_parameters`` backed by the shared service."""
+
+    def __init__(self, base_url, user="anonymous", pool_size=8, timeout=(5, 120)):
+        self.base_url = base_url.rstrip("/")
+        self.user = user
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers["X-User"] = user
+
+    def extract_parameters(self, image_path, document_type, on_progress=None):
+        # Partial results are not forwarded by the service; on_progress is accepted for interface parity
+        image_hash = content_hash(image_path)
+        request = {"content_hash": image_hash, "doc_type": document_type}
+        try:
+            response = self.session.post(f"{self.base_url}/extract", json=request, timeout=self.timeout)
+            if response.status_code == 404:
+                # Only upload bytes the shared blob cache has never seen
+                with open(image_path, "rb") as image_file:
+                    upload = self.session.put(f"{self.base_url}/blobs/{image_hash}", data=image_file.read(),
+                                              timeout=self.timeout)
+                upload.raise_for_status()
+                response = self.session.post(f"{self.base_url}/extract", json=request, timeout=self.timeout)
+            response.raise_for_status()
+        except requests.exceptions.RequestException as e:
+            return None, f"Extraction service error: {e}"
+
+        result = response.json()
+        if result["parameters"] is None:
+            return None, result["extracted_text"]
+        return pd.DataFrame(result["parameters"], columns=["Parameter", "Value"]), result["extracted_text"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Shared extraction service for multi-user deployments")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR)
+    parser.add_argument("--user-quota-mb", type=int, default=64)
+    args = parser.parse_args()
+
+    service = ExtractionService(cache_dir=args.cache_dir, user_quota_bytes=args.user_quota_mb << 20)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(service))
+    print(f"Extraction service listening on http://{args.host}:{args.port}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
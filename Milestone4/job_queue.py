@@ -0,0 +1,469 @@
+import json
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+
+import pandas as pd
+
+DEFAULT_DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "jobs.db")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    batch_id TEXT NOT NULL,
+    document TEXT NOT NULL,
+    image_path TEXT NOT NULL,
+    doc_type TEXT NOT NULL,
+    content_hash TEXT NOT NULL,
+    owner TEXT,
+    source TEXT,
+    status TEXT NOT NULL DEFAULT 'queued',
+    parameters TEXT,
+    partial TEXT,
+    classification TEXT,
+    duplicate_of TEXT,
+    extracted_text TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_batch ON jobs (batch_id);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, id);
+CREATE INDEX IF NOT EXISTS idx_jobs_result ON jobs (content_hash, doc_type, status);
+"""
+
+FINISHED_STATUSES = ("done", "failed", "cancelled")
+
+
+class JobQueue:
+    """
+    Persistent SQLite-backed extraction queue shared by the Streamlit app and its workers.
+
+    Jobs survive reruns, disconnects and restarts; finished extractions are looked up
+    by content hash and document type so the same image is never extracted twice.
+    """
+
+    def __init__(self, db_path=DEFAULT_DB_PATH):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+            for column in ("owner", "source", "partial", "classification", "duplicate_of"):
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} TEXT")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.row_factory = sqlite3.Row
+            yield conn
+        finally:
+            conn.close()
+
+    def cached_result(self, content_hash, doc_type):
+        with self._connect() as conn:
+            return conn.execute(
+                "SELECT parameters, extracted_text FROM jobs "
+                "WHERE content_hash = ? AND doc_type = ? AND status = 'done' "
+                # Results once copied from a look-alike image are not this image's extraction
+                "AND source IS NOT 'near-duplicate' ORDER BY id DESC LIMIT 1",
+                (content_hash, doc_type)
+            ).fetchone()
+
+    def submit(self, items, batch_id=None, owner=None, near_duplicates=None, use_cache=True):
+        """
+        Queue a batch of documents.
+
+        Args:
+        items (list): (document name, image path, content hash, document type) tuples; the
+            document type picks the extraction prompt, so one batch may mix types. Jobs of type
+            ``AUTO_DETECT`` are classified by the worker that runs them
+        owner (str): Session that submitted the batch, forwarded to the shared service
+        near_duplicates (dict): Content hash -> content hash of a perceptually similar earlier image; the
+            pair is only flagged, since same-template documents with different figures look alike
+        use_cache (bool): Reuse finished extractions of the same image; off to force re-extraction
+
+        Returns:
+        str: Batch id used to poll, collect and cancel the batch
+        """
+        batch_id = batch_id or uuid.uuid4().hex
+        near_duplicates = near_duplicates or {}
+        now = time.time()
+        with self._connect() as conn:
+            for document, image_path, image_hash, doc_type in items:
+                cached = self.cached_result(image_hash, doc_type) if use_cache else None
+                duplicate_of = near_duplicates.get(image_hash)
+                if cached is not None:
+                    # Reuse a finished extraction of the exact same image from an earlier rerun or browser session
+                    conn.execute(
+                        "INSERT INTO jobs (batch_id, document, image_path, doc_type, content_hash, owner, status, source, "
+                        "parameters, extracted_text, duplicate_of, created_at, updated_at) "
+                        "VALUES (?, ?, ?, ?, ?, ?, 'done', 'cache', ?, ?, ?, ?, ?)",
+                        (batch_id, document, image_path, doc_type, image_hash, owner,
+                         cached["parameters"], cached["extracted_text"], duplicate_of, now, now)
+                    )
+                else:
+                    conn.execute(
+                        "INSERT INTO jobs (batch_id, document, image_path, doc_type, content_hash, owner, duplicate_of, "
+                        "created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (batch_id, document, image_path, doc_type, image_hash, owner, duplicate_of, now, now)
+                    )
+        return batch_id
+
+    def claim(self):
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            # Skip duplicates of an image already being extracted; they are completed with its result
+            row = conn.execute(
+                "SELECT * FROM jobs AS queued WHERE status = 'queued' AND NOT EXISTS ("
+                "SELECT 1 FROM jobs AS running WHERE running.status = 'running' "
+                "AND running.content_hash = queued.content_hash AND running.doc_type = queued.doc_type"
+                ") ORDER BY id LIMIT 1"
+            ).fetchone()
+            if row is not None:
+                conn.execute("UPDATE jobs SET status = 'running', updated_at = ? WHERE id = ?", (time.time(), row["id"]))
+            conn.execute("COMMIT")
+            return row
+
+    def claim_similar(self, batch_id, doc_type, exclude_hash, limit):
+        """Claim up to ``limit`` more queued jobs of ``doc_type`` in the batch so they can share one packed request."""
+        if limit <= 0:
+            return []
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            rows = conn.execute(
+                "SELECT *, MIN(id) FROM jobs AS queued WHERE status = 'queued' AND batch_id = ? AND doc_type = ? "
+                "AND content_hash != ? "
+                "AND NOT EXISTS (SELECT 1 FROM jobs AS running WHERE running.status = 'running' "
+                "AND running.content_hash = queued.content_hash AND running.doc_type = queued.doc_type"
+                ") GROUP BY content_hash ORDER BY id LIMIT ?",
+                (batch_id, doc_type, exclude_hash, limit)
+            ).fetchall()
+            now = time.time()
+            conn.executemany("UPDATE jobs SET status = 'running', updated_at = ? WHERE id = ?",
+                             [(now, row["id"]) for row in rows])
+            conn.execute("COMMIT")
+            return rows
+
+    def complete(self, job_id, df, extracted_text):
+        parameters = json.dumps(df[["Parameter", "Value"]].values.tolist()) if df is not None else None
+        status = "done" if parameters is not None else "failed"
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            # A job cancelled while its model call was in flight stays cancelled
+            conn.execute(
+                "UPDATE jobs SET status = ?, source = 'model', parameters = ?, extracted_text = ?, error = ?, "
+                "updated_at = ? WHERE id = ? AND status = 'running'",
+                (status, parameters, extracted_text, None if parameters else extracted_text, now, job_id)
+            )
+            if parameters is not None:
+                # Coalesce queued duplicates of the same image onto this result
+                conn.execute(
+                    "UPDATE jobs SET status = 'done', source = 'coalesced', parameters = ?, extracted_text = ?, "
+                    "updated_at = ? WHERE status = 'queued' AND (content_hash, doc_type) = "
+                    "(SELECT content_hash, doc_type FROM jobs WHERE id = ?)",
+                    (parameters, extracted_text, now, job_id)
+                )
+            conn.execute("COMMIT")
+
+    def set_doc_type(self, job_id, doc_type, classification):
+        """Record the type the worker detected for an auto-detect job and how it was decided."""
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET doc_type = ?, classification = ?, updated_at = ? WHERE id = ?",
+                (doc_type, json.dumps(classification), time.time(), job_id)
+            )
+
+    def reuse(self, job_id, cached):
+        """Complete a running job with an earlier extraction of the same image and type."""
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'done', source = 'cache', parameters = ?, extracted_text = ?, "
+                "updated_at = ? WHERE id = ? AND status = 'running'",
+                (cached["parameters"], cached["extracted_text"], time.time(), job_id)
+            )
+
+    def update_partial(self, job_id, parameters):
+        """Store the parameters streamed so far for a running job."""
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET partial = ?, updated_at = ? WHERE id = ? AND status = 'running'",
+                (json.dumps(parameters), time.time(), job_id)
+            )
+
+    def partial_results(self, batch_id):
+        """Documents of a batch still being extracted, with the parameters that have already arrived."""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT document, partial FROM jobs WHERE batch_id = ? AND status = 'running' AND partial IS NOT NULL",
+                (batch_id,)
+            ).fetchall()
+        return [(row["document"], json.loads(row["partial"])) for row in rows]
+
+    def fail(self, job_id, error):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'failed', error = ?, updated_at = ? WHERE id = ? AND status = 'running'",
+                (str(error), time.time(), job_id)
+            )
+
+    def cancel(self, batch_id):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'cancelled', updated_at = ? WHERE batch_id = ? "
+                "AND status IN ('queued', 'running', 'paused')",
+                (time.time(), batch_id)
+            )
+
+    def pause(self, batch_id, job_id=None):
+        """Hold a batch's queued jobs (and the claimed ``job_id``); workers skip them until ``resume``."""
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'paused', partial = NULL, updated_at = ? "
+                "WHERE batch_id = ? AND (status = 'queued' OR id = ?)",
+                (time.time(), batch_id, job_id)
+            )
+
+    def resume(self, batch_id):
+        with self._connect() as conn:
+            conn.execute("UPDATE jobs SET status = 'queued', updated_at = ? WHERE batch_id = ? AND status = 'paused'",
+                         (time.time(), batch_id))
+
+    def referenced_paths(self, prefix, grace_seconds=600):
+        """
+        Image paths under ``prefix`` that workers may still read.
+
+        Covers queued, running and paused jobs, and jobs cancelled within ``grace_seconds``,
+        whose model call can still be in flight.
+        """
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT DISTINCT image_path FROM jobs WHERE substr(image_path, 1, ?) = ? AND "
+                "(status IN ('queued', 'running', 'paused') OR (status = 'cancelled' AND updated_at > ?))",
+                (len(prefix), prefix, time.time() - grace_seconds)
+            ).fetchall()
+        return [row["image_path"] for row in rows]
+
+    def image_paths(self, content_hashes):
+        """
+        Most recent image of each content hash that can still be sent to the model.
+
+        Returns:
+        dict: Content hash -> local file that still exists or remote URL; hashes with neither are left out
+        """
+        content_hashes = list(content_hashes)
+        found = {}
+        with self._connect() as conn:
+            # Stay under SQLite's bound-parameter limit
+            for start in range(0, len(content_hashes), 500):
+                chunk = content_hashes[start:start + 500]
+                rows = conn.execute(
+                    f"SELECT content_hash, image_path FROM jobs WHERE content_hash IN ({', '.join('?' * len(chunk))}) "
+                    "ORDER BY id DESC", chunk
+                )
+                for row in rows:
+                    path = row["image_path"]
+                    if row["content_hash"] not in found and (path.startswith(("https://", "http://"))
+                                                             or os.path.exists(path)):
+                        found[row["content_hash"]] = path
+        return found
+
+    def requeue_stale(self):
+        """Return jobs left 'running' by a worker that died to the queue."""
+        with self._connect() as conn:
+            conn.execute("UPDATE jobs SET status = 'queued', updated_at = ? WHERE status = 'running'", (time.time(),))
+
+    def progress(self, batch_id):
+        with self._connect() as conn:
+            rows = conn.execute("SELECT status, COUNT(*) AS n FROM jobs WHERE batch_id = ? GROUP BY status", (batch_id,))
+            counts = {row["status"]: row["n"] for row in rows}
+        counts["total"] = sum(counts.values())
+        counts["finished"] = sum(counts.get(status, 0) for status in FINISHED_STATUSES)
+        counts["saved_calls"] = self.saved_calls(batch_id)
+        return counts
+
+    def saved_calls(self, batch_id=None):
+        """Jobs answered from an earlier result or a concurrent duplicate instead of a model call."""
+        query = "SELECT COUNT(*) FROM jobs WHERE source IN ('cache', 'coalesced', 'near-duplicate')"
+        with self._connect() as conn:
+            if batch_id is None:
+                return conn.execute(query).fetchone()[0]
+            return conn.execute(query + " AND batch_id = ?", (batch_id,)).fetchone()[0]
+
+    def results(self, batch_id, exclude_ids=()):
+        """Finished jobs of a batch as dicts with a ``df`` ready for ``processed_dfs``."""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT *, (SELECT twin.document FROM jobs AS twin WHERE twin.content_hash = jobs.duplicate_of "
+                "ORDER BY twin.id DESC LIMIT 1) AS duplicate_document "
+                "FROM jobs WHERE batch_id = ? AND status IN ('done', 'failed') ORDER BY id", (batch_id,)
+            ).fetchall()
+
+        results = []
+        for row in rows:
+            if row["id"] in exclude_ids:
+                continue
+            df = None
+            if row["parameters"]:
+                df = pd.DataFrame(json.loads(row["parameters"]), columns=["Parameter", "Value"])
+            results.append({
+                "id": row["id"],
+                "document": row["document"],
+                "image_path": row["image_path"],
+                "content_hash": row["content_hash"],
+                "doc_type": row["doc_type"],
+                "classification": json.loads(row["classification"]) if row["classification"] else None,
+                "duplicate_of": row["duplicate_document"] or row["duplicate_of"],
+                "df": df,
+                "extracted_text": row["extracted_text"],
+                "error": row["error"],
+            })
+        return results
+
+    def start_workers(self, count=2, poll_interval=0.5):
+        self.requeue_stale()
+        context = multiprocessing.get_context("spawn")
+        workers = []
+        for _ in range(count):
+            worker = context.Process(target=worker_loop, args=(self.db_path, poll_interval), daemon=True)
+            worker.start()
+            workers.append(worker)
+        return workers
+
+
+def worker_loop(db_path, poll_interval=0.5):
+    from analytics import extract_entity, extract_period
+    from doc_classifier import AUTO_DETECT, DOCUMENT_TYPES, load_classifier
+    from model_cascade import document_text
+    from results_store import ResultsStore
+    queue = JobQueue(db_path)
+    store = ResultsStore()
+    service_url = os.getenv("BFSI_SERVICE_URL")
+    if service_url:
+        # Server mode: extraction, caching and deduplication happen in the shared service
+        from concurrency import AdaptiveLimiter
+        from extraction_service import ExtractionServiceClient
+        clients = {}
+        processor_for = lambda owner: clients.setdefault(owner, ExtractionServiceClient(service_url, user=owner or "anonymous"))
+        limiter = AdaptiveLimiter.from_env()
+    else:
+        from document_processor import DocumentProcessor, model_limiter as limiter
+        processor = DocumentProcessor()
+        processor_for = lambda owner: processor
+
+    classifier_lock = threading.Lock()
+    classifiers = []
+
+    def classify(job):
+        """
+        Detect the type of an auto-detect job.
+
+        Returns:
+        dict: The job with its detected type, or None when an earlier extraction answered it
+        """
+        with classifier_lock:
+            if not classifiers:
+                # Trained from the corpus on first use, in the worker rather than the app
+                classifiers.append(load_classifier(None if service_url else processor))
+        try:
+            doc_type, confidence, method = classifiers[0].classify(job["image_path"], document_text(job["image_path"]))
+        except Exception as e:
+            print(f"Classification failed for {job['document']}: {e}")
+            doc_type, confidence, method = next(iter(DOCUMENT_TYPES)), 0.0, "fallback"
+        queue.set_doc_type(job["id"], doc_type, {"confidence": round(confidence, 2), "method": method})
+        cached = queue.cached_result(job["content_hash"], doc_type)
+        if cached is not None:
+            queue.reuse(job["id"], cached)
+            return None
+        return dict(job, doc_type=doc_type)
+
+    pack_size = int(os.getenv("BFSI_PACK", "1"))
+    packer = None
+    if pack_size > 1 and not service_url:
+        from packing import PACKABLE_TYPES, PackedExtractor
+        packer = PackedExtractor(processor, pack_size=pack_size)
+
+    def finish(job, extractor, df, extracted_text, latency_ms, model=None):
+        queue.complete(job["id"], df, extracted_text)
+        if df is not None:
+            # History outlives the job queue's batches and the browser session
+            if model is None and hasattr(extractor, "last_model"):
+                model = extractor.last_model()
+            # The account or employee and the month covered come from the document's own text: the PDF
+            # text layer, or the OCR text the cascade's local stage already read; never a second OCR pass
+            text = f"{document_text(job['image_path'], ocr=False)}\n{extracted_text}"
+            store.record(job["content_hash"], job["document"], job["doc_type"], df, extracted_text,
+                         model=model, latency_ms=latency_ms, owner=job["owner"],
+                         entity_key=extract_entity(text), period=extract_period(text))
+
+    def run(job):
+        if not service_url:
+            budget = processor.ledger.budget_state(job["batch_id"])
+            if budget["state"] == "hard":
+                # Stop spending until the budget is raised and the batch resumed
+                queue.pause(job["batch_id"], job["id"])
+                return
+            # Calls on this thread are charged to the job's batch; past the soft budget they are downgraded
+            processor.calls.context = {"batch_id": job["batch_id"], "session_id": job["owner"],
+                                       "doc_type": job["doc_type"], "purpose": "extraction"}
+            processor.calls.downgrade = budget["state"] == "soft"
+        if job["doc_type"] == AUTO_DETECT:
+            job = classify(job)
+            if job is None:
+                return
+            if not service_url:
+                processor.calls.context["doc_type"] = job["doc_type"]
+        if packer is not None and job["doc_type"] in PACKABLE_TYPES:
+            jobs = [job] + queue.claim_similar(job["batch_id"], job["doc_type"], job["content_hash"],
+                                               pack_size - 1)
+            if len(jobs) > 1:
+                try:
+                    start = time.perf_counter()
+                    results = packer.extract_many([j["image_path"] for j in jobs], job["doc_type"])
+                    # One request served the whole pack; each document is charged its share
+                    latency_ms = (time.perf_counter() - start) * 1000 / len(jobs)
+                    for packed_job, (df, extracted_text, model) in zip(jobs, results):
+                        finish(packed_job, processor, df, extracted_text, latency_ms, model)
+                except Exception as e:
+                    for packed_job in jobs:
+                        queue.fail(packed_job["id"], e)
+                return
+        try:
+            extractor = processor_for(job["owner"])
+            start = time.perf_counter()
+            extract = lambda: extractor.extract_parameters(
+                job["image_path"], job["doc_type"],
+                on_progress=lambda parameters, job_id=job["id"]: queue.update_partial(job_id, parameters)
+            )
+            if service_url:
+                # The service makes the model calls; its response time drives this worker's limit
+                with limiter.slot():
+                    df, extracted_text = extract()
+            else:
+                df, extracted_text = extract()
+            finish(job, extractor, df, extracted_text, (time.perf_counter() - start) * 1000)
+        except Exception as e:
+            queue.fail(job["id"], e)
+
+    # Jobs run on threads, as many at once as the adaptive limit currently allows
+    executor = ThreadPoolExecutor(max_workers=limiter.max_limit)
+    running = set()
+    while True:
+        running = {future for future in running if not future.done()}
+        if len(running) >= limiter.limit:
+            wait(running, timeout=poll_interval, return_when=FIRST_COMPLETED)
+            continue
+        job = queue.claim()
+        if job is None:
+            time.sleep(poll_interval)
+            continue
+        running.add(executor.submit(run, job))
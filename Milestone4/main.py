@@ -1,31 +1,77 @@
 import streamlit as st
 import os
 import io
-import tempfile
 import fitz
 from PIL import Image
 import pandas as pd
-import base64
 import requests
 import cloudinary
 import cloudinary.api
 from dotenv import load_dotenv
 import random
+import time
+import uuid
 import zipfile
 from urllib3.util.retry import Retry
 from requests.adapters import HTTPAdapter
-from document_processor import DocumentProcessor
+from document_processor import DocumentProcessor, content_hash, is_remote
+from cloudinary_assets import DELIVERY_MODES, DEFAULT_DELIVERY, derived_url, resource_hash, thumbnail_url
+from thumbnails import ThumbnailCache
+from job_queue import JobQueue
+from image_quality import score_batch
+from phash_index import PerceptualIndex, file_hash
+from model_cascade import cascade_summary
+from validators import validate_frame
+from results_store import ResultsStore
+from transport import transport_stats
+from concurrency import concurrency_summary
+from single_flight import flight_summary
+from accounting import UsageLedger
+from session_memory import SessionMemory, reclaim_stale_sessions
+from analytics import UNKNOWN_ENTITY, build_series, rolling_metrics, create_trend_chart
+from doc_classifier import AUTO_DETECT
+from query_index import DocumentQueryIndex
+from batch_query import BatchQueryEngine
 from visualizations import visualize_comparative_data, process_comparative_data,create_interactive_pie_chart
 
 # Initialize session state
+if 'user_id' not in st.session_state:
+    st.session_state.user_id = uuid.uuid4().hex
+if 'memory' not in st.session_state:
+    # Images, documents and spilled results live under .cache/sessions/<user_id> instead of in memory
+    st.session_state.memory = SessionMemory(st.session_state.user_id)
+    # Directories that queued or recently cancelled jobs still read are kept
+    reclaim_stale_sessions(max_age_hours=float(os.getenv("BFSI_SESSION_TTL_HOURS", "24")),
+                           keep={st.session_state.user_id}, in_use=JobQueue().referenced_paths)
 if 'processed_dfs' not in st.session_state:
-    st.session_state.processed_dfs = []
+    st.session_state.processed_dfs = st.session_state.memory.frames
 if 'temp_image_paths' not in st.session_state:
     st.session_state.temp_image_paths = []
 if 'processing_errors' not in st.session_state:
     st.session_state.processing_errors = []
 if 'cloudinary_images' not in st.session_state:
     st.session_state.cloudinary_images = []
+if 'query_index' not in st.session_state:
+    st.session_state.query_index = DocumentQueryIndex()
+if 'pdf_sources' not in st.session_state:
+    st.session_state.pdf_sources = {}
+if 'document_images' not in st.session_state:
+    st.session_state.document_images = {}
+if 'document_hashes' not in st.session_state:
+    st.session_state.document_hashes = {}
+if 'batch_query_results' not in st.session_state:
+    st.session_state.batch_query_results = {}
+if 'page_texts' not in st.session_state:
+    st.session_state.page_texts = {}
+if 'collected_jobs' not in st.session_state:
+    st.session_state.collected_jobs = set()
+if 'classifications' not in st.session_state:
+    st.session_state.classifications = []
+if 'possible_duplicates' not in st.session_state:
+    st.session_state.possible_duplicates = []
+if 'batch_id' not in st.session_state:
+    # Resume a batch submitted from an earlier browser session
+    st.session_state.batch_id = st.query_params.get("batch")
 
 # Load environment variables and configure Cloudinary
 load_dotenv()
@@ -59,7 +105,19 @@ def download_image(url, session=None):
     except requests.exceptions.RequestException:
         return None
 
-def fetch_images(folder_name, subfolder, num_images):
+def fetch_images(folder_name, subfolder, num_images, memory, delivery="download"):
+    """
+    Sample images from a Cloudinary folder.
+
+    Args:
+    memory (SessionMemory): Session store the downloaded images are written to
+    delivery (str): "download" fetches originals, "derived" fetches a resized grayscale JPEG and
+        "url" fetches nothing, leaving the signed derived URL for the model to download
+
+    Returns:
+    list: Dicts with name, url, public_id, hash, the original size in bytes and content
+        (a BlobHandle, or None when not downloaded)
+    """
     session = create_requests_session()
     try:
         full_path = f"{folder_name}/{subfolder}"
@@ -78,57 +136,287 @@ def fetch_images(folder_name, subfolder, num_images):
         
         images = []
         for resource in all_resources[:int(num_images)]:
-            image_url = resource['secure_url']
-            image_content = download_image(image_url, session)
-            
-            if image_content:
-                images.append({
-                    'content': image_content,
-                    'url': image_url,
-                    'name': os.path.basename(resource['public_id']) + '.jpg'
-                })
+            image = {
+                'url': resource['secure_url'] if delivery == "download" else derived_url(resource['public_id']),
+                'name': os.path.basename(resource['public_id']) + '.jpg',
+                'public_id': resource['public_id'],
+                'hash': resource_hash(resource),
+                'original_bytes': resource.get('bytes') or 0,
+                'content': None,
+            }
+            if delivery != "url":
+                content = download_image(image['url'], session)
+                if not content:
+                    continue
+                image['content'] = memory.put_blob(content, '.jpg')
+            images.append(image)
         return images
     except Exception as e:
         st.error(f"Error fetching images: {str(e)}")
         return []
 
+@st.cache_resource
+def get_thumbnail_cache():
+    return ThumbnailCache()
+
+def show_gallery(images, page_size=12, cols=3):
+    """Paginated gallery: only the visible page's thumbnails are loaded and sent to the browser."""
+    thumbnails = get_thumbnail_cache()
+    pages = -(-len(images) // page_size)
+    page = st.number_input("Page", min_value=1, max_value=pages, value=1, key='gallery_page') if pages > 1 else 1
+    visible = images[(page - 1) * page_size:page * page_size]
+    for row_start in range(0, len(visible), cols):
+        for column, image_data in zip(st.columns(cols), visible[row_start:row_start + cols]):
+            with column:
+                if image_data['content']:
+                    thumbnail = thumbnails.get(image_data['hash'], image_data['content'].path)
+                else:
+                    # Never downloaded: the browser loads a thumbnail generated by Cloudinary
+                    thumbnail = thumbnail_url(image_data['public_id'])
+                st.image(thumbnail, caption=image_data['name'], use_container_width=True)
+                if st.button("View full size", key=f"full_{image_data['hash']}"):
+                    show_full_image(image_data)
+
+@st.dialog("Full Resolution", width="large")
+def show_full_image(image_data):
+    st.image(image_data['content'].path if image_data['content'] else image_data['url'], caption=image_data['name'], use_container_width=True)
+
 def create_zip_file(images):
     zip_buffer = io.BytesIO()
     with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
         for idx, image in enumerate(images):
-            zip_file.writestr(image['name'], image['content'])
+            zip_file.write(image['content'].path, image['name'])
     return zip_buffer.getvalue()
 
-def process_uploaded_files(uploaded_files, processor, selected_doc_type):
-    if not st.session_state.processed_dfs:  # Only process if not already processed
+def render_pdf_page(pdf_path, page_number):
+    page_image_path = f"{pdf_path}_page_{page_number}.png"
+    if not os.path.exists(page_image_path):
+        with fitz.open(pdf_path) as doc:
+            pix = doc[page_number].get_pixmap()
+            img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
+            img.save(page_image_path)
+    return page_image_path
+
+@st.cache_resource
+def get_job_queue():
+    job_queue = JobQueue()
+    job_queue.start_workers(int(os.getenv("BFSI_WORKERS", "2")))
+    return job_queue
+
+@st.cache_resource
+def get_results_store():
+    return ResultsStore()
+
+def load_history(history):
+    """Replace the session's results with stored extractions; no model calls are made."""
+    # Single uploads are all named "Default Document"; tell them apart by content hash
+    duplicated = history.groupby("Document")["Content Hash"].transform("nunique") > 1
+    history.loc[duplicated, "Document"] = history["Document"] + " (" + history["Content Hash"].str[:8] + ")"
+    st.session_state.processed_dfs.replace(
+        df[["Parameter", "Value", "Document", "Document Type", "Extracted At", "Entity", "Period"]].reset_index(drop=True)
+        for _, df in history.groupby(["Document", "Content Hash"], sort=False)
+    )
+    # Images whose session files were deleted cannot be re-extracted or re-queried
+    hashes = history.drop_duplicates("Document").set_index("Document")["Content Hash"]
+    image_paths = get_job_queue().image_paths(hashes.unique())
+    st.session_state.document_hashes = hashes.to_dict()
+    st.session_state.document_images = {document: image_paths[image_hash] for document, image_hash in hashes.items()
+                                        if image_hash in image_paths}
+    st.session_state.batch_query_results = {}
+
+@st.cache_resource
+def get_perceptual_index():
+    return PerceptualIndex(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "phash_index.jsonl"))
+
+def find_near_duplicates(items):
+    """Map each new image to an earlier, perceptually similar image so the pair can be flagged for review."""
+    perceptual_index = get_perceptual_index()
+    near_duplicates = {}
+    for _, image_path, image_hash, _ in items:
+        if is_remote(image_path):
+            continue
+        try:
+            perceptual_hash = file_hash(image_path)
+        except Exception:
+            continue
+        twin = perceptual_index.nearest(perceptual_hash, exclude=image_hash)
+        if twin is not None:
+            near_duplicates[image_hash] = twin
+        perceptual_index.add(perceptual_hash, image_hash)
+    return near_duplicates
+
+def reject_unreadable(items):
+    """Score candidate images and drop hopeless scans before they reach a paid model call."""
+    # Images the model fetches by URL are never downloaded here, so they cannot be scored
+    accepted = [item for item in items if is_remote(item[1])]
+    items = [item for item in items if not is_remote(item[1])]
+    if not items:
+        return accepted
+    scores = score_batch([item[1] for item in items])
+    for item, reason in zip(items, scores["rejection_reason"]):
+        if reason is None:
+            accepted.append(item)
+        else:
+            st.session_state.processing_errors.append(f"Skipped {item[0]}: {reason}")
+    return accepted
+
+def submit_batch(job_queue, items):
+    if st.session_state.get('quality_gate', True):
+        items = reject_unreadable(items)
+        if not items:
+            return
+    # Only an exact content hash match reuses a result; look-alike scans are extracted and flagged
+    near_duplicates = find_near_duplicates(items) if st.session_state.get('flag_duplicates', True) else {}
+    st.session_state.batch_id = job_queue.submit(items, owner=st.session_state.user_id, near_duplicates=near_duplicates)
+    apply_budget(st.session_state.batch_id)
+    st.query_params["batch"] = st.session_state.batch_id
+
+@st.cache_resource
+def get_usage_ledger():
+    return UsageLedger()
+
+def apply_budget(batch_id):
+    """Store the sidebar's budgets for a batch, where its workers check them before each document."""
+    get_usage_ledger().set_budget(batch_id, st.session_state.get('budget_soft'), st.session_state.get('budget_hard'))
+
+def show_usage_panel():
+    """Live spend of this session and of the running batch."""
+    ledger = get_usage_ledger()
+    usage = ledger.summary(session_id=st.session_state.user_id)
+    if usage.empty:
+        return
+    with st.expander("Usage & Cost", expanded=bool(st.session_state.batch_id)):
+        st.metric("Session cost", f"${usage['Cost ($)'].sum():.4f}",
+                  help=f"{int(usage['Calls'].sum())} model calls, "
+                       f"{int(usage['Prompt Tokens'].sum() + usage['Completion Tokens'].sum())} tokens")
+        if st.session_state.batch_id:
+            budget = ledger.budget_state(st.session_state.batch_id)
+            limit = budget["hard"] or budget["soft"]
+            st.caption(f"Current batch: ${budget['cost']:.4f}" + (f" of ${limit:.2f}" if limit else ""))
+            if limit:
+                st.progress(min(budget["cost"] / limit, 1.0))
+            if budget["state"] == "soft":
+                st.caption("Soft budget reached: remaining documents use local OCR and the smallest model")
+        if usage["Estimated Calls"].sum():
+            st.caption(f"{int(usage['Estimated Calls'].sum())} call(s) were cancelled before the API reported "
+                       "their usage; their tokens are estimated from similar calls")
+        st.dataframe(usage, hide_index=True)
+
+def process_uploaded_files(uploaded_files, job_queue, selected_doc_type):
+    if not st.session_state.processed_dfs and not st.session_state.batch_id:  # Only process if not already processed
+        items = []
         for uploaded_file in uploaded_files:
             try:
-                with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(uploaded_file.name)[1]) as temp_file:
-                    temp_file.write(uploaded_file.getvalue())
-                    temp_path = temp_file.name
+                # getbuffer() is a view of the upload, so the file is copied once, straight to disk
+                temp_path = st.session_state.memory.put_blob(
+                    uploaded_file.getbuffer(), os.path.splitext(uploaded_file.name)[1]
+                ).path
 
+                image_path = temp_path
                 if os.path.splitext(uploaded_file.name)[1].lower() == ".pdf":
-                    with fitz.open(stream=uploaded_file.getvalue(), filetype="pdf") as doc:
+                    with fitz.open(temp_path) as doc:
                         page = doc[0]
                         pix = page.get_pixmap()
                         img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
-                        temp_image_path = f"{temp_path}_page_0.png"
-                        img.save(temp_image_path)
-                        st.session_state.temp_image_paths.append(temp_image_path)
-                else:
-                    st.session_state.temp_image_paths.append(temp_path)
-
-                df, _ = processor.extract_parameters(st.session_state.temp_image_paths[-1], selected_doc_type)
+                        image_path = f"{temp_path}_page_0.png"
+                        img.save(image_path)
+                        st.session_state.page_texts[image_path] = [page.get_text() for page in doc]
+                        st.session_state.pdf_sources[image_path] = temp_path
 
-                if df is not None and all(col in df.columns for col in ["Parameter", "Value"]):
-                    df["Document"] = uploaded_file.name if len(uploaded_files) > 1 else "Default Document"
-                    st.session_state.processed_dfs.append(df)
-                else:
-                    st.session_state.processing_errors.append(f"Invalid DataFrame format for {uploaded_file.name}")
+                document = uploaded_file.name if len(uploaded_files) > 1 else "Default Document"
+                # Auto-detect jobs are classified by the background worker that extracts them
+                items.append((document, image_path, content_hash(image_path), selected_doc_type))
 
             except Exception as e:
                 st.session_state.processing_errors.append(f"Error processing {uploaded_file.name}: {str(e)}")
 
+        if items:
+            submit_batch(job_queue, items)
+
+def collect_job_results(job_queue):
+    """Move newly finished background jobs of the active batch into session state."""
+    for result in job_queue.results(st.session_state.batch_id, exclude_ids=st.session_state.collected_jobs):
+        st.session_state.collected_jobs.add(result["id"])
+        if result["classification"]:
+            st.session_state.classifications.append({
+                "Document": result["document"], "Detected Type": result["doc_type"],
+                "Confidence": result["classification"]["confidence"], "Decided By": result["classification"]["method"]
+            })
+        if result["duplicate_of"]:
+            st.session_state.possible_duplicates.append({
+                "Document": result["document"], "Looks Like": result["duplicate_of"]
+            })
+        image_path = result["image_path"]
+        if image_path not in st.session_state.temp_image_paths:
+            st.session_state.temp_image_paths.append(image_path)
+
+        df = result["df"]
+        st.session_state.query_index.add_document(
+            image_path, result["extracted_text"], df, st.session_state.page_texts.get(image_path)
+        )
+        if df is not None and all(col in df.columns for col in ["Parameter", "Value"]):
+            df["Document"] = result["document"]
+            df["Document Type"] = result["doc_type"]
+            st.session_state.processed_dfs.append(df)
+            # Cached batch answers were computed over the previous set of documents
+            st.session_state.batch_query_results = {}
+            st.session_state.document_images[result["document"]] = image_path
+            st.session_state.document_hashes[result["document"]] = result["content_hash"]
+        else:
+            st.session_state.processing_errors.append(
+                f"Invalid DataFrame format for {result['document']}: {result['error']}"
+            )
+
+def reextract_documents(job_queue, documents):
+    """Send only the given documents back to the model, keeping every other result."""
+    documents = [document for document in documents if document in st.session_state.document_images]
+    items = []
+    for df in st.session_state.processed_dfs:
+        document = df["Document"].iloc[0]
+        if document in documents:
+            items.append((document, st.session_state.document_images[document],
+                          st.session_state.document_hashes[document], df["Document Type"].iloc[0]))
+    st.session_state.processed_dfs.replace([
+        df for df in st.session_state.processed_dfs if df["Document"].iloc[0] not in documents
+    ])
+    st.session_state.batch_query_results = {}
+    st.session_state.batch_id = job_queue.submit(items, owner=st.session_state.user_id, use_cache=False)
+    apply_budget(st.session_state.batch_id)
+    st.query_params["batch"] = st.session_state.batch_id
+
+def show_batch_progress(job_queue):
+    collect_job_results(job_queue)
+    progress = job_queue.progress(st.session_state.batch_id)
+    if progress.get("paused") and progress["finished"] + progress["paused"] == progress["total"]:
+        st.warning(f"Batch paused at its hard budget with {progress['paused']} document(s) left. "
+                   "Raise the budget in the sidebar to continue.")
+        if st.button("Resume Processing"):
+            apply_budget(st.session_state.batch_id)
+            job_queue.resume(st.session_state.batch_id)
+            st.rerun()
+        return False
+    if progress["total"] and progress["finished"] < progress["total"]:
+        st.progress(
+            progress["finished"] / progress["total"],
+            text=f"Extracted {progress['finished']} of {progress['total']} documents in the background"
+        )
+        # Parameters stream in while the model is still answering
+        for document, parameters in job_queue.partial_results(st.session_state.batch_id):
+            st.caption(f"{document}: " + ", ".join(f"{parameter} = {value}" for parameter, value in parameters))
+        if st.button("Cancel Processing"):
+            job_queue.cancel(st.session_state.batch_id)
+            st.rerun()
+        return True
+    if progress.get("cancelled"):
+        st.info(f"Processing cancelled; {progress['cancelled']} document(s) were not extracted")
+    if progress["saved_calls"]:
+        st.caption(f"{progress['saved_calls']} model call(s) saved by result reuse and request coalescing")
+    flights = flight_summary()
+    if flights["calls"]:
+        st.caption(f"In-process coalescing: {flights['saved']} of {flights['calls']} extraction call(s) "
+                   "shared a concurrent identical call")
+    return False
+
 def main():
     st.set_page_config(page_title="Financial Document Analyzer", layout="wide")
 
@@ -141,60 +429,145 @@ def main():
             "Salary Slip": "salary_slips",
             "Transaction History": "transaction_history",
         }
-        selected_doc_type = st.selectbox("Select Document Type", list(document_types.keys()))
+        selected_doc_type = st.selectbox("Select Document Type", [AUTO_DETECT] + list(document_types.keys()))
 
         graph_types = ["Bar Chart", "Pie Chart"]
-        data_source = st.radio("Select Data Source", ["Fetch from Cloudinary", "Upload Files"])
+        data_source = st.radio("Select Data Source", ["Fetch from Cloudinary", "Upload Files", "Load from History"])
         selected_graph_type = st.selectbox("Select Graph Type", graph_types)
+        st.checkbox("Reject unreadable scans before extraction", value=True, key='quality_gate')
+        st.checkbox("Flag possible duplicate scans", value=True, key='flag_duplicates',
+                    help="Compares perceptual hashes with earlier uploads. Flagged documents are still extracted.")
         
         if st.button("Clear All Data"):
-            st.session_state.processed_dfs = []
             st.session_state.temp_image_paths = []
             st.session_state.processing_errors = []
             st.session_state.cloudinary_images = []
+            st.session_state.pop('gallery_page', None)
+            st.session_state.query_index = DocumentQueryIndex()
+            st.session_state.pdf_sources = {}
+            st.session_state.document_images = {}
+            st.session_state.document_hashes = {}
+            st.session_state.batch_query_results = {}
+            st.session_state.page_texts = {}
+            st.session_state.collected_jobs = set()
+            st.session_state.classifications = []
+            st.session_state.possible_duplicates = []
+            if st.session_state.batch_id:
+                get_job_queue().cancel(st.session_state.batch_id)
+            # Deletes the session's images, documents and spilled results and empties processed_dfs
+            st.session_state.memory.clear(
+                in_use=get_job_queue().referenced_paths(st.session_state.memory.directory + os.sep)
+            )
+            st.session_state.batch_id = None
+            st.query_params.clear()
             st.rerun()
 
-    st.header(f"{selected_doc_type} Analysis")
-    processor = DocumentProcessor()
+        connections = transport_stats()
+        if connections["requests"]:
+            st.caption(
+                f"API connections: {connections['connections_opened']} opened for {connections['requests']} "
+                f"requests ({connections['reuse_rate']:.0%} reused, {connections['idle_connections']} idle)"
+            )
+
+        usage = st.session_state.memory.usage()
+        st.caption(
+            f"Session memory: {usage['resident_bytes'] / 2**20:.1f} of {usage['budget_bytes'] / 2**20:.0f} MB, "
+            f"{usage['spilled_frames']} of {usage['frames']} results spilled to disk, "
+            f"{usage['disk_bytes'] / 2**20:.1f} MB of session files"
+        )
+
+        decisions = concurrency_summary(since=time.time() - 3600)
+        if not decisions.empty:
+            with st.expander("Model Concurrency"):
+                latest = decisions.groupby("pid").last()
+                st.caption(f"Adaptive limit: {int(latest['limit'].sum())} concurrent model calls across "
+                           f"{len(latest)} process(es); {len(decisions)} adjustments in the last hour")
+                st.line_chart(decisions.assign(time=pd.to_datetime(decisions["time"], unit="s"))
+                              .pivot_table(index="time", columns="pid", values="limit", aggfunc="last").ffill()
+                              .rename(columns=lambda pid: f"pid {pid}"))
+                st.dataframe(decisions["reason"].value_counts())
+
+        with st.expander("Budget per Batch"):
+            st.number_input("Soft budget ($)", min_value=0.0, value=float(os.getenv("BFSI_BUDGET_SOFT", "0")),
+                            step=0.01, format="%.2f", key='budget_soft',
+                            help="Past this, documents use local OCR and the smallest model only. 0 for no limit.")
+            st.number_input("Hard budget ($)", min_value=0.0, value=float(os.getenv("BFSI_BUDGET_HARD", "0")),
+                            step=0.01, format="%.2f", key='budget_hard',
+                            help="Past this, the batch is paused. 0 for no limit.")
+        show_usage_panel()
+
+        cascade_stats = cascade_summary()
+        if not cascade_stats.empty:
+            with st.expander("Model Cascade"):
+                st.caption("Share of documents escalated past the first stage, and savings versus always "
+                           "using the largest model.")
+                st.dataframe(cascade_stats.set_index("doc_type").T)
+
+    st.session_state.memory.touch()
+    st.header("Financial Document Analysis" if selected_doc_type == AUTO_DETECT else f"{selected_doc_type} Analysis")
+    processor = DocumentProcessor(ledger=get_usage_ledger())
+    # Questions and other interactive calls are charged to this session
+    processor.usage_context = {"session_id": st.session_state.user_id, "batch_id": st.session_state.batch_id,
+                               "purpose": "interactive"}
+    job_queue = get_job_queue()
 
     # Cloudinary Section
     if data_source == "Fetch from Cloudinary":
         num_images = st.number_input("Number of images to fetch", min_value=1, max_value=100, value=5)
+        delivery = st.selectbox("Image delivery", list(DELIVERY_MODES), format_func=DELIVERY_MODES.get,
+                                index=list(DELIVERY_MODES).index(DEFAULT_DELIVERY))
         
         if st.button("Fetch Images") and not st.session_state.cloudinary_images:
             with st.spinner("Fetching images from Cloudinary..."):
+                # Auto-detect samples a mixed batch from every document folder
                 st.session_state.cloudinary_images = fetch_images(
                     "financial_data",
-                    document_types[selected_doc_type],
-                    num_images
+                    document_types.get(selected_doc_type, ""),
+                    num_images,
+                    st.session_state.memory,
+                    delivery
                 )
                 
                 if st.session_state.cloudinary_images:
+                    items = []
                     for image_data in st.session_state.cloudinary_images:
-                        with tempfile.NamedTemporaryFile(delete=False, suffix='.jpg') as temp_file:
-                            temp_file.write(image_data['content'])
-                            st.session_state.temp_image_paths.append(temp_file.name)
-                            
-                            df, _ = processor.extract_parameters(temp_file.name, selected_doc_type)
-                            if df is not None and all(col in df.columns for col in ["Parameter", "Value"]):
-                                df["Document"] = image_data['name']
-                                st.session_state.processed_dfs.append(df) 
+                        if delivery == "url":
+                            # The model endpoint downloads the signed URL itself, including for auto-detection
+                            items.append((image_data['name'], image_data['url'], image_data['hash'], selected_doc_type))
+                            continue
+                        # Already on disk in the session directory; no temporary copy is needed
+                        image_path = image_data['content'].path
+                        items.append((image_data['name'], image_path, content_hash(image_path), selected_doc_type))
+                    submit_batch(job_queue, items)
         
         if st.session_state.cloudinary_images:
-            cols = 3
-            rows = -(-len(st.session_state.cloudinary_images) // cols)
-            for row in range(rows):
-                columns = st.columns(cols)
-                for col in range(cols):
-                    idx = row * cols + col
-                    if idx < len(st.session_state.cloudinary_images):
-                        with columns[col]:
-                            image = Image.open(io.BytesIO(st.session_state.cloudinary_images[idx]['content']))
-                            st.image(
-                                image, 
-                                caption=st.session_state.cloudinary_images[idx]['name'],
-                                use_container_width=True
-                            )
+            original = sum(image.get('original_bytes', 0) for image in st.session_state.cloudinary_images)
+            transferred = sum(len(image['content'] or b"") for image in st.session_state.cloudinary_images)
+            if original:
+                st.caption(f"Downloaded {transferred / 1e6:.2f} MB of {original / 1e6:.2f} MB stored "
+                           f"({1 - transferred / original:.0%} saved)")
+            show_gallery(st.session_state.cloudinary_images)
+
+    # History Section
+    elif data_source == "Load from History":
+        results_store = get_results_store()
+        history = results_store.summary()
+        if history.empty:
+            st.info("No extractions have been stored yet")
+        else:
+            st.dataframe(history)
+            stored_types = sorted(history["Document Type"].unique())
+            history_types = st.multiselect(
+                "Document types", stored_types,
+                default=[selected_doc_type] if selected_doc_type in stored_types else stored_types
+            )
+            first = pd.to_datetime(history["First"].min()).date()
+            last = pd.to_datetime(history["Last"].max()).date()
+            dates = st.date_input("Extracted between", value=(first, last), min_value=first, max_value=last)
+            limit = st.number_input("Most recent documents", min_value=1, max_value=100000, value=500)
+            if st.button("Load History"):
+                start, end = (dates[0], dates[-1]) if dates else (None, None)
+                load_history(results_store.load(history_types, start, end, limit))
 
     # Manual Upload Section
     else:
@@ -209,7 +582,19 @@ def main():
             uploaded_files = [uploaded_files]
             
         if uploaded_files:
-            process_uploaded_files(uploaded_files, processor, selected_doc_type)
+            process_uploaded_files(uploaded_files, job_queue, selected_doc_type)
+
+    batch_running = bool(st.session_state.batch_id) and show_batch_progress(job_queue)
+
+    if st.session_state.possible_duplicates:
+        st.warning(f"{len(st.session_state.possible_duplicates)} document(s) look like earlier scans; "
+                   "check them before relying on both")
+        with st.expander("Possible Duplicates"):
+            st.dataframe(pd.DataFrame(st.session_state.possible_duplicates), hide_index=True)
+
+    if st.session_state.classifications:
+        with st.expander("Detected Document Types"):
+            st.dataframe(pd.DataFrame(st.session_state.classifications))
 
     # Display errors if any
     for error in st.session_state.processing_errors:
@@ -222,6 +607,18 @@ def main():
         st.subheader("Extracted Parameters")
         st.dataframe(combined_df)
 
+        failures = validate_frame(combined_df)
+        if not failures.empty:
+            flagged = failures["Document"].unique().tolist()
+            st.warning(f"{len(flagged)} document(s) failed consistency checks")
+            st.dataframe(failures)
+            missing = [document for document in flagged if document not in st.session_state.document_images]
+            if missing:
+                st.caption(f"{len(missing)} flagged document(s) can't be re-extracted; their images are no longer stored")
+            if len(missing) < len(flagged) and not batch_running and st.button("Re-extract Flagged Documents"):
+                reextract_documents(job_queue, flagged)
+                st.rerun()
+
         if selected_graph_type == "Bar Chart":
             figs = visualize_comparative_data(combined_df)
             if figs:
@@ -239,6 +636,30 @@ def main():
             if pie_fig:
                 st.plotly_chart(pie_fig, use_container_width=True)
 
+        # Trends over repeated statements of the same account or employee (history only)
+        if "Entity" in combined_df.columns:
+            series = build_series(combined_df)
+            periods = series.groupby(level="Entity").size() if not series.empty else pd.Series(dtype=int)
+            tracked = periods[periods > 1].sort_values(ascending=False).index.tolist()
+            if tracked:
+                st.subheader("Trends")
+                untracked = combined_df.loc[combined_df["Entity"] == UNKNOWN_ENTITY, "Document"].nunique()
+                if untracked:
+                    st.caption(f"{untracked} document(s) without a detected account or employee are not charted")
+                trend_param = st.selectbox("Parameter", list(series.columns), key='trend_param')
+                trend_entities = st.multiselect("Accounts / employees", tracked, default=tracked[:5],
+                                                key='trend_entities')
+                window = st.slider("Rolling window (periods)", 1, 12, 3, key='trend_window')
+                rolling, delta, pct_change = rolling_metrics(series[[trend_param]], window)
+                st.plotly_chart(create_trend_chart(series, rolling, trend_param, trend_entities),
+                                use_container_width=True)
+                changes = pd.DataFrame({
+                    trend_param: series[trend_param],
+                    "Change": delta[trend_param],
+                    "Change (%)": pct_change[trend_param].round(1),
+                }).loc[trend_entities].dropna(subset=[trend_param])
+                st.dataframe(changes.groupby(level="Entity").tail(12))
+
         # Download CSV option
         csv_buffer = io.StringIO()
         combined_df.to_csv(csv_buffer, index=False)
@@ -268,29 +689,97 @@ def main():
             user_query = st.text_input("Enter your question about the document:", key='user_query')
             
             if user_query:
-                try:
-                    with open(current_image_path, "rb") as img_file:
-                        encoded_image = base64.b64encode(img_file.read()).decode("utf-8")
-                    
-                    response = processor.client.chat.completions.create(
-                        model=processor.model,
-                        messages=[
-                            {
-                                "role": "user",
-                                "content": [
-                                    {"type": "text", "text": user_query},
-                                    {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{encoded_image}"}}
-                                ]
-                            }
-                        ],
-                        max_tokens=500,
-                        temperature=0.3
+                query_index = st.session_state.query_index
+                previous = query_index.previous(current_image_path, user_query)
+                local = query_index.answer(current_image_path, user_query)
+
+                if previous is not None:
+                    st.write(previous["answer"])
+                elif local["answer"] is not None:
+                    st.write(local["answer"])
+                    st.caption(f"Answered locally from {local['source']} in {local['latency_ms']:.1f} ms")
+                    query_index.record(current_image_path, user_query, local["answer"], True, local["latency_ms"])
+                else:
+                    # Only the most relevant page of a multi-page PDF is sent to the model
+                    query_image_path = current_image_path
+                    if local["page"] is not None and current_image_path in st.session_state.pdf_sources:
+                        query_image_path = render_pdf_page(st.session_state.pdf_sources[current_image_path], local["page"])
+
+                    try:
+                        query_start = time.perf_counter()
+                        image_url = processor.image_url(query_image_path)
+
+                        response = processor.create_completion(
+                            model=processor.model,
+                            messages=[
+                                {
+                                    "role": "user",
+                                    "content": [
+                                        {"type": "text", "text": user_query},
+                                        {"type": "image_url", "image_url": {"url": image_url}}
+                                    ]
+                                }
+                            ],
+                            max_tokens=500,
+                            temperature=0.3
+                        )
+
+                        answer = response.choices[0].message.content
+                        st.write(answer)
+                        query_index.record(current_image_path, user_query, answer, False,
+                                           (time.perf_counter() - query_start) * 1000)
+
+                    except Exception as e:
+                        st.error(f"Error processing query: {e}")
+
+            stats = st.session_state.query_index.stats()
+            if stats["questions"]:
+                st.caption(
+                    f"Local answer hit rate: {stats['hit_rate']:.0%} ({stats['local_answers']}/{stats['questions']}) · "
+                    f"avg local latency {stats['local_latency_ms']:.1f} ms · "
+                    f"avg model latency {stats['model_latency_ms']:.0f} ms"
+                )
+
+        # Batch Query Section
+        if len(st.session_state.processed_dfs) > 1:
+            st.divider()
+            st.subheader("Ask a Question Across All Documents")
+            batch_query = st.text_input(
+                "e.g. which documents have Net Salary above 30000, or average Closing Balance:",
+                key='batch_query'
+            )
+
+            if batch_query:
+                if batch_query not in st.session_state.batch_query_results:
+                    engine = BatchQueryEngine(
+                        st.session_state.processed_dfs,
+                        document_images=st.session_state.document_images,
+                        processor=processor
                     )
-                    
-                    st.write(response.choices[0].message.content)
-                
-                except Exception as e:
-                    st.error(f"Error processing query: {e}")
+                    with st.spinner("Running batch query..."):
+                        st.session_state.batch_query_results[batch_query] = engine.run(batch_query)
+
+                outcome = st.session_state.batch_query_results[batch_query]
+                if outcome is None:
+                    st.warning("Could not match the question to an extracted parameter")
+                else:
+                    if isinstance(outcome["result"], pd.DataFrame):
+                        st.dataframe(outcome["result"])
+                    elif outcome["spec"]["aggregate"] == "count":
+                        st.metric(outcome["spec"]["parameter"], f"{outcome['result']:,} document(s)")
+                    else:
+                        st.metric(outcome["spec"]["parameter"], f"{outcome['result']:,.2f}")
+                    st.caption(f"Resolved from extracted data; {outcome['model_calls']} document(s) sent to the model")
+                    if outcome["unresolved"]:
+                        st.warning(f"No value found for: {', '.join(outcome['unresolved'])}")
+                    if outcome.get("failed"):
+                        st.warning(f"{len(outcome['failed'])} document(s) could not be resolved because the "
+                                   "model call failed")
+
+    # Poll the background workers until the active batch has finished
+    if batch_running:
+        time.sleep(1)
+        st.rerun()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,286 @@
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+
+import fitz
+import pandas as pd
+from PIL import Image
+
+from roi_tiling import pdf_source
+from validators import validate
+
+try:
+    import pytesseract
+except ImportError:
+    pytesseract = None
+
+DEFAULT_STATS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "cascade_stats.jsonl")
+DEFAULT_STAGES = "local,meta-llama/Llama-3.2-11B-Vision-Instruct-Turbo,meta-llama/Llama-3.2-90B-Vision-Instruct-Turbo"
+
+# USD per million tokens (input and output) on Together
+MODEL_PRICES = {
+    "meta-llama/Llama-3.2-11B-Vision-Instruct-Turbo": 0.18,
+    "meta-llama/Llama-3.2-90B-Vision-Instruct-Turbo": 1.20,
+}
+
+# Parameters each prompt asks for, with the wording documents commonly use for them
+EXPECTED_PARAMETERS = {
+    "Bank Statement": {
+        "Opening Balance": ["opening balance", "beginning balance", "balance brought forward", "previous balance"],
+        "Monthly Credits": ["total credits", "deposits", "credits", "total deposits"],
+        "Monthly Debits": ["total debits", "withdrawals", "debits", "total withdrawals"],
+        "Closing Balance": ["closing balance", "ending balance", "balance carried forward", "new balance"],
+        "Total Balance": ["total balance", "available balance", "current balance"],
+    },
+    "Cheques": {
+        "Cheque Number": ["cheque no", "cheque number", "check no", "check number"],
+        "Amount": ["amount", "rs", "₹", "$"],
+        "Date Timestamp": [],  # The model converts the date; rules cannot, so cheques always escalate
+        "Bank Account": ["a/c no", "account no", "account number"],
+        "Transaction Value": ["amount", "rs", "₹", "$"],
+    },
+    "Profit and Loss Statement": {
+        "Total Revenue": ["total revenue", "revenue", "total sales", "net sales"],
+        "Total Expenses": ["total expenses", "total expense"],
+        "Gross Profit": ["gross profit"],
+        "Net Profit": ["net profit", "net income", "net earnings"],
+        "Operating Expenses": ["operating expenses", "total operating expenses"],
+    },
+    "Salary Slip": {
+        "Basic Salary": ["basic salary", "basic pay", "basic"],
+        "Total Allowances": ["total allowances", "allowances"],
+        "Total Deductions": ["total deductions", "total ded", "deductions"],
+        "Net Salary": ["net salary", "net pay", "take home", "salary credited"],
+        "Gross Salary": ["gross salary", "gross earnings", "gross total", "gross pay"],
+    },
+    "Transaction History": {
+        "Total Number of Transactions": ["number of transactions", "total transactions"],
+        "Total Credits": ["total credits", "total deposits"],
+        "Total Debits": ["total debits", "total withdrawals"],
+        "Highest Single Transaction Amount": ["highest transaction", "largest transaction"],
+        "Average Transaction Amount": ["average transaction"],
+    },
+}
+
+NUMBER = r"(-?[\d,]+(?:\.\d+)?)"
+
+# Recent local OCR results by image path
+_ocr_cache = OrderedDict()
+_ocr_lock = threading.Lock()
+
+# Parsed stats log per path: read offset, entries so far and the summary computed from them
+_summary_cache = {}
+_summary_lock = threading.Lock()
+
+
+def document_text(image_path, ocr=True):
+    """
+    Text of a document from its PDF text layer or local OCR; empty when neither is available.
+
+    OCR results are remembered per image, so classification, the cascade's local stage and
+    the history record of one job run Tesseract at most once.
+
+    Args:
+    ocr (bool): Run local OCR when the text is not known yet; with False, only the PDF text
+        layer or an earlier OCR result is returned
+    """
+    source = pdf_source(image_path)
+    if source is not None:
+        with fitz.open(source[0]) as doc:
+            return doc[source[1]].get_text()
+    with _ocr_lock:
+        if image_path in _ocr_cache:
+            _ocr_cache.move_to_end(image_path)
+            return _ocr_cache[image_path]
+    if not ocr or pytesseract is None or str(image_path).startswith(("https://", "http://")):
+        # Remote images are read by the model endpoint; they are never downloaded here
+        return ""
+    try:
+        text = pytesseract.image_to_string(Image.open(image_path).convert("L"))
+    except Exception as e:
+        print(f"Local OCR unavailable: {e}")
+        return ""
+    with _ocr_lock:
+        _ocr_cache[image_path] = text
+        if len(_ocr_cache) > 256:
+            _ocr_cache.popitem(last=False)
+    return text
+
+
+def extract_with_rules(text, document_type):
+    """Pick the expected parameters out of document text with label patterns."""
+    lowered = text.lower()
+    parameters = []
+    for parameter, labels in EXPECTED_PARAMETERS.get(document_type, {}).items():
+        for label in labels:
+            match = re.search(r"(?<![a-z])" + re.escape(label) + r"[^\d\n-]{0,40}?" + NUMBER, lowered)
+            if match:
+                try:
+                    parameters.append([parameter, float(match.group(1).replace(",", ""))])
+                    break
+                except ValueError:
+                    continue
+    if not parameters:
+        return None
+    return pd.DataFrame(parameters, columns=["Parameter", "Value"])
+
+
+def parse_stages(spec):
+    return [stage.strip() for stage in spec.split(",") if stage.strip()]
+
+
+def configured_stages():
+    """
+    Stages set by ``BFSI_CASCADE``: none unless it is set, and the default cascade for "1" or "on".
+
+    Returns:
+    list: Stage names, empty when the cascade is off
+    """
+    spec = os.getenv("BFSI_CASCADE", "off").strip()
+    if spec.lower() in ("", "0", "off"):
+        return []
+    return parse_stages(DEFAULT_STAGES if spec.lower() in ("1", "on") else spec)
+
+
+class ModelCascade:
+    """
+    Cheap-first extraction: each stage's output is validated, and only failures move on.
+
+    Stages are "local" (PDF text layer or Tesseract plus label rules) or Together model
+    names, cheapest first. Every document's path through the cascade is appended to a
+    JSON Lines log so escalation rates and savings can be reported across worker processes.
+    """
+
+    def __init__(self, processor, stages=None, stats_path=DEFAULT_STATS_PATH):
+        self.processor = processor
+        self.stages = stages or configured_stages() or parse_stages(DEFAULT_STAGES)
+        self.stats_path = stats_path
+        self.lock = threading.Lock()
+
+    def run_stage(self, stage, image_path, document_type, on_progress=None):
+        if stage == "local":
+            text = document_text(image_path)
+            return (extract_with_rules(text, document_type), text), 0, None
+        result = self.processor.extract_with_model(image_path, document_type, stage, on_progress)
+        # Prompt plus completion tokens; estimated for streams cancelled before their usage was reported
+        tokens = getattr(self.processor.last_usage(), "total_tokens", 0) or 0
+        return result, tokens, self.processor.last_stream()
+
+    def active_stages(self):
+        """All stages, or only local rules and the cheapest model once the batch is past its soft budget."""
+        if not getattr(self.processor, "downgraded", lambda: False)():
+            return self.stages
+        models = [stage for stage in self.stages if stage != "local"]
+        cheapest = min(models, key=lambda stage: MODEL_PRICES.get(stage, 0.0)) if models else None
+        return [stage for stage in self.stages if stage in ("local", cheapest)]
+
+    def extract(self, image_path, document_type, on_progress=None):
+        attempts = []
+        best = None
+        for stage in self.active_stages():
+            start = time.perf_counter()
+            try:
+                (df, extracted_text), tokens, stream = self.run_stage(stage, image_path, document_type, on_progress)
+            except Exception as e:
+                (df, extracted_text), tokens, stream = (None, str(e)), 0, None
+            problems = validate(df, document_type)
+            attempts.append({
+                "stage": stage,
+                "latency": time.perf_counter() - start,
+                "tokens": tokens,
+                "cost": tokens * MODEL_PRICES.get(stage, 0.0) / 1e6,
+                "problems": problems,
+                "first_parameter_ms": (stream or {}).get("first_parameter_ms"),
+                "stopped_early": (stream or {}).get("stopped_early", False),
+            })
+            if best is None or (df is not None and len(problems) <= len(best[2])):
+                best = (df, extracted_text, problems, stage)
+            if not problems:
+                break
+
+        self.record(document_type, attempts)
+        self.processor.calls.model = best[3]
+        return best[0], best[1]
+
+    def record(self, document_type, attempts):
+        entry = {"time": time.time(), "doc_type": document_type, "attempts": attempts,
+                 "accepted": attempts[-1]["stage"] if not attempts[-1]["problems"] else None}
+        with self.lock:
+            os.makedirs(os.path.dirname(self.stats_path), exist_ok=True)
+            with open(self.stats_path, "a", encoding="utf-8") as stats_file:
+                stats_file.write(json.dumps(entry) + "\n")
+
+
+def cascade_summary(stats_path=DEFAULT_STATS_PATH, max_entries=10000):
+    """
+    Escalation rate and savings per document type over the last ``max_entries`` documents.
+
+    Savings compare each document with sending it straight to the last (largest) configured
+    stage, priced at that stage's observed average latency and cost.
+
+    The log is read incrementally: only lines appended since the last call are parsed, and
+    the summary is recomputed only when there are new lines or the configured stages change.
+
+    Returns:
+    pandas.DataFrame: One row per document type
+    """
+    if not os.path.exists(stats_path):
+        return pd.DataFrame()
+    stages = ",".join(configured_stages()) or DEFAULT_STAGES
+    with _summary_lock:
+        cached = _summary_cache.get(stats_path)
+        size = os.path.getsize(stats_path)
+        if cached is None or size < cached["offset"]:
+            # First read, or the log was truncated or replaced
+            cached = _summary_cache[stats_path] = {"offset": 0, "entries": deque(maxlen=max_entries),
+                                                       "stages": None, "summary": None}
+        if size > cached["offset"]:
+            with open(stats_path, "rb") as stats_file:
+                stats_file.seek(cached["offset"])
+                data = stats_file.read(size - cached["offset"])
+            # A line still being written is left for the next call
+            complete = data[:data.rfind(b"\n") + 1]
+            cached["entries"].extend(json.loads(line) for line in complete.decode("utf-8").splitlines() if line.strip())
+            if complete:
+                cached["offset"] += len(complete)
+                cached["summary"] = None
+        if cached["summary"] is None or cached["stages"] != stages:
+            cached["summary"] = summarize_entries(list(cached["entries"]), stages)
+            cached["stages"] = stages
+        return cached["summary"].copy()
+
+
+def summarize_entries(entries, stages):
+    if not entries:
+        return pd.DataFrame()
+
+    attempts = pd.DataFrame([dict(attempt, doc_type=entry["doc_type"], document=i)
+                             for i, entry in enumerate(entries) for attempt in entry["attempts"]])
+    top = attempts[attempts["stage"] == parse_stages(stages)[-1]]
+    baseline_latency = top["latency"].mean() if not top.empty else 0.0
+    baseline_cost = top["cost"].mean() if not top.empty else 0.0
+
+    for column in ("first_parameter_ms", "stopped_early"):
+        if column not in attempts:
+            attempts[column] = None  # Logs written before streaming was added
+    attempts["stopped_early"] = attempts["stopped_early"].eq(True)
+    per_document = attempts.groupby(["doc_type", "document"]).agg(
+        stages=("stage", "count"), latency=("latency", "sum"), cost=("cost", "sum"),
+        first_parameter_ms=("first_parameter_ms", "min"), stopped_early=("stopped_early", "any"))
+    per_document["accepted"] = [entries[document]["accepted"] for _, document in per_document.index]
+    summary = per_document.groupby(level="doc_type").agg(
+        documents=("stages", "count"),
+        escalation_rate=("stages", lambda stages: (stages > 1).mean()),
+        accepted_locally=("accepted", lambda accepted: (accepted == "local").mean()),
+        unresolved=("accepted", lambda accepted: accepted.isna().mean()),
+        mean_latency_s=("latency", "mean"),
+        mean_cost_usd=("cost", "mean"),
+        mean_first_parameter_ms=("first_parameter_ms", "mean"),
+        stopped_early_rate=("stopped_early", "mean"),
+    )
+    summary["latency_saved_s"] = baseline_latency - summary["mean_latency_s"]
+    summary["cost_saved_usd"] = baseline_cost - summary["mean_cost_usd"]
+    return summary.round(4).reset_index()
@@ -0,0 +1,166 @@
+import base64
+import io
+import re
+import threading
+import time
+
+import pandas as pd
+from PIL import Image, ImageDraw, ImageFont
+
+from document_processor import PROMPTS, is_remote, parse_parameters
+from validators import EXPECTED_COUNT, validate
+
+# Small, single-purpose documents that stay legible when several share one request
+PACKABLE_TYPES = ("Cheques", "Salary Slip")
+SECTION_PATTERN = re.compile(r"^\W*DOCUMENT\s+(\d+)\W*$", re.IGNORECASE | re.MULTILINE)
+
+PACK_INSTRUCTIONS = """This image contains {count} separate documents, each under a black banner labeled DOCUMENT 1 to DOCUMENT {count}.
+Treat every document on its own. For each one, write a line "### DOCUMENT <number>" followed by exactly its {expected} lines in the format below.
+
+"""
+
+
+def pack_images(image_paths, panel_width=800, banner_height=48):
+    """
+    Lay several documents out in one labeled grid image.
+
+    The Llama 3.2 vision models take one image per request, so packing is done
+    in pixel space: wide documents such as cheques are stacked, others go two per row.
+
+    Returns:
+    bytes: JPEG of the packed grid
+    """
+    panels = []
+    for path in image_paths:
+        img = Image.open(path)
+        img.draft("RGB", (panel_width, panel_width * 4))
+        img = img.convert("RGB")
+        img = img.resize((panel_width, max(1, round(img.height * panel_width / img.width))), Image.Resampling.LANCZOS)
+        panels.append(img)
+
+    aspect = sum(panel.width / panel.height for panel in panels) / len(panels)
+    columns = 1 if aspect > 1.3 else 2
+    font = ImageFont.load_default(size=banner_height * 2 // 3)
+    rows = [panels[i:i + columns] for i in range(0, len(panels), columns)]
+    row_heights = [max(panel.height for panel in row) + banner_height for row in rows]
+    grid = Image.new("RGB", (panel_width * columns, sum(row_heights)), "white")
+
+    y = 0
+    for row_index, row in enumerate(rows):
+        for column, panel in enumerate(row):
+            number = row_index * columns + column + 1
+            x = column * panel_width
+            draw = ImageDraw.Draw(grid)
+            draw.rectangle([x, y, x + panel_width - 1, y + banner_height - 1], fill="black")
+            draw.text((x + 12, y + banner_height // 6), f"DOCUMENT {number}", fill="white", font=font)
+            grid.paste(panel, (x, y + banner_height))
+        y += row_heights[row_index]
+
+    buffer = io.BytesIO()
+    grid.save(buffer, format="JPEG", quality=85)
+    return buffer.getvalue()
+
+
+def split_sections(text):
+    """Text of each "### DOCUMENT k" section of a packed response by k; None for sections that repeat."""
+    sections = {}
+    matches = list(SECTION_PATTERN.finditer(text))
+    for i, match in enumerate(matches):
+        number = int(match.group(1))
+        body = text[match.end():matches[i + 1].start() if i + 1 < len(matches) else len(text)]
+        sections[number] = None if number in sections else body.strip()
+    return sections
+
+
+def split_response(text, count):
+    """
+    Split a packed response into per-document parameter lists.
+
+    Returns:
+    list: [parameter, value] pairs per document, or None where the response is ambiguous
+        (section missing or repeated, or not exactly the expected number of lines)
+    """
+    sections = split_sections(text)
+    results = []
+    for number in range(1, count + 1):
+        parameters = parse_parameters(sections[number]) if sections.get(number) is not None else None
+        results.append(parameters if parameters is not None and len(parameters) == EXPECTED_COUNT else None)
+    return results
+
+
+class PackedExtractor:
+    """
+    Extract several same-type documents with one model call.
+
+    Documents whose section of the packed answer is ambiguous or fails validation
+    are extracted again one per call through the processor, so packing never
+    lowers result quality.
+    """
+
+    def __init__(self, processor, pack_size=4, max_tokens_per_document=120):
+        self.processor = processor
+        self.pack_size = pack_size
+        self.max_tokens_per_document = max_tokens_per_document
+        self.stats = {"requests": 0, "documents": 0, "fallbacks": 0, "tokens": 0, "seconds": 0.0}
+        # Worker threads extract packs concurrently and share these counters
+        self.lock = threading.Lock()
+
+    def count(self, **increments):
+        with self.lock:
+            for name, value in increments.items():
+                self.stats[name] += value
+
+    def extract_packed(self, image_paths, document_type):
+        encoded_image = base64.b64encode(pack_images(image_paths)).decode("utf-8")
+        prompt = PACK_INSTRUCTIONS.format(count=len(image_paths), expected=EXPECTED_COUNT) + PROMPTS[document_type]
+        start = time.perf_counter()
+        response = self.processor.create_completion(
+            model=self.processor.model,
+            messages=[
+                {
+                    "role": "user",
+                    "content": [
+                        {"type": "text", "text": prompt},
+                        {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{encoded_image}"}}
+                    ]
+                }
+            ],
+            max_tokens=self.max_tokens_per_document * len(image_paths),
+            temperature=0.0
+        )
+        self.count(requests=1, seconds=time.perf_counter() - start,
+                   tokens=getattr(getattr(response, "usage", None), "total_tokens", 0) or 0)
+        return response.choices[0].message.content.strip()
+
+    def extract_many(self, image_paths, document_type):
+        """
+        Extract a list of documents of one type.
+
+        Returns:
+        list: (DataFrame or None, extracted text, model) per image, in input order; the text of a
+            packed document is its own section of the packed response
+        """
+        results = []
+        for i in range(0, len(image_paths), self.pack_size):
+            chunk = image_paths[i:i + self.pack_size]
+            sections = [None] * len(chunk)
+            texts = {}
+            # Remote images are fetched by the model endpoint and cannot be composited here
+            if len(chunk) > 1 and document_type in PACKABLE_TYPES and not any(map(is_remote, chunk)):
+                try:
+                    text = self.extract_packed(chunk, document_type)
+                    sections = split_response(text, len(chunk))
+                    texts = split_sections(text)
+                except Exception as e:
+                    print(f"Packed extraction failed, extracting one by one: {e}")
+
+            for number, (path, parameters) in enumerate(zip(chunk, sections), start=1):
+                self.count(documents=1)
+                df = pd.DataFrame(parameters, columns=["Parameter", "Value"]) if parameters else None
+                if df is not None and not validate(df, document_type):
+                    results.append((df, texts[number], f"packed:{self.processor.model}"))
+                    continue
+                df, single_text = self.processor.extract_parameters(path, document_type)
+                self.count(fallbacks=1, tokens=getattr(self.processor.last_usage(), "total_tokens", 0) or 0)
+                results.append((df, single_text, self.processor.last_model()))
+        return results
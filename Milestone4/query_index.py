@@ -0,0 +1,169 @@
+import math
+import re
+import time
+from collections import Counter
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+STOPWORDS = {
+    "a", "an", "the", "is", "are", "was", "were", "what", "whats", "which", "who",
+    "how", "much", "many", "of", "in", "on", "for", "to", "and", "or", "this",
+    "that", "document", "statement", "me", "tell", "show", "give", "value",
+    "amount", "does", "do", "it", "its", "my", "please", "s",
+}
+# "Label: value" lines inside OCR text or a PDF text layer
+KEY_VALUE_PATTERN = re.compile(r"^\s*([A-Za-z][A-Za-z /&().-]{2,60}?)\s*[:\-]\s*([-\d,.]*\d[\d,.]*)\s*$")
+
+
+def tokenize(text):
+    return [token for token in TOKEN_PATTERN.findall(str(text).lower()) if token not in STOPWORDS]
+
+
+class BM25Index:
+    """Okapi BM25 over short text entries, each carrying an arbitrary payload."""
+
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.entries = []
+        self.document_frequency = Counter()
+        self.total_length = 0
+
+    def add(self, text, payload):
+        terms = Counter(tokenize(text))
+        self.entries.append((terms, sum(terms.values()), payload))
+        self.document_frequency.update(terms.keys())
+        self.total_length += sum(terms.values())
+
+    def search(self, query, top_k=5, where=None):
+        query_terms = tokenize(query)
+        if not query_terms or not self.entries:
+            return []
+
+        count = len(self.entries)
+        average_length = self.total_length / count or 1
+        scored = []
+        for terms, length, payload in self.entries:
+            if where is not None and not where(payload):
+                continue
+            score = 0.0
+            for term in query_terms:
+                frequency = terms.get(term, 0)
+                if not frequency:
+                    continue
+                df = self.document_frequency[term]
+                idf = math.log(1 + (count - df + 0.5) / (df + 0.5))
+                score += idf * frequency * (self.k1 + 1) / (
+                    frequency + self.k1 * (1 - self.b + self.b * length / average_length)
+                )
+            if score > 0:
+                scored.append((score, payload))
+
+        scored.sort(key=lambda item: item[0], reverse=True)
+        return scored[:top_k]
+
+
+class DocumentQueryIndex:
+    """
+    Local index over each document's extracted text, parsed parameters and page text.
+
+    Questions are answered from the index when a single labeled value matches every
+    term of its label; otherwise the best matching page is reported so that only
+    that page image needs to be sent to the vision model.
+    """
+
+    def __init__(self):
+        self.values = BM25Index()
+        self.passages = BM25Index()
+        self.documents = set()
+        self.history = {}
+        self.local_answers = 0
+        self.model_answers = 0
+        self.local_latency = []
+        self.model_latency = []
+
+    def add_document(self, doc_id, extracted_text=None, parameters_df=None, page_texts=None):
+        if doc_id in self.documents:
+            return
+        self.documents.add(doc_id)
+
+        if parameters_df is not None and not parameters_df.empty:
+            for parameter, value in zip(parameters_df["Parameter"], parameters_df["Value"]):
+                self.values.add(parameter, {"doc_id": doc_id, "label": str(parameter), "value": value,
+                                            "page": None, "source": "parameters"})
+
+        if extracted_text:
+            for line in str(extracted_text).splitlines():
+                if line.strip():
+                    self.passages.add(line, {"doc_id": doc_id, "page": None, "text": line.strip()})
+
+        for page_number, page_text in enumerate(page_texts or []):
+            if not page_text or not page_text.strip():
+                continue
+            self.passages.add(page_text, {"doc_id": doc_id, "page": page_number, "text": page_text})
+            for line in page_text.splitlines():
+                match = KEY_VALUE_PATTERN.match(line)
+                if match:
+                    self.values.add(match.group(1), {"doc_id": doc_id, "label": match.group(1).strip(),
+                                                     "value": match.group(2), "page": page_number,
+                                                     "source": "page text"})
+
+    def answer(self, doc_id, question):
+        """
+        Try to answer a question from the index.
+
+        Returns:
+        dict: ``answer`` (str or None), ``source``, ``page`` (best page to send to the
+        model when there is no local answer) and ``latency_ms``.
+        """
+        start = time.perf_counter()
+        in_document = lambda payload: payload["doc_id"] == doc_id
+        query_terms = set(tokenize(question))
+
+        answer, source, page = None, None, None
+        candidates = [
+            (score, payload) for score, payload in self.values.search(question, top_k=5, where=in_document)
+            if set(tokenize(payload["label"])) <= query_terms
+        ]
+        # Only answer locally when exactly one label is fully covered by the question
+        if candidates and (len(candidates) == 1 or candidates[0][0] > candidates[1][0]):
+            best = candidates[0][1]
+            answer = f"{best['label']}: {best['value']}"
+            source = best["source"]
+            page = best["page"]
+        else:
+            passages = self.passages.search(
+                question, top_k=1, where=lambda payload: in_document(payload) and payload["page"] is not None
+            )
+            if passages:
+                page = passages[0][1]["page"]
+
+        latency_ms = (time.perf_counter() - start) * 1000
+        return {"answer": answer, "source": source, "page": page, "latency_ms": latency_ms}
+
+    def previous(self, doc_id, question):
+        return self.history.get((doc_id, question.strip().lower()))
+
+    def record(self, doc_id, question, answer, answered_locally, latency_ms):
+        # Streamlit reruns repeat the same question; count it once and keep its answer
+        key = (doc_id, question.strip().lower())
+        if key in self.history:
+            return
+        self.history[key] = {"answer": answer, "local": answered_locally, "latency_ms": latency_ms}
+        if answered_locally:
+            self.local_answers += 1
+            self.local_latency.append(latency_ms)
+        else:
+            self.model_answers += 1
+            self.model_latency.append(latency_ms)
+
+    def stats(self):
+        total = self.local_answers + self.model_answers
+        mean = lambda values: sum(values) / len(values) if values else 0.0
+        return {
+            "questions": total,
+            "local_answers": self.local_answers,
+            "hit_rate": self.local_answers / total if total else 0.0,
+            "local_latency_ms": mean(self.local_latency),
+            "model_latency_ms": mean(self.model_latency),
+        }
+
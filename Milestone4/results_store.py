@@ -0,0 +1,152 @@
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+
+import pandas as pd
+
+from analytics import UNKNOWN_ENTITY
+
+DEFAULT_DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "results.db")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    content_hash TEXT NOT NULL,
+    document TEXT NOT NULL,
+    doc_type TEXT NOT NULL,
+    model TEXT,
+    extracted_text TEXT,
+    latency_ms REAL,
+    owner TEXT,
+    entity_key TEXT,
+    period TEXT,
+    extracted_at REAL NOT NULL,
+    extracted_on TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS parameters (
+    document_id INTEGER NOT NULL REFERENCES documents (id),
+    parameter TEXT NOT NULL,
+    value REAL,
+    value_text TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_documents_type_date ON documents (doc_type, extracted_on);
+CREATE INDEX IF NOT EXISTS idx_documents_hash ON documents (content_hash, doc_type);
+CREATE INDEX IF NOT EXISTS idx_parameters_document ON parameters (document_id);
+CREATE INDEX IF NOT EXISTS idx_parameters_name ON parameters (parameter, value);
+"""
+
+
+class ResultsStore:
+    """
+    Persistent history of every extraction, kept across sessions and restarts.
+
+    One row per extracted document with its hash, model, raw text and timing, and one
+    row per parameter so history can be filtered and aggregated in SQL without
+    re-calling the model. Re-extractions add a new version; reads use the latest.
+    """
+
+    def __init__(self, db_path=DEFAULT_DB_PATH):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(documents)")}
+            for column in ("entity_key", "period"):
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE documents ADD COLUMN {column} TEXT")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_documents_entity ON documents (entity_key, period)")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.row_factory = sqlite3.Row
+            yield conn
+        finally:
+            conn.close()
+
+    def record(self, content_hash, document, doc_type, df, extracted_text, model=None, latency_ms=None, owner=None,
+               entity_key=None, period=None):
+        """Store one extraction; ``entity_key`` and ``period`` place it on an account's timeline."""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN")
+            document_id = conn.execute(
+                "INSERT INTO documents (content_hash, document, doc_type, model, extracted_text, latency_ms, owner, "
+                "entity_key, period, extracted_at, extracted_on) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (content_hash, document, doc_type, model, extracted_text, latency_ms, owner, entity_key, period, now,
+                 time.strftime("%Y-%m-%d", time.localtime(now)))
+            ).lastrowid
+            rows = []
+            for parameter, value in df[["Parameter", "Value"]].itertuples(index=False):
+                numeric = pd.to_numeric(value, errors="coerce")
+                rows.append((document_id, str(parameter), None if pd.isna(numeric) else float(numeric), str(value)))
+            conn.executemany(
+                "INSERT INTO parameters (document_id, parameter, value, value_text) VALUES (?, ?, ?, ?)", rows
+            )
+            conn.execute("COMMIT")
+        return document_id
+
+    def load(self, doc_types=None, start=None, end=None, limit=None):
+        """
+        Latest extraction of each document, as the long DataFrame the app charts and exports.
+
+        Args:
+        doc_types (list): Document types to include; all when empty
+        start (str): First extraction date (YYYY-MM-DD), inclusive
+        end (str): Last extraction date (YYYY-MM-DD), inclusive
+        limit (int): Most recent documents to return
+
+        Returns:
+        pandas.DataFrame: Parameter, Value, Document, Document Type, Extracted At, Model, Content Hash,
+        Entity and Period columns; Period falls back to the extraction date
+        """
+        where, args = [], []
+        if doc_types:
+            where.append(f"doc_type IN ({', '.join('?' * len(doc_types))})")
+            args.extend(doc_types)
+        if start:
+            where.append("extracted_on >= ?")
+            args.append(str(start))
+        if end:
+            where.append("extracted_on <= ?")
+            args.append(str(end))
+        # Only the newest version of each (hash, type); re-extractions supersede older rows
+        latest = (
+            "SELECT MAX(id) AS id FROM documents"
+            + (f" WHERE {' AND '.join(where)}" if where else "")
+            + " GROUP BY content_hash, doc_type ORDER BY id DESC"
+            + (" LIMIT ?" if limit else "")
+        )
+        if limit:
+            args.append(int(limit))
+        query = (
+            "SELECT p.parameter AS Parameter, COALESCE(p.value, p.value_text) AS Value, d.document AS Document, "
+            "d.doc_type AS \"Document Type\", datetime(d.extracted_at, 'unixepoch', 'localtime') AS \"Extracted At\", "
+            "d.model AS Model, d.content_hash AS \"Content Hash\", "
+            f"COALESCE(d.entity_key, '{UNKNOWN_ENTITY}') AS Entity, COALESCE(d.period, d.extracted_on) AS Period "
+            f"FROM ({latest}) AS latest JOIN documents AS d ON d.id = latest.id "
+            "JOIN parameters AS p ON p.document_id = d.id ORDER BY d.id, p.rowid"
+        )
+        with self._connect() as conn:
+            return pd.read_sql_query(query, conn, params=args)
+
+    def extracted_text(self, content_hash, doc_type):
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT extracted_text FROM documents WHERE content_hash = ? AND doc_type = ? ORDER BY id DESC LIMIT 1",
+                (content_hash, doc_type)
+            ).fetchone()
+        return row["extracted_text"] if row else None
+
+    def summary(self):
+        """Extraction counts, first/last extraction date and mean latency per document type and model."""
+        with self._connect() as conn:
+            return pd.read_sql_query(
+                "SELECT doc_type AS \"Document Type\", model AS Model, COUNT(*) AS Extractions, "
+                "MIN(extracted_on) AS \"First\", MAX(extracted_on) AS \"Last\", "
+                "ROUND(AVG(latency_ms)) AS \"Mean Latency (ms)\" FROM documents GROUP BY doc_type, model",
+                conn
+            )
@@ -0,0 +1,326 @@
+import base64
+import io
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import fitz
+import numpy as np
+import pandas as pd
+from PIL import Image
+
+from document_processor import parse_parameters
+
+try:
+    import pytesseract
+except ImportError:
+    pytesseract = None
+
+NUMBER_PATTERN = re.compile(r"^[(\-$₹€£]*\d[\d,]*(\.\d+)?\)?%?$")
+# main.py renders the first page of an uploaded PDF next to it as "<pdf>_page_<n>.png"
+PAGE_IMAGE_PATTERN = re.compile(r"^(?P<pdf>.+)_page_(?P<page>\d+)\.png$")
+
+TILE_PROMPT = """This is one region of a {document_type}.
+List every labeled numeric value visible in this region, one per line, as
+Label: value
+Use the row or column heading as the label. Skip values that are cut off at the edge.
+If the region has no numeric values, answer with nothing. Do not include any other text."""
+
+
+def pdf_source(image_path):
+    """The (pdf path, page number) an image was rendered from, or None for plain images."""
+    match = PAGE_IMAGE_PATTERN.match(image_path)
+    if match and os.path.exists(match.group("pdf")):
+        return match.group("pdf"), int(match.group("page"))
+    return None
+
+
+def is_number(token):
+    return bool(NUMBER_PATTERN.match(token.strip()))
+
+
+def pdf_text(pdf_path, page_number):
+    """Text blocks and words of a PDF page as (x0, y0, x1, y1, text) in page points."""
+    with fitz.open(pdf_path) as doc:
+        page = doc[page_number]
+        blocks = [tuple(block[:5]) for block in page.get_text("blocks") if block[6] == 0]
+        words = [tuple(word[:5]) for word in page.get_text("words")]
+        return blocks, words, (page.rect.width, page.rect.height)
+
+
+def ocr_text(gray):
+    """Tesseract words and their blocks as (x0, y0, x1, y1, text) in pixels."""
+    data = pytesseract.image_to_data(gray, output_type=pytesseract.Output.DICT)
+    words, grouped = [], {}
+    for i, text in enumerate(data["text"]):
+        if not text.strip():
+            continue
+        box = (data["left"][i], data["top"][i], data["left"][i] + data["width"][i], data["top"][i] + data["height"][i])
+        words.append(box + (text,))
+        grouped.setdefault(data["block_num"][i], []).append(box + (text,))
+    blocks = [(min(w[0] for w in group), min(w[1] for w in group), max(w[2] for w in group),
+               max(w[3] for w in group), " ".join(w[4] for w in group)) for group in grouped.values()]
+    return blocks, words
+
+
+def ink_mask(gray):
+    _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    if np.count_nonzero(binary) > binary.size / 2:
+        binary = cv2.bitwise_not(binary)
+    return binary
+
+
+def layout_blocks(gray):
+    """Text blocks found by smearing ink horizontally; the text of each block is unknown (None)."""
+    binary = ink_mask(gray)
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (max(gray.shape[1] // 60, 3), max(gray.shape[0] // 200, 1)))
+    contours, _ = cv2.findContours(cv2.dilate(binary, kernel), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    blocks = []
+    for contour in contours:
+        x, y, w, h = cv2.boundingRect(contour)
+        if w * h > 100:
+            blocks.append((x, y, x + w, y + h, None))
+    return blocks
+
+
+def numeric_runs(gray, min_glyphs=3):
+    """
+    Likely numbers on a page without OCR: runs of digit-shaped glyphs.
+
+    Digits are narrow, solid and all of one height sitting on one baseline, unlike lowercase
+    words whose x-height and ascender glyphs alternate. Runs of at least ``min_glyphs`` such
+    glyphs, spaced like characters of one token, are counted as numbers.
+
+    Returns:
+    list: (x0, y0, x1, y1, None) box of each run, in pixels
+    """
+    _, _, stats, _ = cv2.connectedComponentsWithStats(ink_mask(gray), connectivity=8)
+    x, y, w, h, area = (stats[1:, column] for column in range(5))
+    glyph = (h >= 6) & (h <= max(gray.shape) / 20) & (w >= h * 0.25) & (w <= h * 0.9) & (area >= 0.2 * w * h)
+    runs = []
+    for box in sorted(zip(x[glyph], y[glyph], w[glyph], h[glyph])):
+        bx, by, bw, bh = box
+        for run in runs:
+            lx, ly, lw, lh = run[-1]
+            if (abs(bh - lh) <= 0.15 * lh and abs((by + bh) - (ly + lh)) <= 0.2 * lh
+                    and 0 <= bx - (lx + lw) <= 0.6 * lh):
+                run.append(box)
+                break
+        else:
+            runs.append([box])
+    return [(run[0][0], min(b[1] for b in run), run[-1][0] + run[-1][2], max(b[1] + b[3] for b in run), None)
+            for run in runs if len(run) >= min_glyphs]
+
+
+def intersects(box, tile):
+    return box[0] < tile[2] and box[2] > tile[0] and box[1] < tile[3] and box[3] > tile[1]
+
+
+def tile_grid(bounds, tile_size, overlap):
+    """Overlapping tile rectangles covering ``bounds`` = (x0, y0, x1, y1)."""
+    x0, y0, x1, y1 = bounds
+    step = tile_size * (1 - overlap)
+
+    def starts(start, end):
+        if end - start <= tile_size:
+            return [start]
+        count = int(np.ceil((end - start - tile_size) / step)) + 1
+        return list(np.linspace(start, end - tile_size, count))
+
+    return [(x, y, min(x + tile_size, x1), min(y + tile_size, y1)) for y in starts(y0, y1) for x in starts(x0, x1)]
+
+
+def has_numeric_table(blocks, min_numbers=4, runs=()):
+    """
+    True when a tile holds enough numbers to be worth a model call.
+
+    Blocks without text (layout analysis only) are judged by ``runs``, the digit-shaped
+    glyph runs in the tile.
+    """
+    if any(block[4] is None for block in blocks):
+        return len(runs) >= min_numbers
+    numbers = sum(is_number(token) for block in blocks for token in block[4].split())
+    return numbers >= min_numbers
+
+
+def merge_tile_results(tile_results, words, tolerance):
+    """
+    Merge per-tile parameters, dropping values read twice from the overlap between tiles.
+
+    Args:
+    tile_results (list): (tile rectangle, [[parameter, value], ...]) pairs
+    words (list): (x0, y0, x1, y1, text) words used to locate each value on the page
+    tolerance (float): Distance below which two located values are the same cell
+
+    Returns:
+    list: [parameter, value, x, y] rows; x and y are None when a value could not be located
+    """
+    merged = []
+    for tile, parameters in tile_results:
+        tile_words = [word for word in words if intersects(word, tile)]
+        for parameter, value in parameters:
+            location = None
+            if isinstance(value, float):
+                for x0, y0, x1, y1, text in tile_words:
+                    try:
+                        if abs(float(re.sub(r"[^\d.\-]", "", text)) - value) < 1e-6:
+                            location = ((x0 + x1) / 2, (y0 + y1) / 2)
+                            break
+                    except ValueError:
+                        continue
+
+            duplicate = False
+            for row in merged:
+                if row[1] != value:
+                    continue
+                if location is not None and row[2] is not None:
+                    duplicate = abs(row[2] - location[0]) <= tolerance and abs(row[3] - location[1]) <= tolerance
+                else:
+                    # Unlocated values fall back to the label, but only across overlapping tiles
+                    duplicate = row[0].lower() == parameter.lower() and intersects(row[4], tile)
+                if duplicate:
+                    break
+            if not duplicate:
+                merged.append([parameter, value, *(location or (None, None)), tile])
+    return [row[:4] for row in merged]
+
+
+class RoiExtractor:
+    """
+    Extract parameters from dense, high-resolution pages one region at a time.
+
+    Text blocks come from the PDF text layer, Tesseract or, failing both, OpenCV layout
+    analysis, where numbers are counted as runs of digit-shaped glyphs. The page is cut into overlapping tiles around those blocks; only tiles
+    holding numeric tables are sent to the vision model, in parallel, and the results
+    are merged with duplicates from the overlaps removed by position.
+    """
+
+    def __init__(self, processor, tile_size=1024, overlap=0.15, min_side=1600, min_pdf_numbers=40, pdf_zoom=3.0,
+                 max_workers=4):
+        self.processor = processor
+        self.tile_size = tile_size  # Pixels sent to the model per tile
+        self.overlap = overlap
+        self.min_side = min_side  # Images smaller than this are sent whole
+        self.min_pdf_numbers = min_pdf_numbers
+        self.pdf_zoom = pdf_zoom  # PDF tiles are re-rendered at this zoom (3.0 = 216 dpi)
+        self.max_workers = max_workers
+        self.last_stats = {}
+
+    def should_tile(self, image_path):
+        source = pdf_source(image_path)
+        if source is not None:
+            # Text-layer PDFs are rendered small; tile the ones dense with figures
+            _, words, _ = pdf_text(*source)
+            return sum(is_number(word[4]) for word in words) >= self.min_pdf_numbers
+        with Image.open(image_path) as img:
+            return max(img.size) >= self.min_side
+
+    def plan(self, image_path):
+        """
+        Lay out the tiles for a page.
+
+        Returns:
+        list: Tile rectangles holding numeric tables, in page units
+        list: Words used to locate values, in page units
+        function: Renders a tile rectangle to a PIL image
+        int: Number of tiles before dropping non-numeric ones
+        """
+        source = pdf_source(image_path)
+        if source is not None:
+            pdf_path, page_number = source
+            blocks, words, page_size = pdf_text(pdf_path, page_number)
+            runs = []
+            tile_size = self.tile_size / self.pdf_zoom
+
+            def render(tile):
+                with fitz.open(pdf_path) as doc:
+                    pix = doc[page_number].get_pixmap(matrix=fitz.Matrix(self.pdf_zoom, self.pdf_zoom),
+                                                      clip=fitz.Rect(tile))
+                    return Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
+        else:
+            gray = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
+            page_size = (gray.shape[1], gray.shape[0])
+            blocks, words, runs = [], [], []
+            if pytesseract is not None:
+                try:
+                    blocks, words = ocr_text(gray)
+                except Exception as e:
+                    print(f"Tesseract unavailable for tiling, using layout analysis: {e}")
+            if not blocks:
+                blocks = layout_blocks(gray)
+                runs = numeric_runs(gray)
+            tile_size = self.tile_size
+
+            def render(tile):
+                x0, y0, x1, y1 = (int(round(v)) for v in tile)
+                return Image.fromarray(gray[y0:y1, x0:x1])
+
+        if not blocks:
+            bounds = (0, 0) + tuple(page_size)
+        else:
+            bounds = (min(b[0] for b in blocks), min(b[1] for b in blocks),
+                      max(b[2] for b in blocks), max(b[3] for b in blocks))
+        tiles = tile_grid(bounds, tile_size, self.overlap)
+        numeric = [tile for tile in tiles if has_numeric_table([b for b in blocks if intersects(b, tile)],
+                                                              runs=[r for r in runs if intersects(r, tile)])]
+        return numeric, words, render, len(tiles)
+
+    def extract_tile(self, image, document_type, model=None):
+        buffer = io.BytesIO()
+        image.convert("RGB").save(buffer, format="JPEG", quality=90)
+        encoded_image = base64.b64encode(buffer.getvalue()).decode("utf-8")
+        response = self.processor.create_completion(
+            model=model or self.processor.model,
+            messages=[
+                {
+                    "role": "user",
+                    "content": [
+                        {"type": "text", "text": TILE_PROMPT.format(document_type=document_type)},
+                        {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{encoded_image}"}}
+                    ]
+                }
+            ],
+            max_tokens=600,
+            temperature=0.0
+        )
+        return response.choices[0].message.content.strip()
+
+    def extract(self, image_path, document_type, model=None):
+        """
+        Extract every labeled value from the numeric regions of a page.
+
+        Returns:
+        pandas.DataFrame or None: Parameter and Value columns
+        str: Model responses of all tiles, or an error message
+        """
+        try:
+            tiles, words, render, total_tiles = self.plan(image_path)
+        except Exception as e:
+            return None, f"Tiling failed: {e}"
+
+        # Rendering stays on this thread (PyMuPDF is not thread-safe); only model calls run in parallel
+        images = [render(tile) for tile in tiles]
+
+        # Tile calls are charged to the same batch as the page
+        context = getattr(self.processor.calls, "context", None)
+
+        def run(tile, image):
+            self.processor.calls.context = context
+            try:
+                return tile, self.extract_tile(image, document_type, model)
+            except Exception as e:
+                print(f"Error extracting tile {tile}: {e}")
+                return tile, ""
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            responses = list(executor.map(run, tiles, images))
+
+        tolerance = self.tile_size * self.overlap / (self.pdf_zoom if pdf_source(image_path) else 1) / 4
+        rows = merge_tile_results([(tile, parse_parameters(text)) for tile, text in responses], words, tolerance)
+        self.last_stats = {"tiles": total_tiles, "tiles_sent": len(tiles), "parameters": len(rows)}
+
+        extracted_text = "\n\n".join(text for _, text in responses if text)
+        if not rows:
+            return None, extracted_text or "No numeric regions found"
+        return pd.DataFrame([row[:2] for row in rows], columns=["Parameter", "Value"]), extracted_text
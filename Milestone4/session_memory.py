@@ -0,0 +1,245 @@
+import hashlib
+import itertools
+import mmap
+import os
+import shutil
+import time
+import weakref
+from collections.abc import MutableSequence
+
+import pandas as pd
+import pyarrow as pa
+
+DEFAULT_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "sessions")
+
+
+def directory_size(path):
+    return sum(os.path.getsize(os.path.join(parent, name))
+               for parent, _, names in os.walk(path) for name in names
+               if os.path.exists(os.path.join(parent, name)))
+
+
+def is_referenced(path, in_use):
+    """True when ``path`` is, contains or was rendered into one of the ``in_use`` paths."""
+    return any(used.startswith(path) or path.startswith(used) for used in in_use)
+
+
+def reclaim_stale_sessions(root=DEFAULT_ROOT, max_age_hours=24, keep=(), in_use=None):
+    """
+    Delete the files of sessions that have not been active for ``max_age_hours``.
+
+    Args:
+    in_use (callable): Given a session directory, the paths inside it that unfinished jobs
+        still read; directories with any such path are left alone
+
+    Returns:
+    int: Bytes reclaimed
+    """
+    if not os.path.isdir(root):
+        return 0
+    reclaimed = 0
+    cutoff = time.time() - max_age_hours * 3600
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        if name in keep or not os.path.isdir(path) or os.path.getmtime(path) >= cutoff:
+            continue
+        if in_use is not None and in_use(path + os.sep):
+            continue
+        reclaimed += directory_size(path)
+        shutil.rmtree(path, ignore_errors=True)
+    return reclaimed
+
+
+class BlobHandle:
+    """Image or document bytes kept in a session file instead of in memory."""
+
+    __slots__ = ("path", "size")
+
+    def __init__(self, path, size):
+        self.path = path
+        self.size = size
+
+    def __len__(self):
+        return self.size
+
+    def read(self):
+        with open(self.path, "rb") as blob_file:
+            return blob_file.read()
+
+    def view(self):
+        """Memory-mapped, read-only view; pages are loaded by the OS only as they are read."""
+        if not self.size:
+            return memoryview(b"")  # Empty files cannot be mapped
+        with open(self.path, "rb") as blob_file:
+            return memoryview(mmap.mmap(blob_file.fileno(), 0, access=mmap.ACCESS_READ))
+
+
+class SpilledFrames(MutableSequence):
+    """
+    List of DataFrames that keeps at most ``budget_bytes`` of them in memory.
+
+    When the resident frames exceed the budget, the least recently used ones are written to
+    Parquet and dropped from memory. Reading a spilled frame loads a transient copy from disk;
+    it is not made resident again, so iterating the whole list stays within the budget.
+    """
+
+    def __init__(self, directory, budget_bytes):
+        self.directory = directory
+        self.budget_bytes = budget_bytes
+        self.entries = []
+        self.clock = itertools.count()
+        self.ids = itertools.count()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.load(entry) for entry in self.entries[index]]
+        return self.load(self.entries[index])
+
+    def __setitem__(self, index, df):
+        self.remove_file(self.entries[index])
+        self.entries[index] = self.entry(df)
+        self.enforce()
+
+    def __delitem__(self, index):
+        for entry in self.entries[index] if isinstance(index, slice) else [self.entries[index]]:
+            self.remove_file(entry)
+        del self.entries[index]
+
+    def insert(self, index, df):
+        self.entries.insert(index, self.entry(df))
+        self.enforce()
+
+    def replace(self, frames):
+        """Swap the whole list for ``frames``, deleting the spill files of the old one."""
+        self.clear()
+        for df in frames:
+            self.entries.append(self.entry(df))
+        self.enforce()
+
+    def clear(self):
+        for entry in self.entries:
+            self.remove_file(entry)
+        self.entries = []
+
+    def entry(self, df):
+        return {"frame": df, "path": None, "bytes": int(df.memory_usage(deep=True).sum()), "used": next(self.clock)}
+
+    def load(self, entry):
+        if entry["frame"] is not None:
+            entry["used"] = next(self.clock)
+            return entry["frame"]
+        if entry["path"].endswith(".parquet"):
+            return pd.read_parquet(entry["path"])
+        return pd.read_pickle(entry["path"])
+
+    def spill(self, entry):
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"frame_{next(self.ids)}_{os.getpid()}")
+        try:
+            entry["frame"].to_parquet(f"{path}.parquet", index=False)
+            entry["path"] = f"{path}.parquet"
+        except (pa.ArrowTypeError, pa.ArrowInvalid):
+            # Parquet needs one type per column; "Value" can mix numbers and text
+            entry["frame"].to_pickle(f"{path}.pkl")
+            entry["path"] = f"{path}.pkl"
+        entry["frame"] = None
+
+    def enforce(self):
+        resident = sorted((entry for entry in self.entries if entry["frame"] is not None), key=lambda e: e["used"])
+        total = sum(entry["bytes"] for entry in resident)
+        for entry in resident:
+            if total <= self.budget_bytes:
+                break
+            self.spill(entry)
+            total -= entry["bytes"]
+
+    @staticmethod
+    def remove_file(entry):
+        if entry["path"] and os.path.exists(entry["path"]):
+            os.remove(entry["path"])
+
+    def usage(self):
+        resident = [entry for entry in self.entries if entry["frame"] is not None]
+        spilled = [entry for entry in self.entries if entry["frame"] is None]
+        return {"frames": len(self.entries), "resident_frames": len(resident),
+                "resident_bytes": sum(entry["bytes"] for entry in resident),
+                "spilled_frames": len(spilled),
+                "spilled_bytes": sum(os.path.getsize(entry["path"]) for entry in spilled
+                                     if os.path.exists(entry["path"]))}
+
+
+class SessionMemory:
+    """
+    Per-session store for the large objects a Streamlit session would otherwise hold in memory.
+
+    Image and document bytes are written once to the session's directory and passed around as
+    ``BlobHandle`` objects or file paths; extracted DataFrames live in a ``SpilledFrames`` list
+    bounded by the session budget. Everything sits under ``root/<session_id>``, so one
+    ``clear()`` reclaims it, apart from files that unfinished jobs still read. Spilled frames are also removed when the session object is garbage
+    collected; documents are kept until they expire, since background batches may still read them.
+    """
+
+    def __init__(self, session_id, budget_mb=None, root=DEFAULT_ROOT):
+        self.session_id = session_id
+        self.directory = os.path.join(root, session_id)
+        self.budget_bytes = int(float(budget_mb or os.getenv("BFSI_SESSION_MEMORY_MB", "256")) * 1024 * 1024)
+        self.frames = SpilledFrames(os.path.join(self.directory, "frames"), self.budget_bytes)
+        os.makedirs(self.directory, exist_ok=True)
+        weakref.finalize(self, shutil.rmtree, self.frames.directory, True)
+
+    def touch(self):
+        """Mark the session as active so stale-session cleanup leaves it alone."""
+        os.makedirs(self.directory, exist_ok=True)
+        os.utime(self.directory)
+
+    def put_blob(self, data, suffix=""):
+        """
+        Store bytes in the session directory.
+
+        Args:
+        data (bytes or memoryview): Content to store; it is not kept in memory afterwards
+
+        Returns:
+        BlobHandle: Handle to the file, named by content hash so repeated content is stored once
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{hashlib.sha256(data).hexdigest()[:24]}{suffix}")
+        if not os.path.exists(path):
+            with open(path, "wb") as blob_file:
+                blob_file.write(data)
+        return BlobHandle(path, len(data))
+
+    def usage(self):
+        """
+        Current memory and disk use of the session.
+
+        Returns:
+        dict: Resident and spilled frame bytes, bytes of session files on disk and the budget
+        """
+        return dict(self.frames.usage(), disk_bytes=directory_size(self.directory) if os.path.isdir(self.directory) else 0,
+                    budget_bytes=self.budget_bytes)
+
+    def clear(self, in_use=()):
+        """
+        Drop every frame and delete the session's files.
+
+        Args:
+        in_use (collection): Paths unfinished jobs may still read; those files are kept until
+            stale-session cleanup finds them unreferenced
+        """
+        self.frames.clear()
+        if not os.path.isdir(self.directory):
+            return
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if is_referenced(path, in_use):
+                continue
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                os.remove(path)
+        if not os.listdir(self.directory):
+            os.rmdir(self.directory)
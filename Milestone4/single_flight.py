@@ -0,0 +1,92 @@
+import json
+import os
+import threading
+import uuid
+from concurrent.futures import Future
+
+DEFAULT_STATS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "flights")
+
+
+class SingleFlight:
+    """
+    Collapse concurrent calls that share a key into a single execution.
+
+    The first caller for a key runs the function; callers arriving while it is still
+    running wait on the same future and receive its result (or exception).
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.calls = 0
+        self.executions = 0
+        self.id = uuid.uuid4().hex  # Names this instance's stats file; pids are reused across restarts
+
+    def do(self, key, fn, *args, **kwargs):
+        """
+        Run ``fn(*args, **kwargs)`` once per concurrent key.
+
+        Returns:
+        tuple: The function's result and whether it was shared from another caller
+        """
+        with self.lock:
+            self.calls += 1
+            future = self.pending.get(key)
+            leader = future is None
+            if leader:
+                future = self.pending[key] = Future()
+                self.executions += 1
+
+        if not leader:
+            return future.result(), True
+
+        try:
+            result = fn(*args, **kwargs)
+            future.set_result(result)
+            return result, False
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                self.pending.pop(key, None)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "calls": self.calls,
+                "executions": self.executions,
+                "saved": self.calls - self.executions,
+                "inflight": len(self.pending),
+            }
+
+    def publish(self, stats_dir=DEFAULT_STATS_DIR):
+        """Write this instance's counters where ``flight_summary`` can add them up across processes."""
+        os.makedirs(stats_dir, exist_ok=True)
+        path = os.path.join(stats_dir, f"{self.id}.json")
+        with open(f"{path}.tmp", "w", encoding="utf-8") as stats_file:
+            json.dump(self.stats(), stats_file)
+        os.replace(f"{path}.tmp", path)
+
+
+def flight_summary(stats_dir=DEFAULT_STATS_DIR):
+    """
+    Calls, executions and calls saved by coalescing, summed over every published instance.
+
+    Returns:
+    dict: Totals since the stats directory was created, including processes that have exited
+    """
+    totals = {"calls": 0, "executions": 0, "saved": 0}
+    if not os.path.isdir(stats_dir):
+        return totals
+    for name in os.listdir(stats_dir):
+        if not name.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(stats_dir, name), encoding="utf-8") as stats_file:
+                stats = json.load(stats_file)
+        except (OSError, ValueError):
+            continue
+        for key in totals:
+            totals[key] += stats.get(key, 0)
+    return totals
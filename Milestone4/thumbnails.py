@@ -0,0 +1,54 @@
+import io
+import os
+import re
+
+from PIL import Image
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "thumbnails")
+
+
+class ThumbnailCache:
+    """
+    Small WebP previews stored on disk by content hash.
+
+    Each image is decoded once, at reduced size, the first time it is shown; later reruns
+    and sessions read the few kilobytes of the cached thumbnail instead.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, width=320, quality=70):
+        self.cache_dir = cache_dir
+        self.width = width
+        self.quality = quality
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, f"{re.sub(r'[^A-Za-z0-9_.-]', '_', key)}_{self.width}.webp")
+
+    def get(self, key, image):
+        """
+        Thumbnail of an image, generated on first use.
+
+        Args:
+        key (str): Content hash identifying the image
+        image (bytes or str): Full image or its file path, only decoded when the thumbnail is not cached yet
+
+        Returns:
+        bytes: WebP thumbnail
+        """
+        path = self.path(key)
+        if os.path.exists(path):
+            with open(path, "rb") as thumbnail_file:
+                return thumbnail_file.read()
+        img = Image.open(image if isinstance(image, str) else io.BytesIO(image))
+        # JPEG decoding at a fraction of full resolution is much cheaper than a full decode
+        img.draft("RGB", (self.width, self.width * 4))
+        img = img.convert("RGB")
+        img.thumbnail((self.width, self.width * 4), Image.Resampling.LANCZOS)
+        buffer = io.BytesIO()
+        img.save(buffer, format="WEBP", quality=self.quality)
+        # Written to a temporary name first so a concurrent reader never sees a partial file
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "wb") as thumbnail_file:
+            thumbnail_file.write(buffer.getvalue())
+        os.replace(temp_path, path)
+        return buffer.getvalue()
@@ -0,0 +1,115 @@
+import numpy as np
+import pandas as pd
+
+EXPECTED_COUNT = 5  # Every extraction prompt asks for five labeled values
+
+# Canonical fields, recognised from parameter names; the first matching pattern wins
+FIELD_PATTERNS = {
+    "opening": r"opening|beginning|brought forward|previous balance",
+    "closing": r"closing|ending|carried forward|new balance",
+    "credits": r"credit|deposit",
+    "debits": r"debit|withdrawal",
+    "gross_salary": r"gross (?:salary|pay|earnings|total)",
+    "deductions": r"deduction",
+    "net_salary": r"net (?:salary|pay)|take home",
+    "revenue": r"revenue|sales",
+    "gross_profit": r"gross profit",
+    "net_profit": r"net (?:profit|income|earnings)",
+    "operating_expenses": r"operating expense",
+    "expenses": r"expense",
+}
+
+# (document type, rule name, fields, check) where check returns a boolean Series over documents
+RULES = [
+    ("Bank Statement", "opening + credits - debits = closing", ["opening", "credits", "debits", "closing"],
+     lambda w, tol: close(w.opening + w.credits - w.debits, w.closing, tol)),
+    ("Salary Slip", "gross - deductions = net", ["gross_salary", "deductions", "net_salary"],
+     lambda w, tol: close(w.gross_salary - w.deductions, w.net_salary, tol)),
+    ("Profit and Loss Statement", "revenue - expenses = net profit", ["revenue", "expenses", "net_profit"],
+     lambda w, tol: close(w.revenue - w.expenses, w.net_profit, tol)),
+    ("Profit and Loss Statement", "gross profit <= revenue", ["gross_profit", "revenue"],
+     lambda w, tol: w.gross_profit <= w.revenue * (1 + tol)),
+    ("Profit and Loss Statement", "operating expenses <= expenses", ["operating_expenses", "expenses"],
+     lambda w, tol: w.operating_expenses <= w.expenses * (1 + tol)),
+]
+
+
+def close(left, right, tolerance):
+    scale = np.maximum(np.maximum(left.abs(), right.abs()), 1.0)
+    return (left - right).abs() <= tolerance * scale
+
+
+def tag_fields(combined_df):
+    """Add a ``Field`` column naming the canonical field of each parameter (NaN when unrecognised)."""
+    names = combined_df["Parameter"].astype(str).str.lower()
+    fields = pd.Series(np.nan, index=combined_df.index, dtype=object)
+    for field, pattern in FIELD_PATTERNS.items():
+        fields = fields.where(fields.notna() | ~names.str.contains(pattern, regex=True), field)
+    return combined_df.assign(Field=fields)
+
+
+def validate_frame(combined_df, tolerance=0.01):
+    """
+    Validate every document of a combined results DataFrame at once.
+
+    Args:
+    combined_df (pandas.DataFrame): Parameter, Value, Document and Document Type columns
+    tolerance (float): Relative difference allowed by the accounting identities
+
+    Returns:
+    pandas.DataFrame: One row per failed check with Document, Document Type, Rule and Detail
+    """
+    columns = ["Document", "Document Type", "Rule", "Detail"]
+    if combined_df is None or combined_df.empty:
+        return pd.DataFrame(columns=columns)
+    df = tag_fields(combined_df)
+    df["Numeric"] = pd.to_numeric(df["Value"], errors="coerce")
+    failures = []
+
+    per_document = df.groupby("Document").agg(
+        doc_type=("Document Type", "first"), count=("Parameter", "size"),
+        non_numeric=("Numeric", lambda values: values.isna().sum()))
+    short = per_document[per_document["count"] < EXPECTED_COUNT]
+    failures.append(pd.DataFrame({
+        "Document": short.index, "Document Type": short["doc_type"], "Rule": "parameter count",
+        "Detail": "only " + short["count"].astype(str) + f" of {EXPECTED_COUNT} parameters"}))
+    text_values = per_document[per_document["non_numeric"] > 0]
+    failures.append(pd.DataFrame({
+        "Document": text_values.index, "Document Type": text_values["doc_type"], "Rule": "numeric values",
+        "Detail": text_values["non_numeric"].astype(str) + " non-numeric values"}))
+
+    wide = (df.dropna(subset=["Field", "Numeric"])
+              .groupby(["Document", "Field"])["Numeric"].first()
+              .unstack())
+    for doc_type, name, fields, check in RULES:
+        documents = per_document.index[per_document["doc_type"] == doc_type].intersection(wide.index)
+        if documents.empty or not set(fields) <= set(wide.columns):
+            continue
+        values = wide.loc[documents, fields].dropna()
+        failed = values[~check(values, tolerance)]
+        if failed.empty:
+            continue
+        detail = failed.apply(lambda row: ", ".join(f"{field}={row[field]:g}" for field in fields), axis=1)
+        failures.append(pd.DataFrame({
+            "Document": failed.index, "Document Type": doc_type, "Rule": name, "Detail": detail.values}))
+
+    return pd.concat(failures, ignore_index=True)[columns] if failures else pd.DataFrame(columns=columns)
+
+
+def validate(df, document_type, tolerance=0.01):
+    """
+    Check a single extraction.
+
+    Returns:
+    list: Problems found; empty when the extraction is acceptable
+    """
+    if df is None or df.empty:
+        return ["no parameters extracted"]
+    document = df[["Parameter", "Value"]].assign(**{"Document": "document", "Document Type": document_type})
+    failures = validate_frame(document, tolerance)
+    return [f"{rule}: {detail}" for rule, detail in zip(failures["Rule"], failures["Detail"])]
+
+
+def failing_documents(combined_df, tolerance=0.01):
+    """Documents with at least one failed check, for targeted re-extraction."""
+    return validate_frame(combined_df, tolerance)["Document"].unique().tolist()